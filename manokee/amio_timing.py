@@ -1,4 +1,5 @@
 from amio import Interface
+import numpy as np
 from manokee.timing.timing import Timing
 
 
@@ -31,3 +32,24 @@ class AmioTiming(Timing):
         return int(
             self.amio_interface.secs_to_frame(self.timing.beat_to_seconds(beats))
         )
+
+    def beat_to_seconds_array(self, beat_numbers: np.ndarray) -> np.ndarray:
+        return self.timing.beat_to_seconds_array(beat_numbers)
+
+    def seconds_to_beat_array(self, times: np.ndarray) -> np.ndarray:
+        return self.timing.seconds_to_beat_array(times)
+
+    def frames_to_seconds_array(self, frames: np.ndarray) -> np.ndarray:
+        return np.asarray(frames) / self.amio_interface.get_frame_rate()
+
+    def frames_to_beats_array(self, frames: np.ndarray) -> np.ndarray:
+        return self.timing.seconds_to_beat_array(self.frames_to_seconds_array(frames))
+
+    def seconds_to_frames_array(self, seconds: np.ndarray) -> np.ndarray:
+        # Truncated like secs_to_frame
+        return (np.asarray(seconds) * self.amio_interface.get_frame_rate()).astype(
+            np.int64
+        )
+
+    def beats_to_frames_array(self, beats: np.ndarray) -> np.ndarray:
+        return self.seconds_to_frames_array(self.timing.beat_to_seconds_array(beats))
@@ -1,8 +1,17 @@
 import amio
 import logging
+import os
+import time
+from manokee.audacity.project import AudacityProjectCache
+from manokee.capture_writer import CaptureWriter
+from manokee.decoded_audio_cache import DecodedAudioCache
+from manokee.decoding import DecodeEngine
 from manokee.global_config import read_global_config
 from manokee.input_recorder import InputFragment, InputRecorder
+from manokee.input_spill import InputSpill
 from manokee.meter import Meter
+from manokee.metrics import Metrics
+from manokee.metronome import metronome_cache_metrics
 from manokee.midi_control import ManokeeMidiMessage, MidiInputReceiver, MidiInterpreter
 from manokee.playspec_controller import PlayspecController, LoopSpec
 from manokee.revising import Reviser
@@ -30,7 +39,30 @@ class Application:
         self.auto_rewind_position = 0
         self._global_config = read_global_config()
         self.workspace = Workspace(self._global_config.get("workspace"))
-        self._input_recorder = InputRecorder(4, 2)
+        self.incremental_save = self._global_config.get("incremental-save", False)
+        self.decode_engine = DecodeEngine(
+            self._global_config.get("decode-workers"),
+            self._decoded_audio_cache(),
+            self._global_config.get("track-page-secs"),
+            self._global_config.get("track-sample-format", "float"),
+        )
+        # Audacity projects parsed when loading sessions, kept for
+        # the following loads; otherwise they're parsed on every load
+        self.audacity_projects: Optional[AudacityProjectCache] = (
+            AudacityProjectCache()
+            if self._global_config.get("keep-audacity-projects", False)
+            else None
+        )
+        self._input_recorder = InputRecorder(
+            self._global_config.get("input-keepalive-mins", 4),
+            self._global_config.get("input-keepalive-margin-mins", 2),
+            self._input_spill(),
+            self._global_config.get("input-ram-horizon-mins", 1),
+            self._capture_writer(),
+            self._global_config.get("input-ram-limit-mins", 30),
+        )
+        self.metrics = Metrics()
+        self.metrics.add_source(metronome_cache_metrics)
         self._reviser = Reviser(self._session_holder, self._input_recorder)
         self._midi_interpreter = MidiInterpreter()
         self._midi_input_receiver = MidiInputReceiver(
@@ -40,6 +72,38 @@ class Application:
         )
         self._midi_input_receiver.start()
 
+    def _input_spill(self) -> Optional[InputSpill]:
+        directory = self._global_config.get("input-spill-dir")
+        if directory is None:
+            return None
+        return InputSpill(directory)
+
+    def _capture_writer(self) -> Optional[CaptureWriter]:
+        directory = self._global_config.get("capture-dir")
+        if directory is None and self.workspace.directory is not None:
+            directory = os.path.join(self.workspace.directory, ".manokee-capture")
+        if directory is None:
+            return None
+        return CaptureWriter(directory)
+
+    def _freeze_directory(self) -> Optional[str]:
+        if not self._global_config.get("freeze-tracks", False):
+            return None
+        directory = self._global_config.get("freeze-dir")
+        if directory is None and self.workspace.directory is not None:
+            directory = os.path.join(self.workspace.directory, ".manokee-freeze")
+        return directory
+
+    def _decoded_audio_cache(self) -> Optional[DecodedAudioCache]:
+        directory = self._global_config.get("decoded-audio-cache-dir")
+        if directory is None and self.workspace.directory is not None:
+            directory = os.path.join(self.workspace.directory, ".manokee-cache")
+        if directory is None:
+            return None
+        return DecodedAudioCache(
+            directory, self._global_config.get("decoded-audio-cache-mb", 2048)
+        )
+
     @property
     def session(self) -> Session:
         return self._session_holder.session
@@ -80,7 +144,10 @@ class Application:
         self.amio_interface = amio.create_io_interface()
         await self.amio_interface.init("manokee")
         self._playspec_controller = PlayspecController(
-            self.amio_interface, self._session_holder, self._reviser
+            self.amio_interface,
+            self._session_holder,
+            self._reviser,
+            self._freeze_directory(),
         )
         self.amio_interface.input_chunk_callback = self._on_input_chunk
         self._session_holder.session = Session(self.amio_interface.get_frame_rate())
@@ -93,10 +160,10 @@ class Application:
         await self.amio_interface.close()
         self.amio_interface = None
 
-    def save_session_as(self, name: str):
+    async def save_session_as(self, name: str):
         path = self.workspace.session_file_path_for_session_name(name)
         self._session_holder.session.session_file_path = path
-        self._session_holder.session.save()
+        await self._session_holder.session.save_in_background()
         logger.info(f"Saved session as {name}")
 
     def play_stop(self):
@@ -151,6 +218,24 @@ class Application:
                 track.commit_input_fragment_if_needed(fragment)
         self._session_holder.session._notify_observers()
 
+    async def compact_tracks_if_idle(self):
+        """
+        While the transport is stopped, flatten the committed takes of one
+        track into a single buffer.
+        """
+        session = self._session_holder.session
+        if (
+            session is None
+            or self.amio_interface is None
+            or self.amio_interface.is_transport_rolling()
+        ):
+            return
+        for track in session.tracks:
+            if track.requires_compaction:
+                await track.compact()
+                session._notify_observers()
+                return
+
     def go_to_beat(self, beat: int):
         self.go_to_frame_if_possible(
             beat_number_to_frame(
@@ -212,13 +297,16 @@ class Application:
         timing = self._playspec_controller.timing
         if session is None:
             return None, None
-        absolute_beat = int(
-            timing.seconds_to_beat(self.amio_interface.frame_to_secs(frame))
+        return timing.bar_and_beat(
+            timing.seconds_to_beat(self.amio_interface.frame_to_secs(frame)),
+            session.time_signature,
         )
-        sig = session.time_signature
-        return absolute_beat // sig, absolute_beat % sig
 
     def _on_input_chunk(self, input_chunk: amio.InputAudioChunk):
+        start_time = time.perf_counter()
         self._input_recorder.append_input_chunk(input_chunk)
         self._input_recorder.remove_old_fragments(self.amio_interface)
         self._playspec_controller.on_input_chunk()
+        self.metrics.observe_max(
+            "input_max_processing_ms", (time.perf_counter() - start_time) * 1000
+        )
@@ -0,0 +1,94 @@
+from collections import namedtuple
+from concurrent.futures import Executor, ThreadPoolExecutor
+import os
+import struct
+from typing import List, Optional, Tuple
+
+from amio import AudioClip
+import numpy as np
+
+# Reads blockfiles when no executor is given to read_blockfiles
+_read_executor = ThreadPoolExecutor(thread_name_prefix="manokee-aup-read")
+
+
+class Block(namedtuple("Block", "path start frames")):
+    """
+    A blockfile of a channel of an Audacity track, holding the given
+    number of frames of the channel from the given start frame.
+    """
+
+    pass
+
+
+def _au_layout(path: str) -> Tuple[int, np.dtype]:
+    # Offset and type of the samples of an AU file
+    with open(path, "rb") as file:
+        header = file.read(24)
+    magic = header[0:4]
+    if magic == b".snd":
+        endianness = ">"
+    elif magic == b"dns.":
+        # Audacity saves its blockfiles in little-endian
+        # (at least on little-endian processors)
+        endianness = "<"
+    else:
+        raise ValueError(f"Invalid AU file: {path}")
+    header_length, _, encoding, _, channels = struct.unpack(
+        endianness + "LLLLL", header[4:24]
+    )
+    if encoding != 6:
+        raise ValueError(
+            "The only supported encoding is 6 (32-bit IEEE floating point)"
+        )
+    if channels != 1:
+        raise ValueError("Only mono AU files are supported")
+    return header_length, np.dtype(endianness + "f4")
+
+
+def _read_block(block: Block, out: np.ndarray) -> None:
+    # Runs on a worker thread. The samples are copied straight from
+    # the mapped file into the column of the clip, and NumPy doesn't hold
+    # the GIL while copying, so page faults of different blocks are
+    # served in parallel.
+    header_length, dtype = _au_layout(block.path)
+    available = (os.path.getsize(block.path) - header_length) // dtype.itemsize
+    frames = min(len(out), available)
+    if frames <= 0:
+        return
+    samples = np.memmap(block.path, dtype, "r", header_length, (frames,))
+    out[:frames] = samples
+    del samples
+
+
+def read_blockfiles(
+    channels: List[List[Block]],
+    frame_rate: float,
+    executor: Optional[Executor] = None,
+) -> AudioClip:
+    """
+    Read the blockfiles of an Audacity track into a new clip, allocated
+    once, with every blockfile copied directly into its place.
+    :param channels: Blocks of each channel of the track.
+    :param executor: Used to read the blockfiles in parallel; by default,
+    a thread pool shared by all the reads.
+    :return: The clip; frames not covered by any block are silent.
+    """
+    length = max(
+        (block.start + block.frames for blocks in channels for block in blocks),
+        default=0,
+    )
+    array = np.zeros((length, len(channels)), np.float32)
+    if executor is None:
+        executor = _read_executor
+    futures = [
+        executor.submit(
+            _read_block,
+            block,
+            array[block.start : block.start + block.frames, channel],
+        )
+        for channel, blocks in enumerate(channels)
+        for block in blocks
+    ]
+    for future in futures:
+        future.result()
+    return AudioClip(array, frame_rate)
@@ -1,9 +1,14 @@
+from concurrent.futures import Executor
 import os
-from typing import List, Optional
+import threading
+from typing import Dict, List, Optional, Tuple
 
 from amio import AudioClip
+import numpy as np
 from xml.etree.ElementTree import Element, ElementTree
 
+from manokee.audacity.blockfiles import Block, read_blockfiles
+
 
 class LabelTrack:
     def __init__(self, element: Element, ns):
@@ -28,6 +33,13 @@ class WaveBlock:
     def get_start(self):
         return self.element.attrib["start"]
 
+    def as_block(self, project):
+        return Block(
+            project.get_blockfile_path(self.get_filename()),
+            int(self.get_start()),
+            self.get_len(),
+        )
+
     def get_file_element(self):
         return self.element.find("ns:simpleblockfile", self.ns)
 
@@ -66,6 +78,9 @@ class WaveClip:
     def as_audio_clip(self):
         return AudioClip.concatenate(self.get_audio_clips())
 
+    def get_blocks(self) -> List[Block]:
+        return [block.as_block(self.project) for block in self.get_wave_blocks()]
+
 
 class WaveTrack:
     def __init__(self, element: Element, ns, project):
@@ -88,11 +103,12 @@ class WaveTrack:
             for clip in self.element.findall("ns:waveclip", self.ns)
         )
 
-    def as_audio_clip(self):
+    def get_blocks(self) -> List[Block]:
         # TODO Support offsets etc.
-        clip = next(self.get_clips()).as_audio_clip()
-        clip.frame_rate = self.get_rate()
-        return clip
+        return next(self.get_clips()).get_blocks()
+
+    def as_audio_clip(self, executor: Optional[Executor] = None):
+        return read_blockfiles([self.get_blocks()], self.get_rate(), executor)
 
 
 class AudacityProject(ElementTree):
@@ -100,6 +116,8 @@ class AudacityProject(ElementTree):
         super(AudacityProject, self).__init__()
         self.ns = {"ns": "http://audacity.sourceforge.net/xml/"}
         self.aup_file_path = os.path.join(os.path.curdir, aup_file_path)
+        # Label track name -> label positions
+        self._label_positions: Dict[Optional[str], np.ndarray] = {}
 
     def get_label_track(self, name: Optional[str] = None):
         root = self.getroot()
@@ -112,6 +130,21 @@ class AudacityProject(ElementTree):
         else:
             return next(track for track in label_tracks if track.get_name() == name)
 
+    def label_positions(self, name: Optional[str] = None) -> np.ndarray:
+        """
+        Positions of the labels of a label track (by default, the first one),
+        read once and then cached.
+        :return: Read-only array of positions in seconds.
+        """
+        positions = self._label_positions.get(name)
+        if positions is None:
+            positions = np.fromiter(
+                self.get_label_track(name).get_label_positions(), float
+            )
+            positions.flags.writeable = False
+            self._label_positions[name] = positions
+        return positions
+
     def get_wave_tracks(self):
         root = self.getroot()
         return (
@@ -134,25 +167,60 @@ class AudacityProject(ElementTree):
             name,
         )
 
-    def as_audio_clip(self, track: Optional[str]):
+    def as_audio_clip(
+        self, track: Optional[str], executor: Optional[Executor] = None
+    ) -> AudioClip:
+        """
+        Read a mono or stereo track. The blockfiles of all channels
+        are read in parallel, directly into the resulting clip.
+        :param track: Name of the track; the first one by default.
+        :param executor: See read_blockfiles.
+        """
         if track is None:
             # use the first track as the default
             track = next(self.get_wave_tracks()).get_name()
         wave_tracks = self.multichannel_track_by_name(track)
-        if len(wave_tracks) == 1:
-            return wave_tracks[0].as_audio_clip()
-        elif len(wave_tracks) == 2:
-            left = wave_tracks[0].as_audio_clip()
-            right = wave_tracks[1].as_audio_clip()
-            return AudioClip.stereo_clip_from_mono_clips(left, right)
-        else:
-            ValueError(
+        if len(wave_tracks) not in (1, 2):
+            raise ValueError(
                 f"Unsupported number of channels in Audacity track {track}: "
                 f"{len(wave_tracks)}"
             )
+        if any(t.get_rate() != wave_tracks[0].get_rate() for t in wave_tracks):
+            raise ValueError("Sample rates must match")
+        return read_blockfiles(
+            [wave_track.get_blocks() for wave_track in wave_tracks],
+            wave_tracks[0].get_rate(),
+            executor,
+        )
 
 
 def parse(source, parser=None):
     result = AudacityProject(source)
     result.parse(source, parser)
     return result
+
+
+class AudacityProjectCache:
+    """
+    Parsed Audacity projects, so that a project used by several tracks
+    and track groups of a session is parsed only once. A project is keyed
+    by its path, size and modification time, so it's parsed again when
+    the file changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Absolute path -> (size, modification time) and the parsed project
+        self._projects: Dict[str, Tuple[Tuple[int, int], AudacityProject]] = {}
+
+    def parse(self, aup_file_path: str) -> AudacityProject:
+        stat = os.stat(aup_file_path)
+        key = (stat.st_size, stat.st_mtime_ns)
+        path = os.path.abspath(aup_file_path)
+        with self._lock:
+            cached = self._projects.get(path)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            project = parse(aup_file_path)
+            self._projects[path] = (key, project)
+            return project
@@ -0,0 +1,132 @@
+import atexit
+import logging
+import os
+import queue
+import shutil
+import struct
+import tempfile
+import threading
+from typing import Dict, Optional
+
+from amio import InputAudioChunk
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+
+def _wav_data_offset(path: str) -> int:
+    with open(path, "rb") as f:
+        f.seek(12)  # RIFF header
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError(f"No data chunk in {path}")
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+            if chunk_id == b"data":
+                return f.tell()
+            f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+class CaptureWriter:
+    """
+    Spills recorded takes to disk: streams them to 32-bit float WAV files
+    in a scratch directory, on a dedicated writer thread, so that finished
+    takes can be mapped into memory instead of being kept in the input
+    ring buffer. Chunks are handed over to the writer thread through
+    a queue, without blocking the caller.
+
+    The files are scratch data, not a crash-safe copy of the takes:
+    the scratch directory is removed at exit, and nothing reads back
+    the files that a crash leaves behind.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self._directory = tempfile.mkdtemp(prefix="capture-", dir=directory)
+        atexit.register(shutil.rmtree, self._directory, True)
+        # Set when the file of a take is complete
+        self._finished: Dict[int, threading.Event] = {}
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = threading.Thread(
+            target=self._write_takes, name="manokee-capture", daemon=True
+        )
+        self._thread.start()
+
+    def path(self, take_id: int) -> str:
+        return os.path.join(self._directory, f"take-{take_id}.wav")
+
+    def write(self, take_id: int, chunk: InputAudioChunk) -> None:
+        """
+        Append a chunk to a take, starting the take if needed.
+        """
+        if take_id not in self._finished:
+            self._finished[take_id] = threading.Event()
+        self._queue.put(("write", take_id, chunk))
+
+    def finish(self, take_id: int) -> None:
+        """
+        Complete the file of a take. No more chunks can be written to it.
+        """
+        if take_id in self._finished:
+            self._queue.put(("finish", take_id, self._finished[take_id]))
+
+    def open_take(self, take_id: int) -> Optional[np.ndarray]:
+        """
+        Map the file of a finished take into memory. This doesn't wait
+        for the writer thread, which completes the file shortly after
+        finish is called.
+        :return: Read-only array of shape (frames, channels), or None if
+        the file isn't complete yet, or the take was discarded.
+        """
+        finished = self._finished.get(take_id)
+        if finished is None or not finished.is_set():
+            return None
+        path = self.path(take_id)
+        info = sf.info(path)
+        return np.memmap(
+            path,
+            np.dtype("<f4"),
+            "r",
+            _wav_data_offset(path),
+            (info.frames, info.channels),
+        )
+
+    def discard(self, take_id: int) -> None:
+        """
+        Delete the file of a take. Takes already mapped into memory
+        remain valid.
+        """
+        if take_id in self._finished:
+            del self._finished[take_id]
+            self._queue.put(("discard", take_id, None))
+
+    def _write_takes(self):
+        # Runs on the writer thread
+        files: Dict[int, sf.SoundFile] = {}
+        while True:
+            action, take_id, payload = self._queue.get()
+            try:
+                if action == "write":
+                    chunk = payload
+                    if take_id not in files:
+                        files[take_id] = sf.SoundFile(
+                            self.path(take_id),
+                            "w",
+                            int(chunk.frame_rate),
+                            chunk.channels,
+                            "FLOAT",
+                            format="WAV",
+                        )
+                    files[take_id].write(chunk.array)
+                elif action == "finish":
+                    try:
+                        files.pop(take_id).close()
+                    finally:
+                        payload.set()
+                else:
+                    if take_id in files:
+                        files.pop(take_id).close()
+                    os.remove(self.path(take_id))
+            except Exception:
+                logger.exception(f"Failed to {action} captured take {take_id}")
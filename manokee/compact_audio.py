@@ -0,0 +1,182 @@
+from amio import AudioClip
+from amio.fader import factor_to_dB
+import numpy as np
+from typing import Tuple, Union
+
+# Sample formats in which track audio can be kept in memory
+SAMPLE_FORMATS = ("float", "int16", "int24")
+
+_INT16_SCALE = 32768.0
+_INT32_SCALE = 2147483648.0
+
+# Frames converted to float at a time when metering
+_METERING_BLOCK_FRAMES = 1 << 16
+
+
+def pack_int24(array: np.ndarray) -> np.ndarray:
+    """
+    Pack 32-bit samples into 24-bit ones, dropping the least significant
+    byte.
+    :param array: int32 array of shape (frames, channels).
+    :return: uint8 array of shape (frames, channels, 3).
+    """
+    return np.ascontiguousarray(
+        array.astype("<i4").view(np.uint8).reshape(array.shape + (4,))[..., 1:]
+    )
+
+
+def unpack_int24(data: np.ndarray) -> np.ndarray:
+    """
+    The inverse of pack_int24.
+    """
+    unpacked = np.zeros(data.shape[:-1] + (4,), np.uint8)
+    unpacked[..., 1:] = data
+    return unpacked.view("<i4")[..., 0]
+
+
+class CompactAudioClip:
+    """
+    Immutable audio kept as 16-bit or packed 24-bit integer samples,
+    taking 1/2 or 3/4 of the memory of a 32-bit float AudioClip. Samples
+    are converted to float only in the blocks being read.
+    """
+
+    def __init__(self, data: np.ndarray, frame_rate: float):
+        """
+        :param data: int16 array of shape (frames, channels), or uint8
+        array of shape (frames, channels, 3) with packed 24-bit samples.
+        """
+        if data.dtype == np.int16 and data.ndim == 2:
+            self._sample_format = "int16"
+        elif data.dtype == np.uint8 and data.ndim == 3 and data.shape[2] == 3:
+            self._sample_format = "int24"
+        else:
+            raise ValueError("Unsupported sample data")
+        self._data = data
+        self.frame_rate = frame_rate
+
+    @classmethod
+    def zeros(
+        cls, length: int, channels: int, frame_rate: float, sample_format: str
+    ) -> "CompactAudioClip":
+        if sample_format == "int16":
+            return cls(np.zeros((length, channels), np.int16), frame_rate)
+        elif sample_format == "int24":
+            return cls(np.zeros((length, channels, 3), np.uint8), frame_rate)
+        raise ValueError(f"Unsupported sample format: {sample_format}")
+
+    @classmethod
+    def from_float(
+        cls, array: np.ndarray, frame_rate: float, sample_format: str
+    ) -> "CompactAudioClip":
+        if sample_format == "int16":
+            return cls(
+                np.clip(np.round(array * _INT16_SCALE), -32768, 32767).astype(np.int16),
+                frame_rate,
+            )
+        elif sample_format == "int24":
+            return cls(
+                pack_int24(
+                    np.clip(
+                        np.round(array * _INT32_SCALE), -_INT32_SCALE, _INT32_SCALE - 1
+                    ).astype(np.int32)
+                ),
+                frame_rate,
+            )
+        raise ValueError(f"Unsupported sample format: {sample_format}")
+
+    def __len__(self) -> int:
+        return self._data.shape[0]
+
+    @property
+    def channels(self) -> int:
+        return self._data.shape[1]
+
+    @property
+    def sample_format(self) -> str:
+        return self._sample_format
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._data
+
+    @property
+    def writeable(self) -> bool:
+        return False
+
+    @property
+    def memory_usage_mb(self) -> float:
+        return self._data.nbytes / 1024 / 1024
+
+    def read(self, start: int, length: int) -> np.ndarray:
+        """
+        :return: Frames from start to start + length, as a float32 array
+        of shape (frames, channels).
+        """
+        block = self._data[start : start + length]
+        if self._sample_format == "int16":
+            return block.astype(np.float32) / np.float32(_INT16_SCALE)
+        return unpack_int24(block).astype(np.float32) / np.float32(_INT32_SCALE)
+
+    def int16_data(self) -> bytes:
+        """
+        :return: The samples as 16-bit native-endian channel-interleaved
+        data, as expected by the native I/O thread.
+        """
+        if self._sample_format == "int16":
+            return self._data.tobytes()
+        return np.ascontiguousarray(self._data[..., 1:]).view("<i2").tobytes()
+
+    def create_metering_data(
+        self, start: int, length: int, metering_fps: float = 24
+    ) -> Tuple[int, np.ndarray, np.ndarray]:
+        """
+        Calculate metering data of the frames from start to start + length,
+        like AudioClip.create_metering_data does.
+        """
+        metering_window = self.frame_rate / metering_fps
+        num_fragments = max(1, int(length // metering_window))
+        # Fragment boundaries, as in np.array_split
+        fragment_length, longer_fragments = divmod(length, num_fragments)
+        bounds = np.cumsum(
+            [0]
+            + [fragment_length + 1] * longer_fragments
+            + [fragment_length] * (num_fragments - longer_fragments)
+        )
+        rms = np.empty(num_fragments, np.int8)
+        peak = np.empty(num_fragments, np.int8)
+
+        def clamp(value):
+            return min(max(-127, value), 127)
+
+        # Convert several fragments at a time
+        fragments_per_block = max(1, _METERING_BLOCK_FRAMES // (fragment_length + 1))
+        for first in range(0, num_fragments, fragments_per_block):
+            last = min(first + fragments_per_block, num_fragments)
+            block = self.read(start + bounds[first], bounds[last] - bounds[first])
+            for n in range(first, last):
+                samples = block[
+                    bounds[n] - bounds[first] : bounds[n + 1] - bounds[first]
+                ]
+                rms[n] = clamp(factor_to_dB(np.sqrt(np.mean(samples**2))))
+                peak[n] = clamp(factor_to_dB(np.max(np.abs(samples))))
+        return num_fragments, rms, peak
+
+
+TrackAudio = Union[AudioClip, CompactAudioClip]
+
+
+def sample_format_of(audio: TrackAudio) -> str:
+    if isinstance(audio, CompactAudioClip):
+        return audio.sample_format
+    return "float"
+
+
+def convert_to_sample_format(clip: AudioClip, sample_format: str) -> TrackAudio:
+    """
+    :return: The clip itself for the float sample format, or a compact copy
+    of it otherwise.
+    """
+    if sample_format == "float":
+        return clip
+    return CompactAudioClip.from_float(clip.array, clip.frame_rate, sample_format)
@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from amio import AudioClip
+import numpy as np
+
+from manokee.compact_audio import CompactAudioClip, TrackAudio
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()[:16]
+
+
+class DecodedAudioCache:
+    """
+    A directory of raw decoded audio, so that audio files which haven't
+    changed since they were last decoded don't need to be decoded again.
+
+    Entries are NumPy .npy files, memory-mapped (copy-on-write) when loaded.
+    An entry is keyed by the path, size and modification time of the file
+    it was decoded from, and optionally by a variant, which tells apart
+    different audio read from the same file. Least recently used entries
+    are evicted when the total size of the cache exceeds the budget.
+    """
+
+    def __init__(self, directory: str, budget_mb: float = 2048):
+        self._directory = directory
+        self._budget_bytes = int(budget_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Maps the path digest to the name of the only entry for that path
+        self._entries: Dict[str, str] = {}
+        for name in os.listdir(directory):
+            if name.endswith(".npy") and name.count("-") == 2:
+                self._entries[name.split("-")[0]] = name
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    @staticmethod
+    def _entry_name_prefix(
+        source_path: str, variant: str, stat: Optional[os.stat_result] = None
+    ) -> Optional[str]:
+        if stat is None:
+            try:
+                stat = os.stat(source_path)
+            except FileNotFoundError:
+                return None
+        source = os.path.abspath(source_path)
+        path_digest = _digest(f"{source}\n{variant}" if variant else source)
+        stat_digest = _digest(f"{stat.st_size}:{stat.st_mtime_ns}")
+        return f"{path_digest}-{stat_digest}"
+
+    def load(self, source_path: str, variant: str = "") -> Optional[TrackAudio]:
+        """
+        Get the decoded audio of a file, if it is in the cache.
+        :param source_path: Path to the audio file that was decoded.
+        :param variant: E.g. the name of a track, if the file has many.
+        :return: A non-writeable AudioClip (or a CompactAudioClip, if
+        integer samples were stored) backed by a memory-mapped file,
+        or None if there is no up-to-date entry for this file.
+        """
+        prefix = self._entry_name_prefix(source_path, variant)
+        if prefix is None:
+            return None
+        with self._lock:
+            name = self._entries.get(prefix.split("-")[0])
+        if name is None or not name.startswith(prefix + "-"):
+            return None
+        path = os.path.join(self._directory, name)
+        try:
+            array = np.load(path, mmap_mode="c")
+        except (FileNotFoundError, ValueError):
+            logger.warning(f"Ignoring unreadable decoded audio cache entry {path}")
+            return None
+        os.utime(path)  # mark as recently used
+        frame_rate = float(name[: -len(".npy")].split("-")[2])
+        if not np.issubdtype(array.dtype, np.floating):
+            return CompactAudioClip(array, frame_rate)
+        clip = AudioClip(array, frame_rate)
+        clip.writeable = False
+        return clip
+
+    def store(
+        self,
+        source_path: str,
+        clip: TrackAudio,
+        variant: str = "",
+        source_stat: Optional[os.stat_result] = None,
+    ) -> None:
+        """
+        Store decoded audio of a file, replacing any older entry for that
+        file, and evict least recently used entries if over the budget.
+        Can be called from any thread.
+        :param source_stat: os.stat() of the file taken before decoding it,
+        so that audio decoded from a file that has changed since isn't
+        stored as the audio of the new version. By default, the file
+        is checked when storing.
+        """
+        prefix = self._entry_name_prefix(source_path, variant, source_stat)
+        if prefix is None:
+            return
+        name = f"{prefix}-{clip.frame_rate:g}.npy"
+        path = os.path.join(self._directory, name)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, clip.array if isinstance(clip, AudioClip) else clip.data)
+        os.replace(temp_path, path)
+        with self._lock:
+            old_name = self._entries.get(prefix.split("-")[0])
+            self._entries[prefix.split("-")[0]] = name
+            if old_name is not None and old_name != name:
+                self._remove(old_name)
+            self._evict()
+
+    def _remove(self, name: str) -> None:
+        try:
+            os.remove(os.path.join(self._directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self) -> None:
+        stats = {}
+        for name in self._entries.values():
+            try:
+                stats[name] = os.stat(os.path.join(self._directory, name))
+            except FileNotFoundError:
+                pass
+        total = sum(stat.st_size for stat in stats.values())
+        for name in sorted(stats, key=lambda name: stats[name].st_mtime):
+            if total <= self._budget_bytes:
+                break
+            logger.info(f"Evicting decoded audio cache entry {name}")
+            self._remove(name)
+            del self._entries[name.split("-")[0]]
+            total -= stats[name].st_size
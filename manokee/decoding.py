@@ -0,0 +1,188 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+from typing import Callable, Optional
+
+from amio import AudioClip
+import numpy as np
+import soundfile as sf
+
+from manokee.audacity.project import AudacityProject
+from manokee.compact_audio import (
+    SAMPLE_FORMATS,
+    CompactAudioClip,
+    TrackAudio,
+    pack_int24,
+    sample_format_of,
+)
+from manokee.decoded_audio_cache import DecodedAudioCache
+from manokee.track_pager import TrackPager
+
+ProgressCallback = Callable[[float], None]
+
+
+def _decode_block(filename: str, out: np.ndarray, start: int) -> int:
+    # Runs on a worker thread. libsndfile doesn't hold the GIL while
+    # decoding, so blocks decoded on different threads run in parallel.
+    with sf.SoundFile(filename) as f:
+        f.seek(start)
+        if out.dtype == np.uint8:
+            # Packed 24-bit samples
+            frames = f.read(len(out), dtype="int32", always_2d=True)
+            out[: len(frames)] = pack_int24(frames)
+            return len(frames)
+        return len(f.read(out=out))
+
+
+class DecodeEngine:
+    """
+    Decodes audio files on a pool of worker threads, directly into
+    preallocated clips. Long files are split into blocks which are
+    decoded independently, so that a single long track also makes use
+    of all the cores.
+
+    If a DecodedAudioCache is given, files that have already been decoded
+    are memory-mapped from the cache instead, and newly decoded files
+    are stored in the cache in the background.
+
+    If page_secs is set, tracks are not decoded as a whole, but opened
+    for paged reading with open_pager instead.
+
+    If sample_format is "int16" or "int24", audio is decoded into
+    CompactAudioClips with samples in that format, instead of AudioClips
+    with float samples.
+    """
+
+    block_secs = 30
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        cache: Optional[DecodedAudioCache] = None,
+        page_secs: Optional[float] = None,
+        sample_format: str = "float",
+    ):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unsupported sample format: {sample_format}")
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or os.cpu_count(),
+            thread_name_prefix="manokee-decode",
+        )
+        self._cache = cache
+        self.page_secs = page_secs
+        self.sample_format = sample_format
+
+    def open_pager(self, filename: str) -> Optional[TrackPager]:
+        """
+        Open an audio file for lazy, paged reading instead of decoding
+        it as a whole. Only possible if page_secs is set.
+        :return: A TrackPager reading pages on this engine's workers,
+        or None if the file doesn't exist or is empty.
+        """
+        assert self.page_secs is not None
+        if not os.path.isfile(filename) or os.path.getsize(filename) == 0:
+            return None
+        return TrackPager(filename, self.page_secs, self._executor)
+
+    async def decode(
+        self, filename: str, progress_callback: ProgressCallback
+    ) -> Optional[TrackAudio]:
+        """
+        Decode an audio file into a new clip.
+        :param filename: Path to the audio file.
+        :param progress_callback: Called on the event loop thread with
+        the percentage of the file decoded so far.
+        :return: The decoded clip (not writeable), or None if the file
+        doesn't exist or is empty.
+        """
+        if not os.path.isfile(filename):
+            return None
+        # Taken before decoding, in case the file changes in the meantime
+        stat = os.stat(filename)
+        if stat.st_size == 0:
+            return None
+        if self._cache is not None:
+            cached = self._cache.load(filename)
+            if cached is not None and sample_format_of(cached) == self.sample_format:
+                progress_callback(100)
+                return cached
+        info = sf.info(filename)
+        clip: TrackAudio
+        if self.sample_format == "float":
+            clip = AudioClip.zeros(info.frames, info.channels, info.samplerate)
+            out = clip.array
+        else:
+            clip = CompactAudioClip.zeros(
+                info.frames, info.channels, info.samplerate, self.sample_format
+            )
+            out = clip.data
+        blocksize = int(self.block_secs * info.samplerate)
+        loop = asyncio.get_running_loop()
+        blocks = [
+            loop.run_in_executor(
+                self._executor,
+                _decode_block,
+                filename,
+                out[start : start + blocksize],
+                start,
+            )
+            for start in range(0, info.frames, blocksize)
+        ]
+        decoded_so_far = 0
+        for block in asyncio.as_completed(blocks):
+            decoded_so_far += await block
+            progress_callback(100 * decoded_so_far / info.frames)
+        if isinstance(clip, AudioClip):
+            clip.writeable = False
+        if self._cache is not None:
+            loop.run_in_executor(
+                self._executor, self._cache.store, filename, clip, "", stat
+            )
+        return clip
+
+    async def import_audacity_track(
+        self,
+        project: AudacityProject,
+        track: Optional[str],
+        progress_callback: ProgressCallback,
+    ) -> AudioClip:
+        """
+        Read a track of an Audacity project from its blockfiles, on this
+        engine's workers. If a DecodedAudioCache is given, the track is
+        stored in the cache in the background, and later imports of the
+        track map the cached copy instead, as long as the .aup file
+        hasn't changed since.
+        :param track: Name of the track; the first one by default.
+        :return: The track audio (not writeable).
+        """
+        aup_file_path = project.aup_file_path
+        variant = f"audacity-track:{track or ''}"
+        # Taken before reading the blockfiles, in case the project changes
+        stat = os.stat(aup_file_path)
+        if self._cache is not None:
+            cached = self._cache.load(aup_file_path, variant)
+            if isinstance(cached, AudioClip):
+                progress_callback(100)
+                return cached
+        loop = asyncio.get_running_loop()
+        # Blockfiles are read on the workers, so wait for them elsewhere
+        clip = await loop.run_in_executor(
+            None, project.as_audio_clip, track, self._executor
+        )
+        clip.writeable = False
+        progress_callback(100)
+        if self._cache is not None:
+            loop.run_in_executor(
+                self._executor, self._cache.store, aup_file_path, clip, variant, stat
+            )
+        return clip
+
+
+_default_engine: Optional[DecodeEngine] = None
+
+
+def default_decode_engine() -> DecodeEngine:
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = DecodeEngine()
+    return _default_engine
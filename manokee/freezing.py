@@ -0,0 +1,184 @@
+import asyncio
+import atexit
+from collections import namedtuple
+from concurrent.futures import Executor
+from functools import partial
+import logging
+import os
+import shutil
+import tempfile
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from amio import AudioClip
+import numpy as np
+
+from manokee.track_segments import Segment, flatten
+
+logger = logging.getLogger(__name__)
+
+# Segments, channels and gains of a track
+StemSource = Tuple[List[Segment], int, Tuple[float, float]]
+
+
+def render_stem(
+    sources: List[StemSource], frame_rate: float, path: str, block_secs: float = 10
+) -> AudioClip:
+    """
+    Mix tracks into a stereo file of 32-bit float samples, block by block.
+    :return: The stem, mapped into memory from the file.
+    """
+    length = max(
+        (segment.end for segments, _, _ in sources for segment in segments),
+        default=0,
+    )
+    shape = (max(1, length), 2)
+    array = np.memmap(path, np.float32, "w+", shape=shape)
+    block_frames = int(block_secs * frame_rate)
+    for start in range(0, length, block_frames):
+        end = min(start + block_frames, length)
+        block = array[start:end]
+        for segments, channels, (gain_l, gain_r) in sources:
+            audio = flatten(segments, channels, frame_rate, start, end).array
+            block[:, 0] += audio[:, 0] * gain_l
+            block[:, 1] += audio[:, -1] * gain_r
+    array.flush()
+    del array
+    return AudioClip(np.memmap(path, np.float32, "r", shape=shape), frame_rate)
+
+
+class _Stem(namedtuple("_Stem", "key clip path sources")):
+    pass
+
+
+class _PendingStem(namedtuple("_PendingStem", "key handle")):
+    pass
+
+
+class TrackFreezer:
+    """
+    Premixed stereo stems of the static tracks of track groups ("frozen"
+    tracks), which are played as a single playspec entry instead of one
+    entry per track. A stem is rendered on an executor once its tracks
+    have stayed unchanged for delay_secs, and it's stored in a scratch
+    directory and mapped into memory. The scratch directory is removed
+    at exit.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        on_stem_ready: Callable[[], None],
+        delay_secs: float = 2,
+        executor: Optional[Executor] = None,
+    ):
+        """
+        :param on_stem_ready: Called (on the event loop) when a stem
+        requested with stem() becomes ready.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory = tempfile.mkdtemp(prefix="freeze-", dir=directory)
+        atexit.register(shutil.rmtree, self._directory, True)
+        self._on_stem_ready = on_stem_ready
+        self._delay_secs = delay_secs
+        self._executor = executor
+        self._next_stem_id = 0
+        # Track group name -> stem
+        self._stems: Dict[str, _Stem] = {}
+        self._pending: Dict[str, _PendingStem] = {}
+
+    def stem(
+        self,
+        group_name: str,
+        key: Hashable,
+        sources: List[StemSource],
+        frame_rate: float,
+    ) -> Optional[AudioClip]:
+        """
+        :param key: Identifies the state of the tracks; the stem is rendered
+        again when it changes.
+        :param sources: The tracks to mix.
+        :return: The stem of the tracks, or None if it's not ready yet.
+        Then it's rendered in the background.
+        """
+        stem = self._stems.get(group_name)
+        if stem is not None and stem.key == key:
+            return stem.clip
+        self._discard_stem(group_name)
+        pending = self._pending.get(group_name)
+        if pending is None or pending.key != key:
+            self._cancel_pending(group_name)
+            handle = asyncio.get_running_loop().call_later(
+                self._delay_secs,
+                self._render,
+                group_name,
+                key,
+                sources,
+                frame_rate,
+            )
+            self._pending[group_name] = _PendingStem(key, handle)
+        return None
+
+    def forget(self, group_name: str) -> None:
+        """
+        Drop the stem of a track group, which no longer has tracks to freeze.
+        """
+        self._cancel_pending(group_name)
+        self._discard_stem(group_name)
+
+    def clear(self) -> None:
+        for group_name in list(self._pending) + list(self._stems):
+            self.forget(group_name)
+
+    def _discard_stem(self, group_name: str):
+        stem = self._stems.pop(group_name, None)
+        if stem is not None:
+            # The mapping remains valid while the clip is in use
+            os.remove(stem.path)
+
+    def _cancel_pending(self, group_name: str):
+        pending = self._pending.pop(group_name, None)
+        if pending is not None:
+            pending.handle.cancel()
+
+    def _render(
+        self,
+        group_name: str,
+        key: Hashable,
+        sources: List[StemSource],
+        frame_rate: float,
+    ):
+        path = os.path.join(self._directory, f"stem-{self._next_stem_id}.f32")
+        self._next_stem_id += 1
+        logger.info(f"Freezing {len(sources)} tracks of group '{group_name}'")
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, render_stem, sources, frame_rate, path
+        )
+        self._pending[group_name] = _PendingStem(key, future)
+        future.add_done_callback(
+            partial(self._rendered, group_name, key, sources, path)
+        )
+
+    def _rendered(
+        self,
+        group_name: str,
+        key: Hashable,
+        sources: List[StemSource],
+        path: str,
+        future: "asyncio.Future[AudioClip]",
+    ):
+        pending = self._pending.get(group_name)
+        if future.cancelled() or pending is None or pending.key != key:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        del self._pending[group_name]
+        try:
+            clip = future.result()
+        except Exception:
+            logger.exception(f"Failed to freeze tracks of group '{group_name}'")
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        # Keeping the sources keeps alive the clips identified in the key
+        self._stems[group_name] = _Stem(key, clip, path, sources)
+        self._on_stem_ready()
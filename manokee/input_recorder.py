@@ -1,22 +1,204 @@
 from amio import AudioClip, InputAudioChunk, Interface
 from collections import deque
+from datetime import datetime, timedelta
 import itertools
-from typing import Optional, List
+import logging
+import numpy as np
+from typing import Deque, Dict, Optional, List
 
+from manokee.capture_writer import CaptureWriter
+from manokee.input_spill import InputSpill
 from manokee.meter import Meter
 from manokee.observable import ObservableMixin
 from manokee.time_formatting import format_frame
 from manokee.transport_state import TransportState
 
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """
+    Preallocated buffer of input audio. Frames are addressed by their
+    index in the stream of all the frames ever written, and only the last
+    capacity frames are available. The buffer is allocated on the first
+    write, and grows only when frames that have to be kept would be
+    overwritten (e.g., when recording for longer than the capacity).
+
+    If an InputSpill is given, the buffer never grows. Instead, all the
+    frames are also stored in the spill, from which the frames older than
+    the buffer capacity are read back. Otherwise, the buffer grows up to
+    max_capacity_secs (if given), and then the oldest frames are
+    overwritten even if they were to be kept.
+    """
+
+    def __init__(
+        self,
+        capacity_secs: float,
+        spill: Optional[InputSpill] = None,
+        max_capacity_secs: Optional[float] = None,
+    ):
+        self._capacity_secs = capacity_secs
+        self._max_capacity_secs = max_capacity_secs
+        self._capacity = 0
+        self._max_capacity: Optional[int] = None
+        self._lost_before = 0
+        self._is_dropping = False
+        self._array: Optional[np.ndarray] = None
+        self._written = 0
+        self._spill = spill
+        self._spilled_blocks = 0
+
+    @property
+    def written(self) -> int:
+        """
+        Index of the next frame to be written.
+        """
+        return self._written
+
+    @property
+    def lost_before(self) -> int:
+        """
+        Frames before this index were overwritten although they were to be
+        kept, because the buffer reached its maximum capacity.
+        """
+        return self._lost_before
+
+    def write(self, chunk: InputAudioChunk, keep_from: int) -> None:
+        """
+        Append the frames of a chunk.
+        :param keep_from: Index of the oldest frame that mustn't be
+        overwritten.
+        """
+        if self._array is None:
+            self._capacity = max(1, int(self._capacity_secs * chunk.frame_rate))
+            if self._spill is not None:
+                self._spill.open(chunk.frame_rate)
+                # A completed block must still be in the buffer
+                # when it's being stored
+                self._capacity = max(self._capacity, 2 * self._spill.block_frames)
+            elif self._max_capacity_secs is not None:
+                self._max_capacity = max(
+                    self._capacity, int(self._max_capacity_secs * chunk.frame_rate)
+                )
+            self._array = np.zeros((self._capacity, chunk.channels), np.float32)
+        needed = self._written + len(chunk) - keep_from
+        is_dropping = False
+        if needed > self._capacity and self._spill is None:
+            capacity = max(needed, 2 * self._capacity)
+            if self._max_capacity is not None:
+                capacity = max(min(capacity, self._max_capacity), len(chunk))
+            if needed > capacity:
+                is_dropping = True
+                keep_from = self._written + len(chunk) - capacity
+                self._lost_before = keep_from
+            if capacity > self._capacity:
+                self._grow(capacity, keep_from)
+        if is_dropping and not self._is_dropping:
+            logger.warning("Input buffer is full, dropping the oldest input audio")
+        self._is_dropping = is_dropping
+        self._put(self._written, chunk.array)
+        self._written += len(chunk)
+        if self._spill is not None:
+            block_frames = self._spill.block_frames
+            while (self._spilled_blocks + 1) * block_frames <= self._written:
+                self._spill.store(
+                    self._spilled_blocks,
+                    self.read(self._spilled_blocks * block_frames, block_frames),
+                )
+                self._spilled_blocks += 1
+
+    def read(self, start: int, length: int) -> np.ndarray:
+        """
+        :return: A copy of the frames from start to start + length.
+        """
+        assert self._array is not None
+        assert start + length <= self._written
+        oldest_in_buffer = self._written - self._capacity
+        if start < oldest_in_buffer:
+            assert self._spill is not None
+            spilled_length = min(length, oldest_in_buffer - start)
+            spilled = self._spill.read(start, spilled_length)
+            if spilled_length == length:
+                return spilled
+            return np.concatenate(
+                (spilled, self.read(oldest_in_buffer, length - spilled_length))
+            )
+        index = start % self._capacity
+        first_part = min(length, self._capacity - index)
+        if first_part == length:
+            return self._array[index : index + length].copy()
+        return np.concatenate((self._array[index:], self._array[: length - first_part]))
+
+    def release(self, before: int) -> None:
+        """
+        Let the frames older than before be discarded from the spill.
+        """
+        if self._spill is not None:
+            self._spill.release(before)
+
+    def _put(self, start: int, array: np.ndarray) -> None:
+        assert self._array is not None
+        index = start % self._capacity
+        first_part = min(len(array), self._capacity - index)
+        self._array[index : index + first_part] = array[:first_part]
+        self._array[: len(array) - first_part] = array[first_part:]
+
+    def _grow(self, capacity: int, keep_from: int) -> None:
+        assert self._array is not None
+        kept = self.read(keep_from, self._written - keep_from)
+        self._capacity = capacity
+        self._array = np.zeros((capacity, self._array.shape[1]), np.float32)
+        self._put(keep_from, kept)
+
 
 class InputFragment:
-    def __init__(self, id: int, is_recording: bool):
+    """
+    A continuous fragment of input audio, stored as a range of frames
+    in a ring buffer (shared with the other fragments of an InputRecorder,
+    or a private one).
+
+    If a CaptureWriter is given and the fragment is a recording, it's also
+    streamed to a file. Once finished, the channel clips map that file
+    into memory instead of copying the audio.
+
+    A finished fragment can be detached from the ring buffer, so that it
+    no longer needs the frames there: it maps its capture file, or keeps
+    a copy of its frames.
+    """
+
+    def __init__(
+        self,
+        id: int,
+        is_recording: bool,
+        ring: Optional[RingBuffer] = None,
+        capture: Optional[CaptureWriter] = None,
+    ):
         self._id = id
-        self._chunks: List[InputAudioChunk] = []
+        self._ring = ring if ring is not None else RingBuffer(0)
+        self._capture = capture
+        self._is_captured = False
+        # Whether the channel clips were built from the ring buffer because
+        # the capture file wasn't complete yet
+        self._is_awaiting_capture = False
+        self._ring_start = self._ring.written
+        # The frames of a fragment detached from the ring buffer
+        self._array: Optional[np.ndarray] = None
         self._was_transport_rolling = None
         self._is_recording = is_recording
-        self._stop_frame = None
+        self._starting_frame: Optional[int] = None
+        self._frame_rate: Optional[float] = None
+        self._start_wall_time: Optional[datetime] = None
+        self._last_chunk_wall_time: Optional[datetime] = None
         self._length = 0
+        # Frames removed from the beginning by cut
+        self._cut_frames = 0
+        # Built on demand, invalidated when the fragment changes
+        self._channel_clips: Optional[List[AudioClip]] = None
+        # Bumped when the fragment changes; the JSON representation
+        # is cached until then
+        self._version = 0
+        self._js_key: Optional[tuple] = None
+        self._js: Optional[dict] = None
 
     def __len__(self) -> int:
         return self._length
@@ -27,11 +209,21 @@ class InputFragment:
 
     @property
     def is_empty(self) -> bool:
-        return len(self._chunks) == 0
+        return self._length == 0
+
+    @property
+    def ring_start(self) -> int:
+        """
+        Index of the first frame of this fragment in the ring buffer.
+        """
+        return self._ring_start
 
     @property
-    def chunks(self) -> List[InputAudioChunk]:
-        return self._chunks
+    def is_in_ring(self) -> bool:
+        """
+        Whether the frames of this fragment are read from the ring buffer.
+        """
+        return self._array is None
 
     @property
     def transport_state(self) -> TransportState:
@@ -46,13 +238,11 @@ class InputFragment:
 
     @property
     def starting_frame(self) -> Optional[int]:
-        if len(self._chunks) > 0:
-            return self._chunks[0].starting_frame
-        return None
+        return self._starting_frame
 
     @property
     def frame_rate(self):
-        return self._chunks[0].frame_rate
+        return self._frame_rate
 
     def is_chunk_compatible(self, chunk: InputAudioChunk) -> bool:
         return (
@@ -60,34 +250,147 @@ class InputFragment:
             or self._was_transport_rolling == chunk.was_transport_rolling
         )
 
-    def append_chunk(self, chunk: InputAudioChunk):
+    def append_chunk(self, chunk: InputAudioChunk, keep_from: Optional[int] = None):
+        """
+        :param keep_from: Index of the oldest frame in the ring buffer that
+        has to be kept (of this fragment or of other fragments sharing
+        the buffer). By default, the beginning of this fragment.
+        """
         assert self.is_chunk_compatible(chunk)
-        self._chunks.append(chunk)
+        assert self.is_in_ring
+        assert self._ring_start + self._length == self._ring.written
+        self._ring.write(chunk, self._ring_start if keep_from is None else keep_from)
+        if self._starting_frame is None:
+            self._starting_frame = chunk.starting_frame
+            self._frame_rate = chunk.frame_rate
+            self._start_wall_time = chunk.wall_time
         self._was_transport_rolling = chunk.was_transport_rolling
-        self._stop_frame = chunk.starting_frame + len(chunk)
+        self._last_chunk_wall_time = chunk.wall_time
         self._length += len(chunk)
+        self._channel_clips = None
+        self._version += 1
+        if (
+            self._capture is not None
+            and self.transport_state == TransportState.RECORDING
+        ):
+            self._capture.write(self._id, chunk)
+
+    def finish(self):
+        """
+        Called when no more chunks will be appended to the fragment.
+        """
+        if self._capture is not None and not self.is_empty:
+            self._capture.finish(self._id)
+            self._is_captured = self.transport_state == TransportState.RECORDING
+            self._channel_clips = None
+            self._version += 1
+
+    def discard(self):
+        """
+        Called when the fragment is no longer needed.
+        """
+        if self._capture is not None:
+            self._capture.discard(self._id)
+
+    def detach_from_ring(self):
+        """
+        Stop reading the frames of the fragment from the ring buffer, which
+        can then overwrite them. Called when no more chunks will be appended
+        to the fragment.
+        """
+        if not self.is_in_ring:
+            return
+        array = self._open_captured_take()
+        if array is None:
+            array = self._ring.read(self._ring_start, self._length)
+        self._array = array
 
     @property
     def start_wall_time(self):
-        return self._chunks[0].wall_time
+        return self._start_wall_time
 
     @property
     def last_chunk_wall_time(self):
-        return self._chunks[-1].wall_time
+        return self._last_chunk_wall_time
 
     def cut(self, desired_length: int):
-        # This will cut to a bit longer fragment than desired_length,
-        # because it won't cut individual chunks.
-        while len(self._chunks) > 1 and desired_length < len(self) - len(
-            self._chunks[-1]
-        ):
-            chunk = self._chunks.pop(0)
-            self._length -= len(chunk)
+        # Remove frames from the beginning, but keep at least one frame
+        removed = min(len(self) - desired_length, len(self) - 1)
+        if removed <= 0:
+            return
+        assert self._starting_frame is not None
+        assert self._start_wall_time is not None
+        assert self._frame_rate is not None
+        self._ring_start += removed
+        self._starting_frame += removed
+        self._start_wall_time += timedelta(seconds=removed / self._frame_rate)
+        self._length -= removed
+        self._cut_frames += removed
+        if self._array is not None:
+            self._array = self._array[removed:]
+        self._channel_clips = None
+        self._version += 1
+
+    def _read(self) -> np.ndarray:
+        # A new array, which the caller may modify
+        if self._array is not None:
+            return np.array(self._array)
+        return self._ring.read(self._ring_start, self._length)
 
     def as_clip(self) -> AudioClip:
-        return AudioClip.concatenate(self._chunks)
+        return AudioClip(self._read(), self._frame_rate)
+
+    def channel_clip(self, channel_number: int) -> AudioClip:
+        """
+        :return: A non-writeable mono clip with one channel of the fragment.
+        The clips of all the channels are built together, on the first call
+        after the fragment has changed, and then shared by all the callers.
+        Captured takes are read from the ring buffer until their capture
+        file is complete, and memory-mapped from the file afterwards.
+        """
+        if self._channel_clips is None or self._is_awaiting_capture:
+            array = self._open_captured_take()
+            if array is not None:
+                # Memory-mapped from the capture file
+                channels = [array[:, channel] for channel in range(array.shape[1])]
+                self._is_awaiting_capture = False
+            elif self._channel_clips is None:
+                array = self._read()
+                channels = [
+                    np.ascontiguousarray(array[:, channel])
+                    for channel in range(array.shape[1])
+                ]
+                self._is_awaiting_capture = self._is_captured
+            else:
+                return self._channel_clips[channel_number]
+            self._channel_clips = []
+            for channel_array in channels:
+                clip = AudioClip(channel_array, self._frame_rate)
+                clip.writeable = False
+                self._channel_clips.append(clip)
+        return self._channel_clips[channel_number]
+
+    def _open_captured_take(self) -> Optional[np.ndarray]:
+        if not self._is_captured:
+            return None
+        assert self._capture is not None
+        try:
+            array = self._capture.open_take(self._id)
+            if array is None:
+                return None
+            return array[self._cut_frames : self._cut_frames + self._length]
+        except (OSError, RuntimeError, ValueError):
+            logger.exception("Failed to open captured take")
+            return None
 
     def to_js(self, amio_interface: Interface) -> dict:
+        """
+        :return: The cached JSON representation, if the fragment hasn't
+        changed since it was built. It must not be modified.
+        """
+        key = (self._version, amio_interface)
+        if self._js is not None and self._js_key == key:
+            return self._js
         result = {
             "id": self._id,
             "transport_state": str(self.transport_state),
@@ -95,15 +398,56 @@ class InputFragment:
         }
         if self.starting_frame is not None:
             result["starting_time"] = format_frame(amio_interface, self.starting_frame)
+        self._js_key = key
+        self._js = result
         return result
 
 
 class InputRecorder(ObservableMixin):
-    def __init__(self, keepalive_mins: float, keepalive_margin_mins: float):
+    """
+    Records the input audio of the last keepalive_mins minutes (and
+    the last recording fragment, whatever its age) into a ring buffer,
+    split into fragments at transport state changes. Fragments kept
+    beyond keepalive_mins (the last recording fragment and the one being
+    revised) are detached from the ring buffer, so they don't make it grow.
+
+    If an InputSpill is given, only the last ram_horizon_mins minutes
+    are kept in memory, and older input audio is read back from the spill.
+    If a CaptureWriter is given, recordings are streamed to files.
+    Without a spill, the ring buffer grows to at most ram_limit_mins
+    minutes (if given), e.g. for a recording longer than that; beyond
+    that, the oldest fragments in the ring buffer are cut or dropped.
+    """
+
+    def __init__(
+        self,
+        keepalive_mins: float,
+        keepalive_margin_mins: float,
+        spill: Optional[InputSpill] = None,
+        ram_horizon_mins: float = 1,
+        capture: Optional[CaptureWriter] = None,
+        ram_limit_mins: Optional[float] = None,
+    ):
         super().__init__()
+        self._capture = capture
         self._id_generator = itertools.count()
-        self._input_fragments = deque([InputFragment(next(self._id_generator), False)])
+        if spill is not None:
+            self._ring = RingBuffer(60 * ram_horizon_mins, spill)
+        else:
+            # 1 s of headroom for the chunk appended before old fragments
+            # are removed
+            self._ring = RingBuffer(
+                60 * (keepalive_mins + keepalive_margin_mins) + 1,
+                max_capacity_secs=(
+                    60 * ram_limit_mins if ram_limit_mins is not None else None
+                ),
+            )
+        self._input_fragments: Deque[InputFragment] = deque()
+        self._fragments_by_id: Dict[int, InputFragment] = {}
+        self._total_length = 0
+        self._recording_fragment_count = 0
         self._is_recording = False
+        self._add_newest_fragment()
         self._fragment_being_revised: Optional[InputFragment] = None
         self._meter = Meter(2)
         self._keepalive_mins = keepalive_mins
@@ -128,14 +472,18 @@ class InputRecorder(ObservableMixin):
 
     @fragment_being_revised.setter
     def fragment_being_revised(self, fragment: Optional[InputFragment]):
+        old_fragment = self._fragment_being_revised
+        if (
+            old_fragment is not None
+            and old_fragment is not fragment
+            and old_fragment.id not in self._fragments_by_id
+        ):
+            old_fragment.discard()
         self._fragment_being_revised = fragment
         self._notify_observers()
 
     def fragment_by_id(self, id: int) -> Optional[InputFragment]:
-        for fragment in self._input_fragments:
-            if fragment.id == id:
-                return fragment
-        return None
+        return self._fragments_by_id.get(id)
 
     @property
     def is_recording(self) -> bool:
@@ -158,49 +506,140 @@ class InputRecorder(ObservableMixin):
                 self._notify_observers()
             self._is_recording = False
         if not self.last_fragment.is_chunk_compatible(input_chunk):
-            self._input_fragments.appendleft(
-                InputFragment(next(self._id_generator), self._is_recording)
-            )
-        self.last_fragment.append_chunk(input_chunk)
+            self.last_fragment.finish()
+            self._add_newest_fragment()
+        fragment = self.last_fragment
+        was_empty = fragment.is_empty
+        fragment.append_chunk(input_chunk, self._oldest_frame_to_keep())
+        self._total_length += len(input_chunk)
+        if self._oldest_frame_to_keep() < self._ring.lost_before:
+            self._remove_lost_frames()
+        if was_empty and fragment.transport_state == TransportState.RECORDING:
+            self._recording_fragment_count += 1
         # Keep track of what the current wall time is (approximately)
         self._wall_time_approx = input_chunk.wall_time
 
     def remove_old_fragments(self, amio_interface: Interface):
-        # Discard old fragments, but keep at least 1 fragment
-        index = self._first_to_discard(60 * self._keepalive_mins)
+        # Discard old fragments, but keep at least 1 fragment. Fragments
+        # are ordered by time, so only the oldest ones need to be checked.
+        discard_threshold = 60 * self._keepalive_mins
         last_recording_fragment = None
-        if index is not None and index >= 1:
-            while len(self._input_fragments) > index:
-                fragment = self._input_fragments.pop()
-                if fragment.transport_state == TransportState.RECORDING:
-                    last_recording_fragment = fragment
-            # If no recording fragment remained, append the last removed
-            # recording fragment
-            if last_recording_fragment is not None and not any(
-                fragment.transport_state == TransportState.RECORDING
-                for fragment in self._input_fragments
+        removed_fragments = []
+        while len(self._input_fragments) > 1 and self._is_older_than(
+            self._input_fragments[-1], discard_threshold
+        ):
+            fragment = self._remove_oldest_fragment()
+            removed_fragments.append(fragment)
+            if fragment.transport_state == TransportState.RECORDING:
+                last_recording_fragment = fragment
+        # If no recording fragment remained, append the last removed
+        # recording fragment
+        if last_recording_fragment is not None and self._recording_fragment_count == 0:
+            self._add_oldest_fragment(last_recording_fragment)
+        for fragment in removed_fragments:
+            if (
+                fragment.id in self._fragments_by_id
+                or fragment is self._fragment_being_revised
             ):
-                self._input_fragments.append(last_recording_fragment)
+                fragment.detach_from_ring()
+            else:
+                fragment.discard()
 
-        total_length = sum(len(fragment) for fragment in self._input_fragments)
-        last_fragment_length = len(self._input_fragments[-1])
         # Cut the last fragment if too long
         total_allowed = amio_interface.secs_to_frame(
             60 * (self._keepalive_mins + self._keepalive_margin_mins)
         )
-        fragment_to_cut = self._input_fragments[-1]
+        fragment_to_cut = self._oldest_fragment_in_ring()
         if fragment_to_cut.transport_state != TransportState.RECORDING:
-            fragment_to_cut.cut(total_allowed - (total_length - last_fragment_length))
-
-    def _first_to_discard(self, discard_threshold: float) -> Optional[int]:
-        if self._wall_time_approx is None:
-            return None
-        for i, fragment in enumerate(self._input_fragments):
+            length_in_ring = self._total_length - sum(
+                len(fragment)
+                for fragment in self._input_fragments
+                if not fragment.is_in_ring
+            )
+            length_before_cut = len(fragment_to_cut)
+            fragment_to_cut.cut(total_allowed - (length_in_ring - length_before_cut))
+            self._total_length -= length_before_cut - len(fragment_to_cut)
+        self._ring.release(self._oldest_frame_to_keep())
+
+    def _remove_lost_frames(self):
+        # The ring buffer reached its maximum capacity and overwrote frames
+        # of the oldest fragments
+        lost_before = self._ring.lost_before
+        revised = self._fragment_being_revised
+        while True:
+            fragment_to_cut = self._oldest_fragment_in_ring()
             if (
-                self._wall_time_approx - fragment.last_chunk_wall_time
-            ).total_seconds() >= discard_threshold:
-                return i
-        return None
+                fragment_to_cut is self.last_fragment
+                or fragment_to_cut.ring_start + len(fragment_to_cut) > lost_before
+            ):
+                break
+            self._remove_fragment(fragment_to_cut)
+            if fragment_to_cut is not revised:
+                fragment_to_cut.discard()
+        length_before_cut = len(fragment_to_cut)
+        fragment_to_cut.cut(
+            fragment_to_cut.ring_start + length_before_cut - lost_before
+        )
+        self._total_length -= length_before_cut - len(fragment_to_cut)
+        if (
+            revised is not None
+            and revised.is_in_ring
+            and revised.ring_start < lost_before
+        ):
+            if revised.ring_start + len(revised) <= lost_before:
+                self.fragment_being_revised = None
+            elif revised is not fragment_to_cut:
+                revised.cut(revised.ring_start + len(revised) - lost_before)
+
+    def _is_older_than(self, fragment: InputFragment, secs: float) -> bool:
+        if self._wall_time_approx is None or fragment.is_empty:
+            return False
+        return (
+            self._wall_time_approx - fragment.last_chunk_wall_time
+        ).total_seconds() >= secs
+
+    def _oldest_fragment_in_ring(self) -> InputFragment:
+        # Only the oldest fragments can be detached from the ring buffer,
+        # and the last fragment never is
+        for fragment in reversed(self._input_fragments):
+            if fragment.is_in_ring:
+                return fragment
+        assert False
+
+    def _oldest_frame_to_keep(self) -> int:
+        # Fragments are stored in the ring buffer in order, so the oldest
+        # fragment starts first; the fragment being revised may have been
+        # removed already, but it's still needed until it's detached
+        oldest = self._oldest_fragment_in_ring().ring_start
+        revised = self._fragment_being_revised
+        if revised is not None and revised.is_in_ring:
+            oldest = min(oldest, revised.ring_start)
+        return oldest
+
+    def _add_newest_fragment(self):
+        fragment = InputFragment(
+            next(self._id_generator), self._is_recording, self._ring, self._capture
+        )
+        self._input_fragments.appendleft(fragment)
+        self._fragments_by_id[fragment.id] = fragment
+
+    def _add_oldest_fragment(self, fragment: InputFragment):
+        self._input_fragments.append(fragment)
+        self._fragments_by_id[fragment.id] = fragment
+        self._total_length += len(fragment)
+        if fragment.transport_state == TransportState.RECORDING:
+            self._recording_fragment_count += 1
+
+    def _remove_oldest_fragment(self) -> InputFragment:
+        return self._remove_fragment(self._input_fragments[-1])
+
+    def _remove_fragment(self, fragment: InputFragment) -> InputFragment:
+        self._input_fragments.remove(fragment)
+        del self._fragments_by_id[fragment.id]
+        self._total_length -= len(fragment)
+        if fragment.transport_state == TransportState.RECORDING:
+            self._recording_fragment_count -= 1
+        return fragment
 
     def _update_meter(self, input_chunk: InputAudioChunk):
         _, left_rms, left_peak = input_chunk.channel(0).create_metering_data()
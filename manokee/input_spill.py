@@ -0,0 +1,123 @@
+import atexit
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+
+class InputSpill:
+    """
+    Storage of the input audio stream in FLAC files in a scratch directory,
+    so that input audio doesn't have to be kept in memory for long.
+    The stream is split into fixed-size blocks, which are encoded and
+    written by a writer thread. Blocks not yet written are kept in memory
+    until they are.
+    """
+
+    def __init__(self, directory: str, block_secs: float = 10):
+        os.makedirs(directory, exist_ok=True)
+        # A private subdirectory, removed at exit
+        self._directory = tempfile.mkdtemp(prefix="input-", dir=directory)
+        atexit.register(shutil.rmtree, self._directory, True)
+        self._block_secs = block_secs
+        self._frame_rate: Optional[float] = None
+        self._block_frames = 0
+        self._lock = threading.Lock()
+        self._pending: Dict[int, np.ndarray] = {}
+        self._first_block = 0
+        self._stored_blocks = 0
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = threading.Thread(
+            target=self._write_blocks, name="manokee-input-spill", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def block_frames(self) -> int:
+        return self._block_frames
+
+    def open(self, frame_rate: float) -> None:
+        """
+        Must be called before the first block is stored.
+        """
+        self._frame_rate = frame_rate
+        self._block_frames = max(1, int(self._block_secs * frame_rate))
+
+    def store(self, block: int, array: np.ndarray) -> None:
+        """
+        Store the next block of the stream (of block_frames frames).
+        """
+        assert block == self._stored_blocks
+        assert len(array) == self._block_frames
+        with self._lock:
+            self._pending[block] = array
+        self._stored_blocks += 1
+        self._queue.put(("write", block))
+
+    def read(self, start: int, length: int) -> np.ndarray:
+        """
+        :return: Frames from start to start + length of the stream. They
+        must be in stored, not released blocks.
+        """
+        parts = []
+        end = start + length
+        while start < end:
+            block, offset = divmod(start, self._block_frames)
+            assert self._first_block <= block < self._stored_blocks
+            frames = min(end - start, self._block_frames - offset)
+            with self._lock:
+                array = self._pending.get(block)
+            if array is not None:
+                parts.append(array[offset : offset + frames])
+            else:
+                parts.append(
+                    sf.read(
+                        self._path(block),
+                        frames,
+                        offset,
+                        dtype="float32",
+                        always_2d=True,
+                    )[0]
+                )
+            start += frames
+        return np.concatenate(parts)
+
+    def release(self, before: int) -> None:
+        """
+        Delete the blocks which only contain frames older than before.
+        """
+        last_block = min(before // max(1, self._block_frames), self._stored_blocks)
+        for block in range(self._first_block, last_block):
+            self._queue.put(("delete", block))
+        self._first_block = max(self._first_block, last_block)
+
+    def _path(self, block: int) -> str:
+        return os.path.join(self._directory, f"{block}.flac")
+
+    def _write_blocks(self):
+        # Runs on the writer thread
+        while True:
+            action, block = self._queue.get()
+            try:
+                if action == "write":
+                    with self._lock:
+                        array = self._pending[block]
+                    assert self._frame_rate is not None
+                    sf.write(self._path(block), array, int(self._frame_rate), "PCM_24")
+                    with self._lock:
+                        del self._pending[block]
+                else:
+                    with self._lock:
+                        self._pending.pop(block, None)
+                    if os.path.exists(self._path(block)):
+                        os.remove(self._path(block))
+            except Exception:
+                logger.exception(f"Failed to {action} input audio block {block}")
@@ -0,0 +1,64 @@
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class WindowedMax:
+    """
+    Maximum of the values seen recently: in the current window and the
+    previous one, so the maximum covers from window to 2 * window seconds.
+    """
+
+    def __init__(self, window: float = 5):
+        self.window = window
+        self._window_start: Optional[float] = None
+        self._current: Optional[float] = None
+        self._previous: Optional[float] = None
+
+    def _advance(self, now: float):
+        if self._window_start is None:
+            self._window_start = now
+        elapsed_windows = int((now - self._window_start) // self.window)
+        if elapsed_windows >= 1:
+            self._previous = self._current if elapsed_windows == 1 else None
+            self._current = None
+            self._window_start += elapsed_windows * self.window
+
+    def new_value(self, value: float, now: Optional[float] = None):
+        self._advance(time.perf_counter() if now is None else now)
+        if self._current is None or value > self._current:
+            self._current = value
+
+    def get(self, now: Optional[float] = None) -> Optional[float]:
+        self._advance(time.perf_counter() if now is None else now)
+        values = [v for v in (self._current, self._previous) if v is not None]
+        return max(values) if values else None
+
+
+class Metrics:
+    """
+    Named recent maxima describing the internal state of Manokee. They're
+    sent to the web UI with the state updates. Metrics kept elsewhere
+    can be included by adding a source: a function returning them.
+    """
+
+    def __init__(self):
+        self._maxima: Dict[str, WindowedMax] = {}
+        self._sources: List[Callable[[], Dict[str, float]]] = []
+
+    def add_source(self, source: Callable[[], Dict[str, float]]):
+        self._sources.append(source)
+
+    def observe_max(self, name: str, value: float):
+        if name not in self._maxima:
+            self._maxima[name] = WindowedMax()
+        self._maxima[name].new_value(value)
+
+    def get(self, name: str) -> Optional[float]:
+        maximum = self._maxima.get(name)
+        return maximum.get() if maximum is not None else None
+
+    def to_js(self) -> dict:
+        result = {name: maximum.get() for name, maximum in self._maxima.items()}
+        for source in self._sources:
+            result.update(source())
+        return result
@@ -1,19 +1,228 @@
-from amio import AudioClip
+from amio import AudioClip, PlayspecEntry
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from functools import lru_cache
+import logging
+from manokee.timing.timing import Timing
+from math import floor
+import numpy as np
+from typing import Dict, Hashable, Iterator, List, Optional, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
 
 
 metronome_bar_clip = AudioClip.from_soundfile("res/metbar.flac")
 metronome_beat_clip = AudioClip.from_soundfile("res/metbeat.flac")
 
+# Number of rendered metronome bars kept in memory
+METRONOME_CACHE_SIZE = 16
+
+# Renders the bars of tempo map metronomes ahead of the playhead
+_render_executor = ThreadPoolExecutor(1, thread_name_prefix="manokee-metronome")
+
+
+@lru_cache(maxsize=METRONOME_CACHE_SIZE)
+def render_metronome_bar(
+    bpm: float,
+    time_signature: int,
+    frame_rate: float,
+    bar_clip: AudioClip,
+    beat_clip: AudioClip,
+) -> AudioClip:
+    """
+    Render one bar of metronome clicks. Bars are cached, so the same clip
+    is returned for the same arguments, and it must not be modified.
+    """
+    beat_length_seconds = 60 / bpm
+    bar_length_seconds = beat_length_seconds * time_signature
+    repeat_interval = int(bar_length_seconds * frame_rate)
+    audio_clip = AudioClip.zeros(repeat_interval, 1, frame_rate)
+    audio_clip.overwrite(bar_clip, 0)
+    for i in range(1, time_signature):
+        audio_clip.overwrite(beat_clip, int(i * beat_length_seconds * frame_rate))
+    audio_clip.writeable = False
+    return audio_clip
+
+
+def metronome_cache_metrics() -> Dict[str, float]:
+    info = render_metronome_bar.cache_info()
+    return {"metronome_cache_hits": info.hits, "metronome_cache_misses": info.misses}
+
 
-# TODO: Support variable-bpm metronome
 class Metronome:
+    """
+    Metronome with a fixed tempo: a single rendered bar, repeated.
+    """
+
     def __init__(self, *, bpm: float, time_signature: int, frame_rate: float):
-        beat_length_seconds = 60 / bpm
-        bar_length_seconds = beat_length_seconds * time_signature
-        repeat_interval = int(bar_length_seconds * frame_rate)
-        self.audio_clip = AudioClip.zeros(repeat_interval, 1, frame_rate)
-        self.audio_clip.overwrite(metronome_bar_clip, 0)
-        for i in range(1, time_signature):
-            self.audio_clip.overwrite(
-                metronome_beat_clip, int(i * beat_length_seconds * frame_rate)
+        self.audio_clip = render_metronome_bar(
+            bpm, time_signature, frame_rate, metronome_bar_clip, metronome_beat_clip
+        )
+
+    @property
+    def window(self) -> Hashable:
+        """
+        Identifies the bars in the playspec entries of the metronome.
+        """
+        return None
+
+    def update_window(self, frame_ranges: List[Tuple[int, int]]) -> bool:
+        """
+        Make the playspec entries cover (at least) the given frame ranges.
+        :return: Whether the entries changed.
+        """
+        return False
+
+    def playspec_entries(self, gain_l: float, gain_r: float) -> Iterator[PlayspecEntry]:
+        yield PlayspecEntry(
+            self.audio_clip,
+            0,
+            len(self.audio_clip),
+            0,
+            len(self.audio_clip),
+            gain_l,
+            gain_r,
+        )
+
+
+class TempoMapMetronome:
+    """
+    Metronome following the beats of any timing. Bars are rendered one by
+    one, only those around the playhead (see update_window), and kept in
+    a cache of up to cached_bars bars, so a long song doesn't need
+    a full-length click track.
+
+    The render_ahead_bars bars following the requested frame ranges are
+    rendered in the background, on the executor, and the playspec entries
+    cover them as well once they're ready. So the entries need to change
+    only every few bars, when the playhead moves past them.
+    """
+
+    def __init__(
+        self,
+        *,
+        timing: Timing,
+        time_signature: int,
+        frame_rate: float,
+        cached_bars: int = 64,
+        render_ahead_bars: int = 16,
+        executor: Optional[Executor] = None,
+    ):
+        self._timing = timing
+        self._time_signature = time_signature
+        self._frame_rate = frame_rate
+        self._cached_bars = cached_bars
+        self._render_ahead_bars = render_ahead_bars
+        self._executor = executor if executor is not None else _render_executor
+        # Bar number -> clip, least recently used first
+        self._bars: "OrderedDict[int, AudioClip]" = OrderedDict()
+        # Bars being rendered on the executor
+        self._rendering: Dict[int, Future] = {}
+        self._window: Tuple[int, ...] = ()
+        first_frame = self._beat_to_frame(self._bar_to_beat(self._first_bar()))
+        # Bars starting before frame 0 are cut
+        self._cut_frames = max(0, -first_frame)
+
+    def _bar_to_beat(self, bar: int) -> int:
+        return bar * self._time_signature
+
+    def _beat_to_frame(self, beat: int) -> int:
+        return round(self._timing.beat_to_seconds(beat) * self._frame_rate)
+
+    def _frame_to_bar(self, frame: int) -> int:
+        beat = self._timing.seconds_to_beat(frame / self._frame_rate)
+        return floor(beat / self._time_signature)
+
+    def _first_bar(self) -> int:
+        # The bar playing at frame 0
+        return self._frame_to_bar(0)
+
+    def _render_bar(self, bar: int) -> AudioClip:
+        first_beat = self._bar_to_beat(bar)
+        # Frames of the beats of the bar, and of the start of the next bar
+        beat_frames = np.round(
+            self._timing.beat_to_seconds_array(
+                np.arange(first_beat, first_beat + self._time_signature + 1)
+            )
+            * self._frame_rate
+        ).astype(int)
+        start = beat_frames[0]
+        end = beat_frames[-1]
+        audio_clip = AudioClip.zeros(max(1, end - start), 1, self._frame_rate)
+        audio_clip.overwrite(metronome_bar_clip, 0)
+        for beat_frame in beat_frames[1:-1]:
+            audio_clip.overwrite(metronome_beat_clip, int(beat_frame - start))
+        audio_clip.writeable = False
+        return audio_clip
+
+    def _bar_clip(self, bar: int) -> AudioClip:
+        clip = self._bars.get(bar)
+        if clip is None:
+            clip = self._bars[bar] = self._render_bar(bar)
+        else:
+            self._bars.move_to_end(bar)
+        return clip
+
+    def _collect_rendered_bars(self) -> None:
+        for bar, future in list(self._rendering.items()):
+            if not future.done():
+                continue
+            del self._rendering[bar]
+            try:
+                clip = future.result()
+            except Exception:
+                logger.exception(f"Failed to render metronome bar {bar}")
+                continue
+            if bar not in self._bars:
+                self._bars[bar] = clip
+
+    @property
+    def window(self) -> Hashable:
+        return self._window
+
+    def update_window(self, frame_ranges: List[Tuple[int, int]]) -> bool:
+        self._collect_rendered_bars()
+        first_bar = self._first_bar()
+        needed: Set[int] = set()
+        ahead: Set[int] = set()
+        for frame_a, frame_b in frame_ranges:
+            last_bar = self._frame_to_bar(frame_b)
+            needed.update(
+                range(max(first_bar, self._frame_to_bar(frame_a)), last_bar + 1)
+            )
+            ahead.update(
+                range(
+                    max(first_bar, last_bar + 1),
+                    last_bar + 1 + self._render_ahead_bars,
+                )
             )
+        window = set(self._window)
+        changed = not needed <= window
+        if changed:
+            # Bars needed right away are rendered here if they aren't ready
+            window = needed | {bar for bar in ahead if bar in self._bars}
+            self._window = tuple(sorted(window))
+        for bar in self._window:
+            self._bar_clip(bar)
+        for bar in sorted(needed | ahead):
+            if bar not in self._bars and bar not in self._rendering:
+                self._rendering[bar] = self._executor.submit(self._render_bar, bar)
+        # Evict least recently used bars, but never those in the window
+        cache_size = max(self._cached_bars, len(window) + len(ahead))
+        for bar in list(self._bars):
+            if len(self._bars) <= cache_size:
+                break
+            if bar not in window:
+                del self._bars[bar]
+        return changed
+
+    def playspec_entries(self, gain_l: float, gain_r: float) -> Iterator[PlayspecEntry]:
+        first_bar = self._first_bar()
+        for bar in self._window:
+            clip = self._bars[bar]
+            start = self._beat_to_frame(self._bar_to_beat(bar))
+            cut = self._cut_frames if bar == first_bar else 0
+            yield PlayspecEntry(clip, cut, len(clip), start + cut, 0, gain_l, gain_r)
+
+
+AnyMetronome = Union[Metronome, TempoMapMetronome]
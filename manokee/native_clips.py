@@ -0,0 +1,74 @@
+from amio import AudioClip, Interface, NativeInterface, Playspec, PlayspecEntry
+from amio.audio_clip import ImmutableAudioClip
+from manokee.compact_audio import CompactAudioClip, TrackAudio
+import numpy as np
+import weakref
+
+
+def _clip_data(clip: TrackAudio) -> bytes:
+    # The format expected by the native I/O thread: 16-bit native-endian
+    # channel-interleaved samples
+    if isinstance(clip, CompactAudioClip):
+        return clip.int16_data()
+    return (clip.array * 32767).clip(-32767, 32767).astype(np.int16).tobytes()
+
+
+class NativeClipRegistry:
+    """
+    Copies of audio clips owned by the native I/O thread. Each immutable
+    clip is copied to the I/O thread only once, when it's first played,
+    and the copy is released together with the clip. The intermediate
+    16-bit data isn't kept around, so the audio exists in memory twice:
+    as the NumPy array and as the I/O thread's copy.
+
+    Interfaces other than the native one play AudioClips directly, so for
+    them only compact clips are replaced, by float copies kept in the same
+    way.
+    """
+
+    def __init__(self, amio_interface: Interface):
+        self._amio_interface = amio_interface
+        # AudioClip -> ImmutableAudioClip
+        self._native_clips: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        # CompactAudioClip -> AudioClip
+        self._float_clips: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def _native_clip(self, clip: TrackAudio) -> ImmutableAudioClip:
+        native_clip = self._native_clips.get(clip)
+        if native_clip is None:
+            assert clip.frame_rate == self._amio_interface.get_frame_rate()
+            native_clip = ImmutableAudioClip(
+                self._amio_interface, _clip_data(clip), clip.channels, clip.frame_rate
+            )
+            if not clip.writeable:
+                self._native_clips[clip] = native_clip
+        return native_clip
+
+    def _float_clip(self, clip: CompactAudioClip) -> AudioClip:
+        float_clip = self._float_clips.get(clip)
+        if float_clip is None:
+            float_clip = AudioClip(clip.read(0, len(clip)), clip.frame_rate)
+            float_clip.writeable = False
+            self._float_clips[clip] = float_clip
+        return float_clip
+
+    def resolve(self, playspec: Playspec) -> Playspec:
+        """
+        :return: The playspec with its clips replaced by the I/O thread's
+        copies. For other interfaces, only compact clips are replaced,
+        by float AudioClips.
+        """
+        # PlayspecEntry defines __len__, so namedtuple's _replace doesn't work
+        if not isinstance(self._amio_interface, NativeInterface):
+            return [
+                (
+                    PlayspecEntry(self._float_clip(entry.clip), *entry[1:])
+                    if isinstance(entry.clip, CompactAudioClip)
+                    else entry
+                )
+                for entry in playspec
+            ]
+        return [
+            PlayspecEntry(self._native_clip(entry.clip), *entry[1:])
+            for entry in playspec
+        ]
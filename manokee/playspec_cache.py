@@ -0,0 +1,327 @@
+from amio import AudioClip, Fader, Playspec, PlayspecEntry
+import manokee.metronome
+import manokee.revising
+import manokee.session
+from manokee.freezing import TrackFreezer
+from manokee.playspec_generators import (
+    metronome_playspec_entries,
+    track_playspec_entries,
+)
+from manokee.track import Track
+from manokee.track_group import TrackGroup
+from manokee.track_segments import playback_regions
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+
+def _gains(fader: Fader) -> Tuple[float, float]:
+    return fader.left_gain_factor, fader.right_gain_factor
+
+
+def _with_gains(entries: Playspec, gains: Tuple[float, float]) -> Playspec:
+    # PlayspecEntry defines __len__, so namedtuple's _replace doesn't work
+    return [PlayspecEntry(*entry[:5], *gains) for entry in entries]
+
+
+def _track_fingerprint(
+    track: Track, substitute: Optional["manokee.revising.AudioSubstitute"]
+) -> Optional[Hashable]:
+    """
+    :return: A value that changes whenever the playspec entries of the track
+    would change (other than by their gains), or None if it can't be
+    determined (a clip of the track can be modified in place), and
+    the entries have to be rebuilt anyway. Clips are identified by id(),
+    so the clips must be kept alive while the fingerprint is in use.
+    """
+    regions = list(playback_regions(track.segments))
+    clips = [region.clip for region in regions]
+    if substitute is not None:
+        clips.append(substitute.clip)
+    if any(clip.writeable for clip in clips):
+        return None
+    return (
+        tuple((id(clip), a, b, at) for clip, a, b, at in regions),
+        (
+            None
+            if substitute is None
+            else (id(substitute.clip), len(substitute.clip), substitute.starting_frame)
+        ),
+    )
+
+
+class _CachedEntries:
+    def __init__(self, fingerprint: Optional[Hashable], entries: Playspec):
+        self.fingerprint = fingerprint
+        # Also keeps the clips identified in the fingerprint alive
+        self.entries = entries
+
+
+class _CachedGroup(_CachedEntries):
+    def __init__(
+        self,
+        fingerprint: Optional[Hashable],
+        entries: Playspec,
+        playspec: Playspec,
+        track_ranges: List[Tuple[Track, int, int]],
+        metronome_range: Tuple[int, int],
+    ):
+        super().__init__(fingerprint, entries)
+        self.playspec = playspec
+        # Where the entries of each track (except for frozen ones) and of
+        # the metronome are in the playspec
+        self.track_ranges = track_ranges
+        self.metronome_range = metronome_range
+
+
+class PlayspecCache:
+    """
+    Playspecs of the track groups of a session, built incrementally.
+    Playspec entries are cached per track and per track group together
+    with fingerprints of the state they were built from, and only the
+    groups whose tracks, audio substitutes or metronome changed are
+    rebuilt.
+
+    Changes of gains alone (faders, and muting tracks which are
+    in a playspec) don't require rebuilding: update_gains replaces
+    the gains of the entries of the existing playspecs.
+
+    With a freezer, the static tracks of each group (not armed for
+    recording, not revised and not paged) are played from a premixed
+    stem when it's ready. Until then, and after any of them changes,
+    they're played track by track.
+    """
+
+    def __init__(
+        self,
+        resolve: Callable[[Playspec], Playspec],
+        freezer: Optional[TrackFreezer] = None,
+    ):
+        """
+        :param resolve: Function applied to the playspec of a group after
+        it's built, e.g. NativeClipRegistry.resolve. It must map entries
+        one to one.
+        """
+        self._resolve = resolve
+        self._freezer = freezer
+        self._track_entries: Dict[Track, _CachedEntries] = {}
+        self._groups: Dict[str, _CachedGroup] = {}
+        # Group name -> (metronome key, metronome)
+        self._metronomes: Dict[
+            str, Tuple[Hashable, "manokee.metronome.AnyMetronome"]
+        ] = {}
+        self._metronome_window: List[Tuple[int, int]] = []
+
+    def clear(self):
+        self._track_entries = {}
+        self._groups = {}
+        self._metronomes = {}
+        if self._freezer is not None:
+            self._freezer.clear()
+
+    def _entries_for_track(
+        self,
+        track: Track,
+        audio_substitutes: Dict[Track, "manokee.revising.AudioSubstitute"],
+        track_entries: Dict[Track, _CachedEntries],
+    ) -> _CachedEntries:
+        cached = track_entries.get(track)
+        if cached is None:
+            substitute = audio_substitutes.get(track)
+            fingerprint = _track_fingerprint(track, substitute)
+            cached = self._track_entries.get(track)
+            if (
+                cached is None
+                or fingerprint is None
+                or cached.fingerprint != fingerprint
+            ):
+                cached = _CachedEntries(
+                    fingerprint,
+                    list(track_playspec_entries([track], audio_substitutes)),
+                )
+            track_entries[track] = cached
+        return cached
+
+    def _metronome(self, group: TrackGroup) -> "manokee.metronome.AnyMetronome":
+        key = group.metronome_key()
+        cached = self._metronomes.get(group.name)
+        if cached is None or cached[0] != key:
+            metronome = group.create_metronome()
+            metronome.update_window(self._metronome_window)
+            cached = (key, metronome)
+            self._metronomes[group.name] = cached
+        return cached[1]
+
+    def update_metronome_window(self, frame_ranges: List[Tuple[int, int]]) -> bool:
+        """
+        Set the frame ranges (around the playhead) which metronomes render
+        clicks for.
+        :return: Whether the playspecs need to be updated.
+        """
+        self._metronome_window = frame_ranges
+        changed = False
+        for _, metronome in self._metronomes.values():
+            changed = metronome.update_window(frame_ranges) or changed
+        return changed
+
+    def _freeze(
+        self,
+        session: "manokee.session.Session",
+        group: TrackGroup,
+        tracks: List[Tuple[Track, _CachedEntries]],
+        audio_substitutes: Dict[Track, "manokee.revising.AudioSubstitute"],
+    ) -> Tuple[Optional[AudioClip], List[Tuple[Track, _CachedEntries]]]:
+        """
+        :return: The stem of the static tracks (if ready), and the tracks
+        which aren't in the stem.
+        """
+        if self._freezer is None:
+            return None, tracks
+        static = [
+            (track, cached)
+            for track, cached in tracks
+            if not track.is_rec
+            and track not in audio_substitutes
+            and track.pager is None
+            and cached.fingerprint is not None
+        ]
+        if len(static) < 2:
+            self._freezer.forget(group.name)
+            return None, tracks
+        key = tuple(
+            (track, cached.fingerprint, _gains(track.fader)) for track, cached in static
+        )
+        stem = self._freezer.stem(
+            group.name,
+            key,
+            [
+                (track.segments, track.channels, _gains(track.fader))
+                for track, _ in static
+            ],
+            session.frame_rate,
+        )
+        if stem is None:
+            return None, tracks
+        frozen = {track for track, _ in static}
+        return stem, [
+            (track, cached) for track, cached in tracks if track not in frozen
+        ]
+
+    def update(
+        self,
+        session: "manokee.session.Session",
+        is_recording: bool,
+        reviser: "manokee.revising.Reviser",
+    ) -> List[str]:
+        """
+        Bring the playspecs up to date with the session, except for gains
+        of the groups which aren't rebuilt (see update_gains).
+        :return: Names of the track groups whose playspecs were rebuilt.
+        """
+        audibility = session.track_audibility(is_recording)
+        track_entries: Dict[Track, _CachedEntries] = {}
+        groups: Dict[str, _CachedGroup] = {}
+        rebuilt = []
+        for group in session.track_groups:
+            tracks = [
+                (
+                    track,
+                    self._entries_for_track(
+                        track, reviser.audio_substitutes, track_entries
+                    ),
+                )
+                for track in group.tracks
+                if audibility[track]
+            ]
+            stem, live_tracks = self._freeze(
+                session, group, tracks, reviser.audio_substitutes
+            )
+            metronome = self._metronome(group) if session.metronome_enabled else None
+            fingerprints = [(track, cached.fingerprint) for track, cached in tracks]
+            fingerprint: Optional[Hashable] = (
+                None
+                if any(
+                    track_fingerprint is None for _, track_fingerprint in fingerprints
+                )
+                else (
+                    tuple(fingerprints),
+                    id(metronome),
+                    None if metronome is None else metronome.window,
+                    id(stem),
+                )
+            )
+            cached = self._groups.get(group.name)
+            if (
+                cached is None
+                or fingerprint is None
+                or cached.fingerprint != fingerprint
+            ):
+                entries: List[PlayspecEntry] = []
+                track_ranges = []
+                for track, cached_track in live_tracks:
+                    track_ranges.append(
+                        (track, len(entries), len(entries) + len(cached_track.entries))
+                    )
+                    entries.extend(
+                        _with_gains(cached_track.entries, _gains(track.fader))
+                    )
+                metronome_start = len(entries)
+                entries.extend(metronome_playspec_entries(session, metronome))
+                metronome_range = (metronome_start, len(entries))
+                if stem is not None:
+                    entries.append(PlayspecEntry(stem, 0, len(stem), 0, 0, 1.0, 1.0))
+                cached = _CachedGroup(
+                    fingerprint,
+                    entries,
+                    self._resolve(entries),
+                    track_ranges,
+                    metronome_range,
+                )
+                rebuilt.append(group.name)
+            groups[group.name] = cached
+        self._track_entries = track_entries
+        self._groups = groups
+        self._metronomes = {
+            name: metronome
+            for name, metronome in self._metronomes.items()
+            if name in groups
+        }
+        return rebuilt
+
+    def update_gains(
+        self, session: "manokee.session.Session", is_recording: bool
+    ) -> List[str]:
+        """
+        Replace the gains of the entries of the playspecs with the current
+        ones, without rebuilding the playspecs. Tracks that became inaudible
+        get zero gains, until the playspec is rebuilt without them.
+        :return: Names of the track groups whose playspecs changed.
+        """
+        audibility = session.track_audibility(is_recording)
+        updated = []
+        for name, group in self._groups.items():
+            playspec = group.playspec
+            ranges = [
+                (
+                    a,
+                    b,
+                    _gains(track.fader) if audibility.get(track) else (0.0, 0.0),
+                )
+                for track, a, b in group.track_ranges
+            ]
+            ranges.append((*group.metronome_range, _gains(session.metronome_fader)))
+            if all(
+                (entry.gain_l, entry.gain_r) == gains
+                for a, b, gains in ranges
+                for entry in playspec[a:b]
+            ):
+                continue
+            # The playspec may be in use, so it's replaced, not modified
+            playspec = list(playspec)
+            for a, b, gains in ranges:
+                playspec[a:b] = _with_gains(playspec[a:b], gains)
+            group.playspec = playspec
+            updated.append(name)
+        return updated
+
+    @property
+    def playspecs(self) -> Dict[str, Playspec]:
+        return {name: group.playspec for name, group in self._groups.items()}
@@ -1,7 +1,10 @@
 from amio import Interface, Playspec
 from itertools import cycle
 import logging
+from manokee.freezing import TrackFreezer
 from manokee.looping import LoopFragment
+from manokee.native_clips import NativeClipRegistry
+from manokee.playspec_cache import PlayspecCache
 import manokee.revising
 from manokee.session_holder import SessionHolder
 from manokee.timing.timing import Timing
@@ -15,14 +18,29 @@ logger = logging.getLogger(__name__)
 
 
 class PlayspecController:
+    # Audio of paged tracks is kept resident, and clicks of tempo map
+    # metronomes are rendered, in this window around the playhead
+    # (and in the loop region)
+    paging_window_behind_secs = 5
+    paging_window_ahead_secs = 20
+
     def __init__(
         self,
         amio_interface: Interface,
         session_holder: SessionHolder,
         reviser: manokee.revising.Reviser,
+        freeze_directory: Optional[str] = None,
     ):
+        """
+        :param freeze_directory: Where to keep stems of frozen tracks.
+        If None, tracks aren't frozen.
+        """
         self._amio_interface = amio_interface
-        self._playspecs_for_groups: Dict[str, Playspec] = {}
+        self._native_clips = NativeClipRegistry(amio_interface)
+        freezer = None
+        if freeze_directory is not None:
+            freezer = TrackFreezer(freeze_directory, self._recreate_playspecs)
+        self._playspec_cache = PlayspecCache(self._native_clips.resolve, freezer)
         self._timing: Timing = FixedBpmTiming()
         # One of _active_track_group_name and _loop_spec is not None
         self._active_track_group_name: Optional[str] = ""
@@ -35,17 +53,57 @@ class PlayspecController:
         self._is_recording = False
         self._requires_playspec_recreation = False
         self._input_chunks_until_recreation = 0
+        self._input_chunks_until_paging = 0
+        # At most one gains update waits to be applied; later ones are
+        # coalesced into the next one
+        self._is_gains_update_pending = False
+        self._requires_gains_update = False
 
     def on_input_chunk(self):
         if self._input_chunks_until_recreation > 0:
             self._input_chunks_until_recreation -= 1
+        if self._input_chunks_until_paging > 0:
+            self._input_chunks_until_paging -= 1
+        else:
+            self._input_chunks_until_paging = 99  # a few times per second
+            self._update_paging()
         if self._requires_playspec_recreation:
             self._recreate_playspecs()
 
+    def _update_paging(self):
+        session = self._session_holder.session
+        if session is None:
+            return
+        position = self._amio_interface.get_position()
+        frame_ranges = [
+            (
+                position
+                - self._amio_interface.secs_to_frame(self.paging_window_behind_secs),
+                position
+                + self._amio_interface.secs_to_frame(self.paging_window_ahead_secs),
+            )
+        ]
+        for fragment in self._loop_spec or []:
+            timing = session.track_group_by_name(fragment.track_group_name).timing
+            frame_ranges.append(
+                (
+                    self._amio_interface.secs_to_frame(
+                        timing.beat_to_seconds(fragment.bar_a)
+                    ),
+                    self._amio_interface.secs_to_frame(
+                        timing.beat_to_seconds(fragment.bar_b)
+                    ),
+                )
+            )
+        tracks_paged = session.page_tracks(frame_ranges)
+        if self._playspec_cache.update_metronome_window(frame_ranges) or tracks_paged:
+            self._recreate_playspecs()
+
     def _on_session_changed(self):
         session = self._session_holder.session
+        self._playspec_cache.clear()
         if session is not None:
-            session.add_observer(self._recreate_playspecs)
+            session.add_observer(self._on_session_modified)
             self._active_track_group_name = session.track_groups[0].name
             self._timing = session.track_groups[0].timing
             self._loop_spec = None
@@ -54,7 +112,40 @@ class PlayspecController:
             self._recreate_playspecs()
         else:
             self._timing = FixedBpmTiming()
-            self._playspecs_for_groups = {}
+
+    def _on_session_modified(self):
+        self._update_gains()
+        self._recreate_playspecs()
+
+    def _update_gains(self):
+        # Not throttled: only the gains of the entries are replaced, so it's
+        # cheap enough to follow fader moves
+        updated = self._playspec_cache.update_gains(
+            self._session_holder.session, self._is_recording
+        )
+        if self._active_track_group_name in updated:
+            self._schedule_gains_update()
+
+    def _schedule_gains_update(self):
+        # amio can't take a new playspec until the previous one is applied,
+        # and queues it; a fader sweep would queue a playspec for every step
+        if self._is_gains_update_pending:
+            self._requires_gains_update = True
+            return
+        self._is_gains_update_pending = True
+        self._requires_gains_update = False
+        current_playspec = self._playspecs_for_groups[self._active_track_group_name]
+        self._amio_interface.schedule_playspec_change(
+            current_playspec, 0, 0, self._on_gains_update_applied
+        )
+
+    def _on_gains_update_applied(self, was_used: bool):
+        self._is_gains_update_pending = False
+        if (
+            self._requires_gains_update
+            and self._active_track_group_name in self._playspecs_for_groups
+        ):
+            self._schedule_gains_update()
 
     def _recreate_playspecs(self):
         if self._input_chunks_until_recreation > 0:
@@ -63,18 +154,22 @@ class PlayspecController:
         self._input_chunks_until_recreation = 19  # @48kHz, it's ~0.05 s, or ~20 times/s
         self._requires_playspec_recreation = False
         session = self._session_holder.session
+        rebuilt = self._playspec_cache.update(
+            session, self._is_recording, self._reviser
+        )
+        if not rebuilt:
+            return
         logger.debug(
-            "Recreating playspecs for groups: "
-            + ", ".join([f"'{group.name}'" for group in session.track_groups])
+            "Recreated playspecs for groups: "
+            + ", ".join([f"'{name}'" for name in rebuilt])
         )
-        self._playspecs_for_groups = {
-            group.name: session.make_playspec_for_track_group(
-                group.name, self._is_recording, self._reviser
-            )
-            for group in session.track_groups
-        }
-        current_playspec = self._playspecs_for_groups[self._active_track_group_name]
-        self._amio_interface.schedule_playspec_change(current_playspec, 0, 0, None)
+        if self._active_track_group_name in rebuilt:
+            current_playspec = self._playspecs_for_groups[self._active_track_group_name]
+            self._amio_interface.schedule_playspec_change(current_playspec, 0, 0, None)
+
+    @property
+    def _playspecs_for_groups(self) -> Dict[str, Playspec]:
+        return self._playspec_cache.playspecs
 
     @property
     def is_recording(self) -> bool:
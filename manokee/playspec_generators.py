@@ -1,78 +1,82 @@
-from amio import Fader, PlayspecEntry
+from amio import PlayspecEntry
 import manokee.metronome
 import manokee.revising
 import manokee.session
 import manokee.track
-from typing import Dict, Generator, Iterable, Optional
+from manokee.track_segments import PlaybackRegion, playback_regions
+from typing import Dict, Generator, Iterable, Optional, Tuple
 
 PlayspecEntryGenerator = Generator[PlayspecEntry, None, None]
 
 
+def _region_entries(
+    region: PlaybackRegion,
+    gain_l: float,
+    gain_r: float,
+    excluded: Optional[Tuple[int, int]] = None,
+) -> PlayspecEntryGenerator:
+    """
+    Generate entries playing a region of a clip, except for an optional
+    excluded range of frames.
+    """
+    clip, frame_a, frame_b, play_at_frame = region
+    if excluded is None:
+        yield PlayspecEntry(clip, frame_a, frame_b, play_at_frame, 0, gain_l, gain_r)
+        return
+    excluded_a, excluded_b = excluded
+    end = play_at_frame + frame_b - frame_a
+    if excluded_a > play_at_frame:
+        yield PlayspecEntry(
+            clip,
+            frame_a,
+            frame_a + min(excluded_a, end) - play_at_frame,
+            play_at_frame,
+            0,
+            gain_l,
+            gain_r,
+        )
+    if excluded_b < end:
+        skipped = max(excluded_b, play_at_frame) - play_at_frame
+        yield PlayspecEntry(
+            clip,
+            frame_a + skipped,
+            frame_b,
+            play_at_frame + skipped,
+            0,
+            gain_l,
+            gain_r,
+        )
+
+
 def track_playspec_entries(
     tracks: Iterable["manokee.track.Track"],
     audio_substitutes: Dict["manokee.track.Track", "manokee.revising.AudioSubstitute"],
 ) -> PlayspecEntryGenerator:
     for track in tracks:
-        clip = track.audio
+        gain_l = track.fader.left_gain_factor
+        gain_r = track.fader.right_gain_factor
         substitute = audio_substitutes.get(track)
         if substitute is not None:
             start = substitute.starting_frame
             end = substitute.starting_frame + len(substitute.clip)
+            for region in playback_regions(track.segments):
+                yield from _region_entries(region, gain_l, gain_r, (start, end))
             yield PlayspecEntry(
-                clip,
-                0,
-                start,
-                0,
-                0,
-                track.fader.left_gain_factor,
-                track.fader.right_gain_factor,
-            )
-            yield PlayspecEntry(
-                substitute.clip,
-                0,
-                end - start,
-                start,
-                0,
-                track.fader.left_gain_factor,
-                track.fader.right_gain_factor,
-            )
-            yield PlayspecEntry(
-                clip,
-                end,
-                len(clip) - end,
-                end,
-                0,
-                track.fader.left_gain_factor,
-                track.fader.right_gain_factor,
+                substitute.clip, 0, end - start, start, 0, gain_l, gain_r
             )
         else:
-            if clip is not None:
-                yield PlayspecEntry(
-                    clip,
-                    0,
-                    len(clip),
-                    0,
-                    0,
-                    track.fader.left_gain_factor,
-                    track.fader.right_gain_factor,
-                )
+            for region in playback_regions(track.segments):
+                yield from _region_entries(region, gain_l, gain_r)
 
 
 def metronome_playspec_entries(
     session: "manokee.session.Session",
-    metronome: Optional["manokee.metronome.Metronome"],
+    metronome: Optional["manokee.metronome.AnyMetronome"],
 ) -> PlayspecEntryGenerator:
     if not metronome:
         return
     metronome_fader = session.metronome_fader
     if session.metronome_enabled:
-        metronome_clip = metronome.audio_clip
-        yield PlayspecEntry(
-            metronome_clip,
-            0,
-            len(metronome_clip),
-            0,
-            len(metronome_clip),
-            metronome_fader.left_gain_factor,
-            metronome_fader.right_gain_factor,
+        yield from metronome.playspec_entries(
+            metronome_fader.left_gain_factor, metronome_fader.right_gain_factor
         )
@@ -23,8 +23,8 @@ class Reviser:
         if fragment is None or session is None:
             self.audio_substitutes = {}
             return
-        left = fragment.as_clip().channel(0)
-        right = fragment.as_clip().channel(1)
+        left = fragment.channel_clip(0)
+        right = fragment.channel_clip(1)
         self.audio_substitutes = {
             track: AudioSubstitute(
                 left if track.rec_source == "L" else right, fragment.starting_frame
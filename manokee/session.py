@@ -1,13 +1,16 @@
+import asyncio
+from concurrent.futures import Executor
 import os
 import xml.etree.ElementTree as ET
 from itertools import chain
 from pathlib import Path
-from typing import Optional, Iterable, List, Tuple
+from typing import Dict, Optional, Iterable, List, Tuple
 
 from amio import Playspec, Fader
 
 import manokee  # __version__
 import manokee.revising
+from manokee.audacity.project import AudacityProjectCache
 from manokee.mark import Mark
 from manokee.observable import ObservableMixin
 from manokee.playspec_generators import (
@@ -16,16 +19,34 @@ from manokee.playspec_generators import (
 )
 from manokee.session_history import SessionHistory
 from manokee.timing.audacity_timing import AudacityTiming
-from manokee.track import Track
+from manokee.track import Track, WrittenAudio
 from manokee.timing.fixed_bpm_timing import FixedBpmTiming
 from manokee.timing.timing import Timing
 from manokee.track_group import TrackGroup
 
 
 class Session(ObservableMixin):
-    def __init__(self, frame_rate: float, session_file_path: Optional[str] = None):
+    def __init__(
+        self,
+        frame_rate: float,
+        session_file_path: Optional[str] = None,
+        audacity_projects: Optional[AudacityProjectCache] = None,
+    ):
+        """
+        :param audacity_projects: Audacity projects parsed before, e.g.
+        when opening this session previously. By default, each Audacity
+        project is parsed once per opening of the session.
+        """
         super().__init__()
         self.frame_rate = frame_rate
+        # Bumped on modifications of the session itself (not of its tracks);
+        # the JSON representation is cached until something changes
+        self._version = 0
+        self._js_key: Optional[tuple] = None
+        self._js: Optional[dict] = None
+        self.audacity_projects = (
+            AudacityProjectCache() if audacity_projects is None else audacity_projects
+        )
         self._session_file_path: Optional[str] = None
         if session_file_path is not None and os.path.exists(session_file_path):
             if os.path.isdir(session_file_path):
@@ -108,9 +129,69 @@ class Session(ObservableMixin):
             ]
         self._are_controls_modified = False
 
-    def save(self):
+    def save(self, incremental: bool = False):
+        """
+        Save the session.
+        :param incremental: If True, only the audio modified since the last
+        save is written, as segment files referenced from the session file.
+        Otherwise, the audio of each track (including its segment files)
+        is consolidated into a single track file.
+        """
+        for track in self._prepare_save(incremental):
+            track.audio_written(track.write_audio(incremental))
+        self._write_session_file()
+
+    async def save_in_background(
+        self, incremental: bool = False, executor: Optional[Executor] = None
+    ):
+        """
+        Save the session like save() does, but encode the audio of all
+        tracks in parallel on the executor, reporting the progress
+        in track.percent_saved. The session file is replaced only once
+        all the audio has been written.
+        """
+        tracks = self._prepare_save(incremental)
+        for track in tracks:
+            track.percent_saved = 0
+        loop = asyncio.get_running_loop()
+        try:
+            written = await asyncio.gather(
+                *[
+                    loop.run_in_executor(executor, track.write_audio, incremental)
+                    for track in tracks
+                ],
+                return_exceptions=True,
+            )
+        finally:
+            for track in tracks:
+                track.percent_saved = None
+        written_audio = [
+            result for result in written if isinstance(result, WrittenAudio)
+        ]
+        if len(written_audio) < len(tracks):
+            # Don't leave the audio of the tracks that were written behind
+            for track, result in zip(tracks, written):
+                if isinstance(result, WrittenAudio):
+                    track.discard_written_audio(result)
+            raise next(
+                result for result in written if isinstance(result, BaseException)
+            )
+        for track, result in zip(tracks, written_audio):
+            track.audio_written(result)
+        self._write_session_file()
+
+    @property
+    def is_saving(self) -> bool:
+        return any(track.percent_saved is not None for track in self.tracks)
+
+    def _prepare_save(self, incremental: bool) -> List[Track]:
+        """
+        Create the session directory if needed.
+        :return: Tracks whose audio needs to be written.
+        """
         assert self._session_file_path is not None
         assert all(track.is_loaded for track in self.tracks)
+        assert not self.is_saving
 
         session_dir = os.path.dirname(self._session_file_path)
         try:
@@ -125,11 +206,13 @@ class Session(ObservableMixin):
             ):
                 raise FileExistsError("Directory is not a Manokee session")
 
-        for track in self.tracks:
-            if track.requires_audio_save:
-                track.audio.to_soundfile(track.filename)
-                track.requires_audio_save = False
+        return [
+            track
+            for track in self.tracks
+            if track.requires_audio_save or (track.segment_files and not incremental)
+        ]
 
+    def _write_session_file(self):
         root = ET.Element(
             "session", attrib={"format-name": "manokee", "format-version": "unstable"}
         )
@@ -209,6 +292,15 @@ class Session(ObservableMixin):
                     if track.audacity_track is not None:
                         attrib["audacity-track"] = track.audacity_track
                 track_el = ET.SubElement(tracks_el, "track", attrib=attrib)
+                for segment_file in track.segment_files:
+                    ET.SubElement(
+                        track_el,
+                        "segment-file",
+                        attrib={
+                            "file": segment_file.filename,
+                            "position": str(segment_file.position),
+                        },
+                    )
                 for entry in track.wall_time_recorder.entries:
                     ET.SubElement(
                         track_el,
@@ -222,7 +314,11 @@ class Session(ObservableMixin):
 
         ET.indent(root)
         tree = ET.ElementTree(root)
-        tree.write(self._session_file_path)
+        # Write to a temporary file first, so that the session file
+        # is replaced atomically
+        temp_path = self._session_file_path + ".tmp"
+        tree.write(temp_path)
+        os.replace(temp_path, self._session_file_path)
         self._are_controls_modified = False
 
     @property
@@ -263,6 +359,11 @@ class Session(ObservableMixin):
 
     def set_mark_at_beat(self, name, beat):
         self.marks[name] = Mark(beat=beat)
+        self._version += 1
+
+    def _notify_observers(self):
+        self._version += 1
+        super()._notify_observers()
 
     def track_for_name(self, name: str) -> Optional[Track]:
         for track in self.tracks:
@@ -354,12 +455,20 @@ class Session(ObservableMixin):
         self.metronome_fader.pan = new_pan
         self._notify_observers()
 
-    def make_playspec_for_track_group(
-        self,
-        track_group_name: str,
-        is_recording: bool,
-        reviser: "manokee.revising.Reviser",
-    ) -> Playspec:
+    def page_tracks(self, frame_ranges: List[Tuple[int, int]]) -> bool:
+        """
+        Request the given frame ranges to be resident in all paged tracks.
+        :return: Whether the resident audio of any paged track has changed
+        since the last call, in which case playspecs need recreating.
+        """
+        changed = False
+        for track in self.tracks:
+            if track.pager is not None:
+                track.pager.request(frame_ranges)
+                changed = track.pager.take_changes() or changed
+        return changed
+
+    def track_audibility(self, is_recording: bool) -> Dict[Track, bool]:
         # First, calculate basic audibility of tracks from solo and mute values
         is_soloed = any(track.is_solo for track in self.tracks)
         audibility = {
@@ -371,7 +480,15 @@ class Session(ObservableMixin):
             for track in self.tracks:
                 if track.is_rec:
                     audibility[track] = False
+        return audibility
 
+    def make_playspec_for_track_group(
+        self,
+        track_group_name: str,
+        is_recording: bool,
+        reviser: "manokee.revising.Reviser",
+    ) -> Playspec:
+        audibility = self.track_audibility(is_recording)
         track_group = self.track_group_by_name(track_group_name)
         return list(
             chain(
@@ -386,10 +503,35 @@ class Session(ObservableMixin):
     def to_js(self) -> dict:
         """
         Make a JSON-line representation of the session, to be sent
-        to the client.
+        to the client. It's cached, and built again only when the session
+        or any of its tracks changes.
         :return: A Python dictionary with JSON-like session representation.
+        It must not be modified.
         """
+        key = (
+            self._version,
+            self.name,
+            self.are_controls_modified,
+            self._time_signature,
+            self.metronome_enabled,
+            self.metronome_fader.vol_factor,
+            self.metronome_fader.pan,
+            tuple(
+                (
+                    group.name,
+                    group.timing,
+                    tuple(track.version for track in group.tracks),
+                )
+                for group in self.track_groups
+            ),
+            self.history.version,
+        )
+        if self._js is None or self._js_key != key:
+            self._js_key = key
+            self._js = self._build_js()
+        return self._js
 
+    def _build_js(self) -> dict:
         def timing_to_js(timing: Timing) -> dict:
             if isinstance(timing, FixedBpmTiming):
                 return {"type": "fixed-bpm", "bpm": timing.bpm}
@@ -9,6 +9,10 @@ class SessionHistory:
         self.repo = None
         self.status = None
         self.log = None
+        # Bumped by refresh(); the JSON representation is cached until then
+        self._version = 0
+        self._js_version: Optional[int] = None
+        self._js: Optional[dict] = None
         if self.session_path is not None:
             try:
                 self.repo = pygit2.Repository(self.session_path)
@@ -30,6 +34,7 @@ class SessionHistory:
         # TODO: Don't read the whole log each time refresh() is called, but rather
         # try to incrementally check if there are new commits compared to those we know
 
+        self._version += 1
         if not self.repo:
             self.status = None
             self.log = None
@@ -41,8 +46,18 @@ class SessionHistory:
             for commit in self.repo.walk(self.repo.head.target)
         ]
 
-    def to_js(self):
-        return {
-            "status": self.status,
-            "log": self.log,
-        }
+    @property
+    def version(self) -> int:
+        """
+        Changes whenever the JSON representation of the history changes.
+        """
+        return self._version
+
+    def to_js(self) -> dict:
+        if self._js is None or self._js_version != self._version:
+            self._js_version = self._version
+            self._js = {
+                "status": self.status,
+                "log": self.log,
+            }
+        return self._js
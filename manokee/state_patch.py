@@ -0,0 +1,42 @@
+from typing import Any, List
+
+import jsonpatch
+
+
+def make_patch(src: Any, dst: Any) -> jsonpatch.JsonPatch:
+    """
+    Make a JSON patch turning src into dst, like jsonpatch.make_patch,
+    but without comparing subtrees that are the same object in src and dst.
+    State that is cached until it changes (like the JSON representations
+    of tracks) is therefore not compared again while it stays unchanged.
+    """
+    ops: List[dict] = []
+    _diff("", src, dst, ops)
+    return jsonpatch.JsonPatch(ops)
+
+
+def _escape(key: Any) -> str:
+    # As in a JSON pointer
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _diff(path: str, src: Any, dst: Any, ops: List[dict]):
+    if src is dst:
+        return
+    if isinstance(src, dict) and isinstance(dst, dict) and src.keys() == dst.keys():
+        for key in dst:
+            _diff(f"{path}/{_escape(key)}", src[key], dst[key], ops)
+    elif isinstance(src, list) and isinstance(dst, list) and len(src) == len(dst):
+        for i, (src_item, dst_item) in enumerate(zip(src, dst)):
+            _diff(f"{path}/{i}", src_item, dst_item, ops)
+    elif not isinstance(src, (dict, list)) and not isinstance(dst, (dict, list)):
+        # E.g. 1 and True are equal, but they aren't the same in JSON
+        if type(src) is not type(dst) or src != dst:
+            ops.append({"op": "replace", "path": path, "value": dst})
+    else:
+        # Added or removed keys or items
+        for op in jsonpatch.make_patch(src, dst):
+            op["path"] = path + op["path"]
+            if "from" in op:
+                op["from"] = path + op["from"]
+            ops.append(op)
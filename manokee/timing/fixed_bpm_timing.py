@@ -1,4 +1,5 @@
 from manokee.timing.timing import Timing
+import numpy as np
 
 
 class FixedBpmTiming(Timing):
@@ -11,3 +12,9 @@ class FixedBpmTiming(Timing):
 
     def seconds_to_beat(self, time: float) -> float:
         return time / 60 * self.bpm
+
+    def beat_to_seconds_array(self, beat_numbers: np.ndarray) -> np.ndarray:
+        return np.asarray(beat_numbers, float) * 60 / self.bpm
+
+    def seconds_to_beat_array(self, times: np.ndarray) -> np.ndarray:
+        return np.asarray(times, float) / 60 * self.bpm
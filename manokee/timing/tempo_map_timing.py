@@ -0,0 +1,175 @@
+from bisect import bisect_right
+from collections import namedtuple
+from math import ceil, floor
+from typing import List, Sequence, Tuple
+
+from manokee.timing.timing import Timing
+import numpy as np
+
+
+class MeterChange(namedtuple("MeterChange", "beat beats_per_bar")):
+    """
+    From the given beat on, bars have beats_per_bar beats.
+    """
+
+    pass
+
+
+class TempoMapTiming(Timing):
+    """
+    Piecewise linear tempo map, defined by the times of consecutive beats.
+    Beats before the first one and after the last one are extrapolated
+    with the average beat length.
+
+    Converting beats to seconds indexes the table of beat times directly.
+    Converting seconds to beats bisects it, but first tries the segment
+    of the previous conversion and the one after it, so following
+    the playhead takes constant time.
+
+    Meter changes split the map into sections with different numbers
+    of beats per bar. Without them, bars are as long as the time signature
+    passed to bar_and_beat and bar_to_beat.
+    """
+
+    def __init__(
+        self, beat_times: Sequence[float], meter_changes: Sequence[MeterChange] = ()
+    ):
+        """
+        :param beat_times: Times (in seconds) of beats 0, 1, 2, etc.;
+        at least 2 of them.
+        :param meter_changes: If any, the first one must be at beat 0.
+        """
+        if len(beat_times) < 2:
+            raise ValueError("A tempo map needs at least 2 beats")
+        self._times = np.asarray(beat_times, float)
+        if np.any(np.diff(self._times) <= 0):
+            raise ValueError("Beat times must be increasing")
+        # bisect is faster on lists than on NumPy arrays
+        self._times_list: List[float] = self._times.tolist()
+        self._last_beat = len(self._times_list) - 1
+        self.average_beat_length = (
+            self._times_list[-1] - self._times_list[0]
+        ) / self._last_beat
+        # Segment found by the previous seconds_to_beat
+        self._hint = 0
+
+        meter_changes = sorted(meter_changes)
+        if meter_changes and meter_changes[0].beat != 0:
+            raise ValueError("The first meter change must be at beat 0")
+        self._meter_beats = [change.beat for change in meter_changes]
+        self._beats_per_bar = [change.beats_per_bar for change in meter_changes]
+        # Number of the first bar of each meter section; an incomplete bar
+        # before a meter change counts as a bar
+        self._meter_bars = [0]
+        for i in range(1, len(meter_changes)):
+            beats = self._meter_beats[i] - self._meter_beats[i - 1]
+            self._meter_bars.append(
+                self._meter_bars[-1] + ceil(beats / self._beats_per_bar[i - 1])
+            )
+
+    @classmethod
+    def from_bpm(
+        cls, bpm: float, meter_changes: Sequence[MeterChange] = ()
+    ) -> "TempoMapTiming":
+        return cls([0, 60 / bpm], meter_changes)
+
+    @classmethod
+    def from_timing(
+        cls,
+        timing: Timing,
+        beats: int,
+        meter_changes: Sequence[MeterChange] = (),
+    ) -> "TempoMapTiming":
+        """
+        Precompute the first beats (from 0 to beats) of another timing.
+        """
+        return cls(
+            timing.beat_to_seconds_array(np.arange(beats + 1)).tolist(), meter_changes
+        )
+
+    def beat_to_seconds(self, beat_number: float) -> float:
+        times = self._times_list
+        if beat_number < 0:
+            return times[0] + beat_number * self.average_beat_length
+        if beat_number > self._last_beat:
+            return (
+                times[-1] + (beat_number - self._last_beat) * self.average_beat_length
+            )
+        i = min(floor(beat_number), self._last_beat - 1)
+        return times[i] + (times[i + 1] - times[i]) * (beat_number - i)
+
+    def seconds_to_beat(self, time: float) -> float:
+        times = self._times_list
+        if time < times[0]:
+            return (time - times[0]) / self.average_beat_length
+        if time >= times[-1]:
+            return self._last_beat + (time - times[-1]) / self.average_beat_length
+        i = self._segment(time)
+        return i + (time - times[i]) / (times[i + 1] - times[i])
+
+    def _segment(self, time: float) -> int:
+        # The segment from beat i to i + 1 containing time, which is within
+        # the tempo map
+        times = self._times_list
+        i = self._hint
+        if not times[i] <= time < times[i + 1]:
+            if i + 2 <= self._last_beat and times[i + 1] <= time < times[i + 2]:
+                i += 1
+            else:
+                i = bisect_right(times, time) - 1
+            self._hint = i
+        return i
+
+    def beat_to_seconds_array(self, beat_numbers: np.ndarray) -> np.ndarray:
+        beat_numbers = np.asarray(beat_numbers, float)
+        i = np.clip(np.floor(beat_numbers), 0, self._last_beat - 1).astype(int)
+        interpolated = self._times[i] + (self._times[i + 1] - self._times[i]) * (
+            beat_numbers - i
+        )
+        return np.where(
+            beat_numbers < 0,
+            self._times[0] + beat_numbers * self.average_beat_length,
+            np.where(
+                beat_numbers > self._last_beat,
+                self._times[-1]
+                + (beat_numbers - self._last_beat) * self.average_beat_length,
+                interpolated,
+            ),
+        )
+
+    def seconds_to_beat_array(self, times: np.ndarray) -> np.ndarray:
+        times = np.asarray(times, float)
+        i = np.clip(
+            np.searchsorted(self._times, times, "right") - 1, 0, self._last_beat - 1
+        )
+        interpolated = i + (times - self._times[i]) / (
+            self._times[i + 1] - self._times[i]
+        )
+        return np.where(
+            times < self._times[0],
+            (times - self._times[0]) / self.average_beat_length,
+            np.where(
+                times >= self._times[-1],
+                self._last_beat + (times - self._times[-1]) / self.average_beat_length,
+                interpolated,
+            ),
+        )
+
+    def bar_and_beat(self, beat_number: float, beats_per_bar: int) -> Tuple[int, int]:
+        if not self._meter_beats:
+            return super().bar_and_beat(beat_number, beats_per_bar)
+        beat = int(beat_number)
+        section = max(0, bisect_right(self._meter_beats, beat) - 1)
+        bar, beat_in_bar = divmod(
+            beat - self._meter_beats[section], self._beats_per_bar[section]
+        )
+        return self._meter_bars[section] + bar, beat_in_bar
+
+    def bar_to_beat(self, bar: float, beats_per_bar: int) -> float:
+        if not self._meter_beats:
+            return super().bar_to_beat(bar, beats_per_bar)
+        section = max(0, bisect_right(self._meter_bars, bar) - 1)
+        return (
+            self._meter_beats[section]
+            + (bar - self._meter_bars[section]) * self._beats_per_bar[section]
+        )
@@ -1,3 +1,8 @@
+from typing import Tuple
+
+import numpy as np
+
+
 class Timing:
     def beat_to_seconds(self, beat_number: float) -> float:
         """
@@ -14,3 +19,33 @@ class Timing:
         :return: Beat number counted from 0.
         """
         raise NotImplementedError
+
+    def beat_to_seconds_array(self, beat_numbers: np.ndarray) -> np.ndarray:
+        """
+        Convert an array of beat numbers to seconds, like beat_to_seconds.
+        Subclasses should override it with a vectorized implementation.
+        :return: Float array of the same shape.
+        """
+        return np.vectorize(self.beat_to_seconds, otypes=[float])(beat_numbers)
+
+    def seconds_to_beat_array(self, times: np.ndarray) -> np.ndarray:
+        """
+        Convert an array of times in seconds to beat numbers, like
+        seconds_to_beat. Subclasses should override it with a vectorized
+        implementation.
+        :return: Float array of the same shape.
+        """
+        return np.vectorize(self.seconds_to_beat, otypes=[float])(times)
+
+    def bar_and_beat(self, beat_number: float, beats_per_bar: int) -> Tuple[int, int]:
+        """
+        :return: Bar number and beat number within the bar (both counted
+        from 0) of the beat.
+        """
+        return divmod(int(beat_number), beats_per_bar)
+
+    def bar_to_beat(self, bar: float, beats_per_bar: int) -> float:
+        """
+        :return: Beat number of the start of the bar.
+        """
+        return bar * beats_per_bar
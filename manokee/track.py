@@ -1,18 +1,32 @@
 import asyncio
+from collections import namedtuple
+from concurrent.futures import Executor
+import itertools
 import os
 import xml.etree.ElementTree as ET
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, List, Optional, Tuple
 
 from amio import AudioClip, Fader
+import numpy as np
 import soundfile as sf
 
 import manokee.audacity.project as aup
 import manokee.session
+from manokee.compact_audio import CompactAudioClip, convert_to_sample_format
+from manokee.decoding import DecodeEngine, default_decode_engine
 from manokee.input_recorder import InputFragment
 from manokee.timing.timing import Timing
-from manokee.timing.audacity_timing import AudacityTiming
+from manokee.track_pager import TrackPager
+from manokee.track_segments import (
+    Segment,
+    SegmentSource,
+    add_range,
+    flatten,
+    overlay,
+    playback_regions,
+)
 from manokee.wall_time_recorder import WallTimeEntry, WallTimeRecorder
 
 
@@ -26,6 +40,65 @@ def parse_timedelta(s: str) -> timedelta:
     )
 
 
+class SegmentFile(namedtuple("SegmentFile", "filename position")):
+    """
+    An audio file, relative to the session directory, holding audio
+    which has been saved incrementally and is placed on top of
+    the track file audio at a given position.
+    """
+
+    pass
+
+
+class WrittenAudio(namedtuple("WrittenAudio", "segment_files audio temp_filename")):
+    """
+    Result of Track.write_audio: the new segment files after
+    an incremental save, or the flattened audio after a full save (None
+    for a paged track, whose audio is written block by block), together with
+    the temporary file it was written to. That file replaces the track file
+    in Track.audio_written.
+    """
+
+    pass
+
+
+def _write_soundfile(
+    clip: AudioClip, filename: str, progress_callback: Callable[[int], None]
+) -> None:
+    blocksize = int(10 * clip.frame_rate)
+    with sf.SoundFile(filename, "w", int(clip.frame_rate), clip.channels) as f:
+        for start in range(0, len(clip), blocksize):
+            block = clip.array[start : start + blocksize]
+            f.write(block)
+            progress_callback(len(block))
+
+
+def _write_segments(
+    segments: List[Segment],
+    channels: int,
+    frame_rate: float,
+    start: int,
+    end: int,
+    filename: str,
+    progress_callback: Callable[[int], None],
+) -> None:
+    # Rendered block by block, so that paged audio is never read as a whole
+    blocksize = int(10 * frame_rate)
+    with sf.SoundFile(filename, "w", int(frame_rate), channels) as f:
+        for block_start in range(start, end, blocksize):
+            block_end = min(block_start + blocksize, end)
+            f.write(
+                flatten(segments, channels, frame_rate, block_start, block_end).array
+            )
+            progress_callback(block_end - block_start)
+
+
+# Versions of tracks. Taking the next one is atomic, unlike incrementing
+# an attribute, and tracks are also modified on worker threads (e.g. their
+# save progress).
+_track_versions = itertools.count(1)
+
+
 @dataclass(eq=False)
 class Track:
     session: "manokee.session.Session"
@@ -36,10 +109,21 @@ class Track:
     frame_rate: float
 
     percent_loaded: Optional[float]
+    # Set while the track audio is being saved in the background
+    percent_saved: Optional[float] = field(default=None, init=False)
 
-    audio: AudioClip
+    # Track audio: the audio loaded from the track file, with committed
+    # takes placed on top of it
+    segments: List[Segment]
     wall_time_recorder: WallTimeRecorder
 
+    # If set, the audio loaded from the track file is read lazily
+    # by the pager
+    pager: Optional[TrackPager] = None
+    # Sample format in which the track audio is kept in memory
+    # (see DecodeEngine)
+    sample_format: str = "float"
+
     average_bpm: Optional[float] = None
     audacity_project: Optional[aup.AudacityProject] = None
     aup_file_path: Optional[str] = None
@@ -47,11 +131,33 @@ class Track:
     beats_in_audacity_beat: int = 1
     source: str = "internal"
     requires_audio_save: bool = False
+    segment_files: List[SegmentFile] = field(default_factory=list)
+    # Frame ranges modified since the track audio was last saved
+    dirty_ranges: List[Tuple[int, int]] = field(default_factory=list)
 
     is_rec: bool = False
     is_mute: bool = False
     is_solo: bool = False
 
+    # Replaced by a new version whenever an attribute is set, so that
+    # the JSON representation is only built again after a change
+    _version: int = field(default=0, init=False, repr=False)
+    _js_key: Optional[tuple] = field(default=None, init=False, repr=False)
+    _js: Optional[dict] = field(default=None, init=False, repr=False)
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name not in ("_version", "_js_key", "_js"):
+            super().__setattr__("_version", next(_track_versions))
+
+    @property
+    def version(self) -> Tuple[int, float, float]:
+        """
+        Changes whenever the JSON representation of the track changes.
+        """
+        # The fader is modified in place, so it isn't covered by _version
+        return (self._version, self.fader.vol_factor, self.fader.pan)
+
     @classmethod
     def empty(cls, session, name: str, frame_rate: float):
         return cls(
@@ -61,7 +167,7 @@ class Track:
             fader=Fader(),
             frame_rate=frame_rate,
             percent_loaded=0,
-            audio=AudioClip.zeros(1, 1, frame_rate),
+            segments=[],
             wall_time_recorder=WallTimeRecorder(),
         )
 
@@ -69,10 +175,10 @@ class Track:
     def from_xml(cls, session, frame_rate: float, element: ET.Element):
         aup_file_path = element.attrib.get("audacity-project")
         if element.attrib.get("source", "internal") == "audacity-project":
-            percent_loaded = None
-            audacity_project = aup.parse(session.relative_path(aup_file_path))
+            audacity_project = session.audacity_projects.parse(
+                session.relative_path(aup_file_path)
+            )
         else:
-            percent_loaded = 0
             audacity_project = None
 
         result = cls(
@@ -84,8 +190,8 @@ class Track:
             rec_source=element.attrib["rec-source"],
             fader=Fader(float(element.attrib["vol"]), float(element.attrib["pan"])),
             frame_rate=frame_rate,
-            percent_loaded=percent_loaded,
-            audio=AudioClip.zeros(1, 1, frame_rate),
+            percent_loaded=0,
+            segments=[],
             wall_time_recorder=WallTimeRecorder(
                 [
                     WallTimeEntry(
@@ -103,13 +209,11 @@ class Track:
                 element.attrib.get("beats-in-audacity-beat", "1")
             ),
             source=element.attrib.get("source", "internal"),
+            segment_files=[
+                SegmentFile(element.attrib["file"], int(element.attrib["position"]))
+                for element in element.findall("segment-file")
+            ],
         )
-        if result.is_audacity_project:
-            result.audio = result.audacity_project.as_audio_clip(  # type: ignore
-                track=result.audacity_track
-            )
-            result.audio.writeable = False
-
         result._calculate_average_bpm()
 
         return result
@@ -118,36 +222,267 @@ class Track:
     def is_loaded(self):
         return self.percent_loaded is None
 
-    async def load(self):
+    async def load(self, decode_engine: Optional[DecodeEngine] = None):
         if self.is_loaded:
             return
 
-        try:
-            if not self.filename or os.path.getsize(self.filename) == 0:
-                raise FileNotFoundError
-            f = sf.SoundFile(self.filename)
-        except FileNotFoundError:
-            self.percent_loaded = None
-        else:
-            self.audio = AudioClip.zeros(f.frames, f.channels, f.samplerate)
-            self.audio.writeable = True
+        if decode_engine is None:
+            decode_engine = default_decode_engine()
+        self.sample_format = decode_engine.sample_format
 
-            read_so_far = 0
-            blocksize = 30 * f.samplerate  # load in 30-second chunks
-            for block in f.blocks(blocksize=blocksize):
-                self.audio.overwrite(AudioClip(block, f.samplerate), read_so_far)
-                read_so_far += blocksize
-                self.percent_loaded = 100 * read_so_far / f.frames
-                await asyncio.sleep(0)
+        def on_progress(percent: float):
+            self.percent_loaded = percent
 
-            f.close()
-            self.audio.writeable = False
-            self.percent_loaded = None
+        source: Optional[SegmentSource] = None
+        if self.is_audacity_project:
+            source = await decode_engine.import_audacity_track(
+                self.audacity_project,  # type: ignore
+                self.audacity_track,
+                on_progress,
+            )
+        elif self.filename and decode_engine.page_secs is not None:
+            self.pager = decode_engine.open_pager(self.filename)
+            source = self.pager
+        elif self.filename:
+            source = await decode_engine.decode(self.filename, on_progress)
+        if source is not None:
+            self.segments = [Segment(0, source, 0, len(source))]
+        for segment_file in self.segment_files:
+            clip = await decode_engine.decode(
+                self._path_in_session(segment_file.filename), lambda _: None
+            )
+            if clip is not None:
+                self.segments = overlay(
+                    self.segments, Segment(segment_file.position, clip, 0, len(clip))
+                )
+        self.percent_loaded = None
 
     @property
-    def filename(self):
+    def filename(self) -> Optional[str]:
         return self.session.relative_path(self.name + ".flac")
 
+    def _path_in_session(self, filename: str) -> str:
+        # Segment files exist only in sessions saved to disk
+        path = self.session.relative_path(filename)
+        assert path is not None
+        return path
+
+    @property
+    def channels(self) -> int:
+        return max((segment.source.channels for segment in self.segments), default=1)
+
+    def __len__(self) -> int:
+        return max((segment.end for segment in self.segments), default=0)
+
+    @property
+    def memory_usage_mb(self) -> float:
+        sources = {id(segment.source): segment.source for segment in self.segments}
+        return sum(source.memory_usage_mb for source in sources.values())
+
+    @property
+    def playback_memory_usage_mb(self) -> float:
+        """
+        Memory used by the native I/O thread's copies (16-bit) of the clips
+        being played.
+        """
+        clips = {
+            id(region.clip): region.clip for region in playback_regions(self.segments)
+        }
+        return (
+            sum(len(clip) * clip.channels * 2 for clip in clips.values()) / 1024 / 1024
+        )
+
+    def flatten(self) -> AudioClip:
+        """
+        Render the track audio into a single clip. Paged audio is read
+        from disk, so this can take a while for long tracks.
+        """
+        return flatten(self.segments, self.channels, self.frame_rate)
+
+    @property
+    def requires_compaction(self) -> bool:
+        return len(self.segments) > 1 and self.pager is None
+
+    async def compact(self, executor: Optional[Executor] = None) -> None:
+        """
+        Replace the segments with a single, flattened segment. Flattening
+        is done on the executor; if the segments change in the meantime,
+        the result is discarded.
+        """
+        segments = self.segments
+        if not self.requires_compaction:
+            return
+        channels = self.channels
+
+        def flatten_segments():
+            return convert_to_sample_format(
+                flatten(segments, channels, self.frame_rate), self.sample_format
+            )
+
+        audio = await asyncio.get_running_loop().run_in_executor(
+            executor, flatten_segments
+        )
+        if self.segments is segments:
+            self.segments = [Segment(0, audio, 0, len(audio))]
+
+    def write_audio(self, incremental: bool = False) -> "WrittenAudio":
+        """
+        Write the track audio to disk, reporting the progress in
+        percent_saved (if not None). The track itself isn't modified,
+        so this can run on a worker thread; audio_written must be called
+        with the result afterwards.
+        :param incremental: If True, only the frame ranges modified since
+        the last save are written, as new segment files. Otherwise,
+        the whole track is written to the track file.
+        """
+        ranges = self.dirty_ranges if incremental else [(0, len(self))]
+        total_frames = sum(end - start for start, end in ranges)
+        written_frames = 0
+
+        def on_progress(frames: int):
+            nonlocal written_frames
+            written_frames += frames
+            if self.percent_saved is not None:
+                self.percent_saved = 100 * written_frames / total_frames
+
+        if incremental:
+            segment_files = []
+            try:
+                for start, end in ranges:
+                    segment_file = SegmentFile(self._unused_segment_filename(), start)
+                    segment_files.append(segment_file)
+                    _write_segments(
+                        self.segments,
+                        self.channels,
+                        self.frame_rate,
+                        start,
+                        end,
+                        self._path_in_session(segment_file.filename),
+                        on_progress,
+                    )
+            except BaseException:
+                self.discard_written_audio(WrittenAudio(segment_files, None, None))
+                raise
+            return WrittenAudio(segment_files, None, None)
+        # The track file is replaced only once the audio is completely
+        # written, so an interrupted save leaves the previous one intact
+        temp_filename = self._path_in_session(self.name + ".saving.flac")
+        audio = None
+        try:
+            if self.pager is not None:
+                # The pager keeps reading the previous track file until
+                # audio_written replaces it
+                _write_segments(
+                    self.segments,
+                    self.channels,
+                    self.frame_rate,
+                    0,
+                    len(self),
+                    temp_filename,
+                    on_progress,
+                )
+            else:
+                audio = self.flatten()
+                _write_soundfile(audio, temp_filename, on_progress)
+        except BaseException:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            raise
+        if audio is None:
+            return WrittenAudio([], None, temp_filename)
+        return WrittenAudio(
+            [], convert_to_sample_format(audio, self.sample_format), temp_filename
+        )
+
+    def audio_written(self, written: "WrittenAudio") -> None:
+        """
+        Update the track after its audio has been written by write_audio.
+        After a full save, the segment files are consolidated, so they are
+        removed.
+        """
+        if written.temp_filename is None:
+            self.segment_files = self.segment_files + written.segment_files
+        else:
+            os.replace(
+                written.temp_filename, self._path_in_session(self.name + ".flac")
+            )
+            for segment_file in self.segment_files:
+                try:
+                    os.remove(self._path_in_session(segment_file.filename))
+                except FileNotFoundError:
+                    pass
+            self.segment_files = []
+            if self.pager is not None:
+                self.pager = self.pager.reopened()
+                self.segments = [Segment(0, self.pager, 0, len(self.pager))]
+            else:
+                self.segments = [Segment(0, written.audio, 0, len(written.audio))]
+        self.dirty_ranges = []
+        self.requires_audio_save = False
+
+    def discard_written_audio(self, written: "WrittenAudio") -> None:
+        """
+        Remove the files written by write_audio, when the save they were
+        written for is abandoned instead of passed to audio_written.
+        """
+        paths = [
+            self._path_in_session(segment_file.filename)
+            for segment_file in written.segment_files
+        ]
+        if written.temp_filename is not None:
+            paths.append(written.temp_filename)
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _unused_segment_filename(self) -> str:
+        for i in itertools.count(len(self.segment_files) + 1):
+            filename = f"{self.name}.segment-{i}.flac"
+            if not os.path.exists(self._path_in_session(filename)):
+                return filename
+        assert False
+
+    def create_metering_data(
+        self, metering_fps: float = 24
+    ) -> Tuple[int, np.ndarray, np.ndarray]:
+        """
+        Calculate metering data like AudioClip.create_metering_data does,
+        segment by segment. Gaps between segments and paged segments are
+        metered as silence. Compact segments are converted to float block
+        by block.
+        """
+        metering_window = self.frame_rate / metering_fps
+        rms = []
+        peak = []
+        end = 0
+        for segment in self.segments:
+            if isinstance(segment.source, AudioClip):
+                gap = int((segment.position - end) // metering_window)
+                _, segment_rms, segment_peak = AudioClip(
+                    segment.source.array[
+                        segment.source_offset : segment.source_offset + segment.length
+                    ],
+                    segment.source.frame_rate,
+                ).create_metering_data(metering_fps)
+                rms += [np.full(gap, -127, np.int8), segment_rms]
+                peak += [np.full(gap, -127, np.int8), segment_peak]
+                end = segment.end
+            elif isinstance(segment.source, CompactAudioClip):
+                gap = int((segment.position - end) // metering_window)
+                _, segment_rms, segment_peak = segment.source.create_metering_data(
+                    segment.source_offset, segment.length, metering_fps
+                )
+                rms += [np.full(gap, -127, np.int8), segment_rms]
+                peak += [np.full(gap, -127, np.int8), segment_peak]
+                end = segment.end
+        gap = int((len(self) - end) // metering_window)
+        rms.append(np.full(gap, -127, np.int8))
+        peak.append(np.full(gap, -127, np.int8))
+        rms_array = np.concatenate(rms)
+        return len(rms_array), rms_array, np.concatenate(peak)
+
     @property
     def is_audacity_project(self) -> bool:
         return self.source == "audacity-project"
@@ -157,15 +492,23 @@ class Track:
             return
         if not self.is_loaded:
             raise RuntimeError("Track not fully loaded yet")
+        if self.percent_saved is not None:
+            raise RuntimeError("Track is being saved")
         if fragment.starting_frame is None:
             raise RuntimeError("Invalid InputFragment")
-        self.audio.writeable = True
-        self.audio.overwrite(
-            fragment.as_clip().channel(0 if self.rec_source == "L" else 1),
-            fragment.starting_frame,
-            extend_to_fit=True,
+        take = convert_to_sample_format(
+            fragment.channel_clip(0 if self.rec_source == "L" else 1),
+            self.sample_format,
         )
-        self.audio.writeable = False
+        skipped = max(0, -fragment.starting_frame)
+        if skipped < len(take):
+            segment = Segment(
+                fragment.starting_frame + skipped, take, skipped, len(take) - skipped
+            )
+            self.segments = overlay(self.segments, segment)
+            self.dirty_ranges = add_range(
+                self.dirty_ranges, (segment.position, segment.end)
+            )
         self.wall_time_recorder.add(
             timedelta(seconds=fragment.starting_frame / fragment.frame_rate),
             fragment.start_wall_time,
@@ -174,7 +517,15 @@ class Track:
         self.requires_audio_save = True
 
     def to_js(self) -> dict:
-        return {
+        """
+        :return: The cached JSON representation, if nothing has changed
+        since it was built. It must not be modified.
+        """
+        key = self.version
+        if self._js is not None and self._js_key == key:
+            return self._js
+        self._js_key = key
+        self._js = {
             "name": self.name,
             "is_rec": self.is_rec,
             "is_mute": self.is_mute,
@@ -185,17 +536,17 @@ class Track:
             "requires_audio_save": self.requires_audio_save,
             "is_loaded": self.is_loaded,
             "percent_loaded": self.percent_loaded,
+            "percent_saved": self.percent_saved,
             "source": self.source,
         }
+        return self._js
 
     def _calculate_average_bpm(self) -> None:
         if self.is_audacity_project:
+            # The average beat length of the Audacity timing of the project
+            positions = self.audacity_project.label_positions()  # type: ignore
             self.average_bpm = (
-                60.0
-                / AudacityTiming(
-                    project=self.audacity_project,  # type: ignore
-                    aup_file_path=self.aup_file_path,  # type: ignore
-                ).average_beat_length
+                60.0 * (len(positions) - 1) / (positions[-1] - positions[0])
             )
         else:
             self.average_bpm = None
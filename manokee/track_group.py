@@ -1,10 +1,9 @@
 import xml.etree.ElementTree as ET
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Hashable, List
 
 import manokee.metronome
 import manokee.track
-from manokee.audacity.project import parse as parse_aup
 from manokee.timing.audacity_timing import AudacityTiming
 from manokee.timing.fixed_bpm_timing import FixedBpmTiming
 from manokee.timing.timing import Timing
@@ -32,7 +31,9 @@ class TrackGroup:
             timing: Timing = FixedBpmTiming(float(timing_el.attrib["beats-per-minute"]))
         elif timing_el.tag == "audacity-timing":
             aup_file_path = timing_el.attrib["audacity-project"]
-            audacity_project = parse_aup(session.relative_path(aup_file_path))
+            audacity_project = session.audacity_projects.parse(
+                session.relative_path(aup_file_path)
+            )
             beats_in_audacity_beat = int(timing_el.attrib["beats-in-audacity-beat"])
             timing = AudacityTiming(
                 project=audacity_project,
@@ -53,7 +54,18 @@ class TrackGroup:
             timing=timing,
         )
 
-    def create_metronome(self) -> Optional[manokee.metronome.Metronome]:
+    def metronome_key(self) -> Hashable:
+        """
+        :return: A value identifying the metronome of this track group.
+        The metronome has to be recreated when it changes.
+        """
+        if isinstance(self.timing, FixedBpmTiming):
+            tempo: Hashable = 60 / self.timing.average_beat_length
+        else:
+            tempo = self.timing
+        return tempo, self.session.time_signature, self.session.frame_rate
+
+    def create_metronome(self) -> manokee.metronome.AnyMetronome:
         if isinstance(self.timing, FixedBpmTiming):
             return manokee.metronome.Metronome(
                 bpm=60 / self.timing.average_beat_length,
@@ -61,5 +73,8 @@ class TrackGroup:
                 frame_rate=self.session.frame_rate,
             )
         else:
-            # TODO Implement metronome for any type of timing
-            return None
+            return manokee.metronome.TempoMapMetronome(
+                timing=self.timing,
+                time_signature=self.session.time_signature,
+                frame_rate=self.session.frame_rate,
+            )
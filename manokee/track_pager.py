@@ -0,0 +1,130 @@
+from concurrent.futures import Executor
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+
+from amio import AudioClip
+import numpy as np
+import soundfile as sf
+
+FrameRange = Tuple[int, int]
+
+
+def _read_page(filename: str, start: int, length: int) -> AudioClip:
+    with sf.SoundFile(filename) as f:
+        f.seek(start)
+        clip = AudioClip(f.read(length, dtype="float32", always_2d=True), f.samplerate)
+    clip.writeable = False
+    return clip
+
+
+class TrackPager:
+    """
+    Lazily loaded track audio. The audio file is split into fixed-size
+    pages, and only the pages covering the requested frame ranges (around
+    the playhead and the loop region) are kept in memory. Missing pages
+    are read from disk on the executor, ahead of the transport.
+    """
+
+    def __init__(self, filename: str, page_secs: float, executor: Executor):
+        info = sf.info(filename)
+        self._filename = filename
+        self._executor = executor
+        self._length = info.frames
+        self._channels = info.channels
+        self._frame_rate = info.samplerate
+        self._page_frames = max(1, int(page_secs * info.samplerate))
+        self._lock = threading.Lock()
+        self._pages: Dict[int, AudioClip] = {}
+        self._pending: Set[int] = set()
+        self._wanted: Set[int] = set()
+        self._changed = False
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def channels(self) -> int:
+        return self._channels
+
+    @property
+    def frame_rate(self) -> float:
+        return self._frame_rate
+
+    @property
+    def page_frames(self) -> int:
+        return self._page_frames
+
+    @property
+    def memory_usage_mb(self) -> float:
+        with self._lock:
+            return sum(page.memory_usage_mb for page in self._pages.values())
+
+    def reopened(self) -> "TrackPager":
+        """
+        :return: A new pager with no resident pages, reading the same file
+        (e.g., after the file has been rewritten).
+        """
+        return TrackPager(
+            self._filename, self._page_frames / self._frame_rate, self._executor
+        )
+
+    def read(self, start: int, length: int) -> np.ndarray:
+        """
+        Read frames directly from disk, bypassing the pages.
+        """
+        return _read_page(self._filename, start, length).array
+
+    def request(self, frame_ranges: Iterable[FrameRange]) -> None:
+        """
+        Make the pages covering the given frame ranges resident, and
+        release all the other pages. Pages are read asynchronously.
+        """
+        last_page = (self._length - 1) // self._page_frames
+        wanted: Set[int] = set()
+        for start, end in frame_ranges:
+            first = max(0, start // self._page_frames)
+            last = min(last_page, (end - 1) // self._page_frames)
+            wanted.update(range(first, last + 1))
+        with self._lock:
+            self._wanted = wanted
+            for index in set(self._pages) - wanted:
+                del self._pages[index]
+                self._changed = True
+            to_read = wanted - set(self._pages) - self._pending
+            self._pending.update(to_read)
+        for index in to_read:
+            self._executor.submit(self._load_page, index)
+
+    def _load_page(self, index: int) -> None:
+        # Runs on a worker thread
+        start = index * self._page_frames
+        length = min(self._page_frames, self._length - start)
+        page = None
+        try:
+            page = _read_page(self._filename, start, length)
+        finally:
+            with self._lock:
+                self._pending.discard(index)
+                if page is not None and index in self._wanted:
+                    self._pages[index] = page
+                    self._changed = True
+
+    def take_changes(self) -> bool:
+        """
+        :return: Whether the set of resident pages has changed since
+        the last call.
+        """
+        with self._lock:
+            changed = self._changed
+            self._changed = False
+            return changed
+
+    def resident_pages(self) -> List[Tuple[int, AudioClip]]:
+        """
+        :return: List of (starting frame, page clip) of resident pages.
+        """
+        with self._lock:
+            return [
+                (index * self._page_frames, page)
+                for index, page in sorted(self._pages.items())
+            ]
@@ -0,0 +1,134 @@
+from bisect import bisect
+from collections import namedtuple
+from typing import Iterator, List, Optional, Union
+
+from amio import AudioClip
+
+from manokee.compact_audio import CompactAudioClip
+from manokee.track_pager import FrameRange, TrackPager
+
+SegmentSource = Union[AudioClip, CompactAudioClip, TrackPager]
+
+
+class Segment(namedtuple("Segment", "position source source_offset length")):
+    """
+    A region of immutable audio placed on the track timeline: frames
+    [source_offset, source_offset + length) of source are played
+    starting at frame position of the track.
+    """
+
+    @property
+    def end(self) -> int:
+        return self.position + self.length
+
+
+class PlaybackRegion(
+    namedtuple("PlaybackRegion", "clip frame_a frame_b play_at_frame")
+):
+    pass
+
+
+def overlay(segments: List[Segment], new_segment: Segment) -> List[Segment]:
+    """
+    Place a segment on top of the others. The segments it covers are
+    trimmed or split, without touching the audio data.
+    :param segments: Non-overlapping segments sorted by position.
+    :return: New list of non-overlapping segments sorted by position.
+    """
+    result = []
+    for segment in segments:
+        if segment.end <= new_segment.position or segment.position >= new_segment.end:
+            result.append(segment)
+            continue
+        if segment.position < new_segment.position:
+            result.append(
+                segment._replace(length=new_segment.position - segment.position)
+            )
+        if segment.end > new_segment.end:
+            cut = new_segment.end - segment.position
+            result.append(
+                Segment(
+                    new_segment.end,
+                    segment.source,
+                    segment.source_offset + cut,
+                    segment.length - cut,
+                )
+            )
+    index = bisect([segment.position for segment in result], new_segment.position)
+    result.insert(index, new_segment)
+    return result
+
+
+def playback_regions(segments: List[Segment]) -> Iterator[PlaybackRegion]:
+    """
+    Generate regions of clips which are currently in memory and make up
+    the audible part of the segments. For paged segments, these are
+    the parts of the resident pages.
+    """
+    for segment in segments:
+        if isinstance(segment.source, TrackPager):
+            source_end = segment.source_offset + segment.length
+            for page_position, page in segment.source.resident_pages():
+                frame_a = max(page_position, segment.source_offset)
+                frame_b = min(page_position + len(page), source_end)
+                if frame_a < frame_b:
+                    yield PlaybackRegion(
+                        page,
+                        frame_a - page_position,
+                        frame_b - page_position,
+                        segment.position + frame_a - segment.source_offset,
+                    )
+        else:
+            yield PlaybackRegion(
+                segment.source,
+                segment.source_offset,
+                segment.source_offset + segment.length,
+                segment.position,
+            )
+
+
+def flatten(
+    segments: List[Segment],
+    channels: int,
+    frame_rate: float,
+    start: int = 0,
+    end: Optional[int] = None,
+) -> AudioClip:
+    """
+    Render segments (or the frames from start to end of them) into
+    a single clip. Gaps between segments are silent. Paged segments
+    are read from disk.
+    """
+    if end is None:
+        end = max((segment.end for segment in segments), default=0)
+    result = AudioClip.zeros(end - start, channels, frame_rate)
+    for segment in segments:
+        frame_a = max(segment.position, start)
+        frame_b = min(segment.end, end)
+        if frame_a >= frame_b:
+            continue
+        offset = segment.source_offset + frame_a - segment.position
+        if isinstance(segment.source, AudioClip):
+            array = segment.source.array[offset : offset + frame_b - frame_a]
+        else:
+            array = segment.source.read(offset, frame_b - frame_a)
+        result.array[frame_a - start : frame_b - start] = array
+    result.writeable = False
+    return result
+
+
+def add_range(ranges: List[FrameRange], new_range: FrameRange) -> List[FrameRange]:
+    """
+    Add a frame range to a sorted list of disjoint frame ranges, merging
+    the ranges that overlap or touch.
+    """
+    start, end = new_range
+    result = []
+    for range_start, range_end in ranges:
+        if range_end < start or range_start > end:
+            result.append((range_start, range_end))
+        else:
+            start = min(start, range_start)
+            end = max(end, range_end)
+    result.append((start, end))
+    return sorted(result)
@@ -1,14 +1,15 @@
 import asyncio
+import json
 import logging
 
 from aiohttp import web
-import jsonpatch
 import psutil
 
 from manokee.application import Application
 from manokee.looping import LoopFragment
 from manokee.ping import Ping
 from manokee.session import Session
+from manokee.state_patch import make_patch
 from manokee.time_formatting import format_beat, format_frame
 from manokee.timing.fixed_bpm_timing import FixedBpmTiming
 import socketio
@@ -160,7 +161,10 @@ application = Application()
 _process = psutil.Process()
 
 
-def _construct_state_json(ping):
+def _construct_state_json():
+    """
+    The state shared by all clients; built once per update.
+    """
     amio_interface = application.amio_interface
     if amio_interface is not None:
         playspec_controller = application.playspec_controller
@@ -186,8 +190,6 @@ def _construct_state_json(ping):
     else:
         bar, beat = None, None
     state_update_json = {
-        "ping_latency": ping.current_ping_latency,
-        "state_update_id": ping.ping_id_to_send(),
         "workspace_sessions": application.workspace.sessions,
         "is_audio_io_running": application.is_audio_io_running,
         "frame_rate": application.frame_rate,
@@ -201,16 +203,16 @@ def _construct_state_json(ping):
         "auto_rewind": application.auto_rewind,
         "session": session_js,
         "capture_meter": application.capture_meter.current_rms_dB,
+        "metrics": application.metrics.to_js(),
         "recorded_fragments": recorded_fragments,
         "fragment_being_revised_id": application.fragment_being_revised_id,
         "process_rss": _process.memory_info().rss,
         "available_ram": psutil.virtual_memory().available,
         "track_memory_usage_mb": {
-            # 3 because there are 3 copies of the audio data currently:
-            # - NumPy array
-            # - immutable bytes object with audio data
-            # - block of memory used by the native I/O thread
-            track.name: int(3 * track.audio.memory_usage_mb)
+            # There are 2 copies of the audio data currently:
+            # - NumPy array (float or compact integer samples)
+            # - block of memory used by the native I/O thread (16-bit int)
+            track.name: int(track.memory_usage_mb + track.playback_memory_usage_mb)
             for track in application.session.tracks
         }
         if application.session is not None
@@ -219,17 +221,49 @@ def _construct_state_json(ping):
     return state_update_json
 
 
+def _construct_client_state_json(ping):
+    """
+    The part of the state specific to a client.
+    """
+    return {
+        "ping_latency": ping.current_ping_latency,
+        "state_update_id": ping.ping_id_to_send(),
+    }
+
+
 async def _update_task(app):
     # TODO: Exceptions silently stop execution, i.e., there is no message in logs!
     try:
+        previous_state: dict = {}
         while True:
-            for sid in app["client_sids"]:
+            if not app["client_sids"]:
+                await asyncio.sleep(0.05)
+                continue
+            # The shared state and the patch from its previous version
+            # are computed once, and sent to all the clients that have
+            # received the previous version
+            current_state = _construct_state_json()
+            patch = make_patch(previous_state, current_state).patch
+            for sid in list(app["client_sids"]):
                 async with sio.session(sid) as session:
-                    prev_state = session.get("previous_state", {})
-                    current_state = _construct_state_json(session["ping"])
-                    patch = jsonpatch.make_patch(prev_state, current_state)
-                    await sio.emit("state_update", patch.to_string())
+                    if session.get("previous_state") is previous_state:
+                        client_patch = patch
+                    else:
+                        client_patch = make_patch(
+                            session.get("previous_state", {}), current_state
+                        ).patch
+                    client_state = _construct_client_state_json(session["ping"])
+                    # The operations of both patches are on different keys
+                    client_patch = (
+                        client_patch
+                        + make_patch(
+                            session.get("previous_client_state", {}), client_state
+                        ).patch
+                    )
+                    await sio.emit("state_update", json.dumps(client_patch), to=sid)
                     session["previous_state"] = current_state
+                    session["previous_client_state"] = client_state
+            previous_state = current_state
             await asyncio.sleep(0.05)
     except asyncio.CancelledError:
         pass
@@ -237,14 +271,26 @@ async def _update_task(app):
         logger.info("Finished background update task")
 
 
+async def _compaction_task(app):
+    try:
+        while True:
+            await application.compact_tracks_if_idle()
+            await asyncio.sleep(1)
+    except asyncio.CancelledError:
+        pass
+
+
 async def start_background_tasks(app):
     app["client_sids"] = set()
     app["update_task"] = asyncio.create_task(_update_task(app))
+    app["compaction_task"] = asyncio.create_task(_compaction_task(app))
 
 
 async def cleanup_background_tasks(app):
     app["update_task"].cancel()
     await app["update_task"]
+    app["compaction_task"].cancel()
+    await app["compaction_task"]
 
 
 app.on_startup.append(start_background_tasks)
@@ -284,11 +330,12 @@ async def stop_audio(sid):
 
 
 def _js_metering_data_for_track(track):
-    clip = track.audio
-    if clip is None:
+    if track.pager is not None:
+        return {"track": track.name}
+    num_fragments, rms, peak = track.create_metering_data()
+    if num_fragments == 0:
         return {"track": track.name}
-    num_fragments, rms, peak = clip.create_metering_data()
-    fragment_length = len(clip) / clip.frame_rate / num_fragments
+    fragment_length = len(track) / track.frame_rate / num_fragments
     return {
         "track": track.name,
         "fragment_length": fragment_length,
@@ -319,22 +366,45 @@ async def load_session(sid, attr):
     if application.amio_interface is not None:
         path = attr["session"]
         logger.info("Loading session: " + path)
-        application.session = Session(application.amio_interface.get_frame_rate(), path)
+        application.session = Session(
+            application.amio_interface.get_frame_rate(),
+            path,
+            application.audacity_projects,
+        )
         application.go_to_beat(0)
 
-        await asyncio.gather(*[track.load() for track in application.session.tracks])
+        await asyncio.gather(
+            *[
+                track.load(application.decode_engine)
+                for track in application.session.tracks
+            ]
+        )
         application.session._notify_observers()
         await emit_track_metering_data()
 
 
+async def _save_session_in_background(incremental: bool):
+    session = application.session
+    if session.is_saving:
+        logger.warning("Session is already being saved")
+        return
+    await session.save_in_background(incremental)
+    logger.info("Session saved")
+
+
+@sio.event
+async def save_session(sid):
+    await _save_session_in_background(application.incremental_save)
+
+
 @sio.event
-def save_session(sid):
-    application.session.save()
+async def consolidate_session(sid):
+    await _save_session_in_background(False)
 
 
 @sio.event
-def save_session_as(sid, attr):
-    application.save_session_as(attr["name"])
+async def save_session_as(sid, attr):
+    await application.save_session_as(attr["name"])
 
 
 @sio.event
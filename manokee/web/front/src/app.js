@@ -46,12 +46,14 @@ function renderStateUpdate(msg) {
       process_rss={msg.process_rss}
       available_ram={msg.available_ram}
       track_memory_usage_mb={msg.track_memory_usage_mb}
+      metrics={msg.metrics}
       onStartAudio={() => socket.emit("start_audio")}
       onStopAudio={() => socket.emit("stop_audio")}
       onNewSession={() => socket.emit("new_session")}
       onLoadSession={(session) => socket.emit("load_session", { session })}
       onSaveSession={() => socket.emit("save_session")}
       onSaveSessionAs={(name) => socket.emit("save_session_as", { name })}
+      onConsolidateSession={() => socket.emit("consolidate_session")}
       onToggleMetronome={() => socket.emit("toggle_metronome")}
       onMetronomeVolDown={() => socket.emit("metronome_vol_down")}
       onMetronomeVolUp={() => socket.emit("metronome_vol_up")}
@@ -234,6 +236,7 @@ class MoreOptions extends Component {
               process_rss={this.props.process_rss}
               available_ram={this.props.available_ram}
               track_memory_usage_mb={this.props.track_memory_usage_mb}
+              metrics={this.props.metrics}
               audioIoRunning={this.props.audioIoRunning}
               onStartAudio={this.props.onStartAudio}
               onStopAudio={this.props.onStopAudio}
@@ -248,6 +251,7 @@ class MoreOptions extends Component {
               onLoadSession={this.props.onLoadSession}
               onSaveSession={this.props.onSaveSession}
               onSaveSessionAs={this.props.onSaveSessionAs}
+              onConsolidateSession={this.props.onConsolidateSession}
             />
           </TabPanel>
           <TabPanel>
@@ -491,6 +495,7 @@ export class App extends Component {
               process_rss={this.props.process_rss}
               available_ram={this.props.available_ram}
               track_memory_usage_mb={this.props.track_memory_usage_mb}
+              metrics={this.props.metrics}
               audioIoRunning={this.props.is_audio_io_running}
               onStartAudio={this.props.onStartAudio}
               onStopAudio={this.props.onStopAudio}
@@ -503,6 +508,7 @@ export class App extends Component {
               onLoadSession={this.props.onLoadSession}
               onSaveSession={this.props.onSaveSession}
               onSaveSessionAs={this.props.onSaveSessionAs}
+              onConsolidateSession={this.props.onConsolidateSession}
               onToggleMetronome={this.props.onToggleMetronome}
               onMetronomeVolDown={this.props.onMetronomeVolDown}
               onMetronomeVolUp={this.props.onMetronomeVolUp}
@@ -91,9 +91,14 @@ export class SessionManagement extends Component {
           onConfirm={this.props.onNewSession}
         />
         {this.props.session.name ? (
-          <button onClick={(evt) => this.props.onSaveSession()}>
-            Save session
-          </button>
+          <>
+            <button onClick={(evt) => this.props.onSaveSession()}>
+              Save session
+            </button>
+            <button onClick={(evt) => this.props.onConsolidateSession()}>
+              Consolidate session
+            </button>
+          </>
         ) : (
           <EditSessionNamePopup
             trigger={<button>Save session as...</button>}
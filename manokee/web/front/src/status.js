@@ -4,6 +4,7 @@ import { AudioIoControl } from "./audio-io-control";
 export class Status extends Component {
   render() {
     const track_memory_usage_mb = this.props.track_memory_usage_mb || {};
+    const metrics = this.props.metrics || {};
 
     return (
       <div>
@@ -44,6 +45,15 @@ export class Status extends Component {
             </li>
           </ul>
         </div>
+        <div>
+          <ul>
+            {Object.entries(metrics).map(([name, value]) => (
+              <li key={name}>
+                {name}: {value === null ? "-" : +value.toFixed(2)}
+              </li>
+            ))}
+          </ul>
+        </div>
         <AudioIoControl
           is_audio_io_running={this.props.audioIoRunning}
           onStartAudio={this.props.onStartAudio}
@@ -142,9 +142,7 @@ export class Track extends Component {
               {track.requires_audio_save ? "*" : ""}
               {track.name}
             </div>
-            {track.is_loaded ? (
-              <Meter rms={this.props.meter_rms} peak={this.props.meter_peak} />
-            ) : (
+            {!track.is_loaded ? (
               <Line
                 style={{ width: "100%", height: "8px", display: "block" }}
                 percent={track.percent_loaded}
@@ -152,6 +150,16 @@ export class Track extends Component {
                 strokeColor="#39671f"
                 trailColor="#c0e8a8"
               />
+            ) : track.percent_saved !== null ? (
+              <Line
+                style={{ width: "100%", height: "8px", display: "block" }}
+                percent={track.percent_saved}
+                strokeWidth={4}
+                strokeColor="#1f4867"
+                trailColor="#a8cce8"
+              />
+            ) : (
+              <Meter rms={this.props.meter_rms} peak={this.props.meter_peak} />
             )}
           </div>
         </div>
@@ -17,6 +17,10 @@ class Workspace:
         self._sessions = []
         self.refresh()
 
+    @property
+    def directory(self):
+        return self._directory
+
     @property
     def sessions(self):
         return self._sessions
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from manokee.audacity.blockfiles import Block, read_blockfiles
+from manokee.audacity.project import parse as parse_aup
+
+
+def _write_au(path, samples, little_endian=True):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    endianness = "<" if little_endian else ">"
+    with open(path, "wb") as f:
+        f.write(b"dns." if little_endian else b".snd")
+        f.write(struct.pack(endianness + "LLLLL", 32, 4 * len(samples), 6, 44100, 1))
+        f.write(b"\0" * 8)
+        f.write(np.asarray(samples, endianness + "f4").tobytes())
+
+
+def test_read_blockfiles(tmp_path):
+    paths = [str(tmp_path / f"{i}.au") for i in range(3)]
+    _write_au(paths[0], [1, 2, 3])
+    _write_au(paths[1], [4, 5], little_endian=False)
+    _write_au(paths[2], [-1, -2, -3, -4])
+    clip = read_blockfiles(
+        [
+            [Block(paths[1], 3, 2), Block(paths[0], 0, 3)],
+            [Block(paths[2], 0, 4)],
+        ],
+        44100,
+    )
+    assert clip.frame_rate == 44100
+    np.testing.assert_array_equal(
+        clip.array, [[1, -1], [2, -2], [3, -3], [4, -4], [5, 0]]
+    )
+
+
+def test_read_blockfiles_invalid(tmp_path):
+    path = str(tmp_path / "invalid.au")
+    with open(path, "wb") as f:
+        f.write(b"\0" * 32)
+    with ThreadPoolExecutor() as executor:
+        with pytest.raises(ValueError):
+            read_blockfiles([[Block(path, 0, 2)]], 44100, executor)
+
+
+def test_audacity_project_as_audio_clip(tmp_path):
+    wave_tracks = ""
+    for channel in range(2):
+        wave_tracks += f"""
+        <wavetrack name="gtr" channel="{channel}" rate="44100.0">
+            <waveclip offset="0.0">
+                <sequence>
+                    <waveblock start="0">
+                        <simpleblockfile filename="e000000{channel}.au" len="2"/>
+                    </waveblock>
+                    <waveblock start="2">
+                        <simpleblockfile filename="e00010{channel}0.au" len="1"/>
+                    </waveblock>
+                </sequence>
+            </waveclip>
+        </wavetrack>"""
+    with open(tmp_path / "project.aup", "w") as f:
+        f.write(
+            '<project xmlns="http://audacity.sourceforge.net/xml/"'
+            f' projname="project_data">{wave_tracks}</project>'
+        )
+    for channel in range(2):
+        _write_au(
+            str(tmp_path / f"project_data/e00/d00/e000000{channel}.au"),
+            [channel, channel + 0.5],
+        )
+        _write_au(
+            str(tmp_path / f"project_data/e00/d01/e00010{channel}0.au"), [channel + 1]
+        )
+
+    clip = parse_aup(str(tmp_path / "project.aup")).as_audio_clip(None)
+    assert clip.frame_rate == 44100
+    np.testing.assert_array_equal(clip.array, [[0, 1], [0.5, 1.5], [1, 2]])
@@ -1,4 +1,7 @@
-from manokee.audacity.project import parse as parse_aup
+import os
+import shutil
+
+from manokee.audacity.project import AudacityProjectCache, parse as parse_aup
 
 
 def test_load_audacity_project():
@@ -22,3 +25,20 @@ def test_load_audacity_project():
         17.5,
         20,
     ]
+    assert project.label_positions().tolist() == [1, 3, 5, 7.5, 10, 12.5, 15, 17.5, 20]
+    assert project.label_positions() is project.label_positions()
+
+
+def test_audacity_project_cache(tmp_path):
+    path = str(tmp_path / "simple.aup")
+    shutil.copy("tests/assets/audacity-projects/simple.aup", path)
+    cache = AudacityProjectCache()
+    project = cache.parse(path)
+    assert cache.parse(path) is project
+    assert cache.parse(os.path.relpath(path)) is project
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    reparsed = cache.parse(path)
+    assert reparsed is not project
+    assert cache.parse(path) is reparsed
@@ -1,5 +1,8 @@
 from math import isclose
 
+import numpy as np
+import pytest
+
 from manokee.audacity.project import parse as parse_aup
 from manokee.timing.audacity_timing import AudacityTiming
 
@@ -23,16 +26,17 @@ def test_audacity_timing():
     assert timing.beat_to_seconds(9) == 22.375 - offset
     assert timing.beat_to_seconds(10) == 24.75 - offset
 
-    # TODO: Extrapolate in seconds_to_beat
-    # assert timing.seconds_to_beat(-3.75 - offset) == -2
-    # assert timing.seconds_to_beat(-1.375 - offset) == -1
+    # Before the first label and after the last one, beats are extrapolated
+    # with the average beat length, in both directions
+    assert timing.seconds_to_beat(-3.75 - offset) == -2
+    assert timing.seconds_to_beat(-1.375 - offset) == -1
     assert timing.seconds_to_beat(1 - offset) == 0
     assert timing.seconds_to_beat(3 - offset) == 1
     assert timing.seconds_to_beat(5 - offset) == 2
     assert timing.seconds_to_beat(7.5 - offset) == 3
     assert timing.seconds_to_beat(10 - offset) == 4
-    # assert timing.seconds_to_beat(22.375 - offset) == 9
-    # assert timing.seconds_to_beat(24.75 - offset) == 10
+    assert timing.seconds_to_beat(22.375 - offset) == 9
+    assert timing.seconds_to_beat(24.75 - offset) == 10
 
 
 def test_audacity_timing_beats_in_audacity_beat():
@@ -56,16 +60,17 @@ def test_audacity_timing_beats_in_audacity_beat():
     assert timing.beat_to_seconds(18) == 22.375 - offset
     assert timing.beat_to_seconds(20) == 24.75 - offset
 
-    # TODO: Extrapolate in seconds_to_beat
-    # assert timing.seconds_to_beat(-3.75 - offset) == -4
-    # assert timing.seconds_to_beat(-1.375 - offset) == -2
+    # Before the first label and after the last one, beats are extrapolated
+    # with the average beat length, in both directions
+    assert timing.seconds_to_beat(-3.75 - offset) == -4
+    assert timing.seconds_to_beat(-1.375 - offset) == -2
     assert timing.seconds_to_beat(1 - offset) == 0
     assert timing.seconds_to_beat(3 - offset) == 2
     assert timing.seconds_to_beat(5 - offset) == 4
     assert timing.seconds_to_beat(7.5 - offset) == 6
     assert timing.seconds_to_beat(10 - offset) == 8
-    # assert timing.seconds_to_beat(22.375 - offset) == 18
-    # assert timing.seconds_to_beat(24.75 - offset) == 20
+    assert timing.seconds_to_beat(22.375 - offset) == 18
+    assert timing.seconds_to_beat(24.75 - offset) == 20
 
     assert isclose(timing.beat_to_seconds(-3), -2.5625 - offset)
     assert isclose(timing.beat_to_seconds(-1), -0.1875 - offset)
@@ -75,11 +80,34 @@ def test_audacity_timing_beats_in_audacity_beat():
     assert isclose(timing.beat_to_seconds(7), 8.75 - offset)
     assert isclose(timing.beat_to_seconds(19), 23.5625 - offset)
 
-    # TODO: Extrapolate in seconds_to_beat
-    # assert isclose(timing.seconds_to_beat(-2.5625 - offset), -3)
-    # assert isclose(timing.seconds_to_beat(-0.1875 - offset), -1)
+    # Before the first label and after the last one, beats are extrapolated
+    # with the average beat length, in both directions
+    assert isclose(timing.seconds_to_beat(-2.5625 - offset), -3)
+    assert isclose(timing.seconds_to_beat(-0.1875 - offset), -1)
     assert isclose(timing.seconds_to_beat(2 - offset), 1)
     assert isclose(timing.seconds_to_beat(4 - offset), 3)
     assert isclose(timing.seconds_to_beat(6.25 - offset), 5)
     assert isclose(timing.seconds_to_beat(8.75 - offset), 7)
-    # assert isclose(timing.seconds_to_beat(23.5625 - offset), 19)
+    assert isclose(timing.seconds_to_beat(23.5625 - offset), 19)
+
+
+@pytest.mark.parametrize("beats_in_audacity_beat", [1, 2])
+def test_audacity_timing_arrays(beats_in_audacity_beat):
+    path = "tests/assets/audacity-projects/simple.aup"
+    project = parse_aup(path)
+    timing = AudacityTiming(
+        project=project,
+        aup_file_path=path,
+        beats_in_audacity_beat=beats_in_audacity_beat,
+    )
+
+    beats = np.linspace(-5, 25, 301)
+    assert np.allclose(
+        timing.beat_to_seconds_array(beats),
+        [timing.beat_to_seconds(beat) for beat in beats],
+    )
+    times = np.linspace(-5, 30, 351)
+    assert np.allclose(
+        timing.seconds_to_beat_array(times),
+        [timing.seconds_to_beat(time) for time in times],
+    )
@@ -0,0 +1,41 @@
+from amio import AudioClip
+import numpy as np
+
+from manokee.compact_audio import CompactAudioClip, pack_int24, unpack_int24
+
+
+def test_pack_int24():
+    array = np.array([[0, -256], [2**31 - 256, -(2**31)]], np.int32)
+    packed = pack_int24(array)
+    assert packed.shape == (2, 2, 3)
+    np.testing.assert_array_equal(unpack_int24(packed), array)
+
+
+def test_compact_clip_conversion():
+    array = np.random.default_rng(0).uniform(-1, 1, (1000, 2)).astype(np.float32)
+    for sample_format, atol in (("int16", 1 / 32768), ("int24", 1 / 8388608)):
+        clip = CompactAudioClip.from_float(array, 48000, sample_format)
+        assert len(clip) == 1000
+        assert clip.channels == 2
+        np.testing.assert_allclose(clip.read(100, 50), array[100:150], atol=atol)
+        int16_data = np.frombuffer(clip.int16_data(), np.int16).reshape(1000, 2)
+        np.testing.assert_allclose(int16_data / 32768, array, atol=2 / 32768)
+    assert CompactAudioClip.from_float(array, 48000, "int16").memory_usage_mb == (
+        4000 / 1024 / 1024
+    )
+
+
+def test_compact_clip_metering_data():
+    array = np.random.default_rng(0).uniform(-0.5, 0.5, (48000, 1)).astype(np.float32)
+    clip = CompactAudioClip.from_float(array, 48000, "int24")
+    num_fragments, rms, peak = clip.create_metering_data(1000, 45000, 24)
+    (
+        expected_num_fragments,
+        expected_rms,
+        expected_peak,
+    ) = AudioClip(
+        array[1000:46000], 48000
+    ).create_metering_data(24)
+    assert num_fragments == expected_num_fragments
+    np.testing.assert_array_equal(rms, expected_rms)
+    np.testing.assert_array_equal(peak, expected_peak)
@@ -0,0 +1,62 @@
+import os
+
+from amio import AudioClip
+import numpy as np
+
+from manokee.decoded_audio_cache import DecodedAudioCache
+
+
+def _touch(path, content=b"flac"):
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def test_store_and_load(tmp_path):
+    source = str(tmp_path / "track.flac")
+    _touch(source)
+    cache = DecodedAudioCache(str(tmp_path / "cache"))
+    assert cache.load(source) is None
+
+    clip = AudioClip(np.linspace(-1, 1, 200, dtype=np.float32).reshape(100, 2), 44100)
+    cache.store(source, clip)
+
+    loaded = DecodedAudioCache(str(tmp_path / "cache")).load(source)
+    assert loaded.frame_rate == 44100
+    assert not loaded.writeable
+    np.testing.assert_array_equal(loaded.array, clip.array)
+
+
+def test_entry_invalidated_when_source_changes(tmp_path):
+    source = str(tmp_path / "track.flac")
+    _touch(source)
+    cache = DecodedAudioCache(str(tmp_path / "cache"))
+    cache.store(source, AudioClip.zeros(10, 1, 48000))
+
+    _touch(source, b"longer flac")
+    assert cache.load(source) is None
+    cache.store(source, AudioClip.zeros(20, 1, 48000))
+    assert len(cache.load(source)) == 20
+    assert len(os.listdir(cache.directory)) == 1
+
+
+def test_eviction(tmp_path):
+    cache = DecodedAudioCache(str(tmp_path / "cache"), budget_mb=1.5)
+    sources = [str(tmp_path / f"track{i}.flac") for i in range(3)]
+    for source in sources:
+        _touch(source)
+        cache.store(source, AudioClip.zeros(1024 * 1024 // 4, 1, 48000))
+    assert cache.load(sources[0]) is None
+    assert cache.load(sources[1]) is None
+    assert cache.load(sources[2]) is not None
+
+
+def test_store_keyed_by_stat_before_decoding(tmp_path):
+    source = str(tmp_path / "track.flac")
+    _touch(source)
+    stat = os.stat(source)
+    cache = DecodedAudioCache(str(tmp_path / "cache"))
+
+    # The file changes while it's being decoded
+    _touch(source, b"longer flac")
+    cache.store(source, AudioClip.zeros(10, 1, 48000), source_stat=stat)
+    assert cache.load(source) is None
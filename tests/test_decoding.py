@@ -0,0 +1,99 @@
+import asyncio
+import os
+import shutil
+
+import numpy as np
+import soundfile as sf
+
+from manokee.audacity.project import parse as parse_aup
+from manokee.decoded_audio_cache import DecodedAudioCache
+from manokee.decoding import DecodeEngine
+
+
+def test_decode_in_blocks(tmp_path):
+    frame_rate = 8000
+    data = np.random.default_rng(0).uniform(-0.5, 0.5, (10 * frame_rate + 123, 2))
+    filename = str(tmp_path / "track.flac")
+    sf.write(filename, data, frame_rate)
+
+    engine = DecodeEngine(max_workers=4)
+    engine.block_secs = 1
+    progress = []
+    clip = asyncio.run(engine.decode(filename, progress.append))
+
+    assert clip.frame_rate == frame_rate
+    assert clip.channels == 2
+    assert not clip.writeable
+    np.testing.assert_allclose(clip.array, sf.read(filename)[0], atol=1e-6)
+    assert len(progress) == 11
+    assert progress == sorted(progress)
+    assert progress[-1] == 100
+
+
+def test_decode_missing_file(tmp_path):
+    engine = DecodeEngine(max_workers=1)
+    clip = asyncio.run(engine.decode(str(tmp_path / "missing.flac"), print))
+    assert clip is None
+
+
+def test_decode_into_compact_clips(tmp_path):
+    frame_rate = 8000
+    data = np.random.default_rng(0).uniform(-0.5, 0.5, (3 * frame_rate + 45, 2))
+    filename = str(tmp_path / "track.flac")
+    sf.write(filename, data, frame_rate, subtype="PCM_24")
+
+    for sample_format, atol in (("int16", 1 / 32768), ("int24", 1 / 8388608)):
+        engine = DecodeEngine(max_workers=2, sample_format=sample_format)
+        engine.block_secs = 1
+        clip = asyncio.run(engine.decode(filename, lambda _: None))
+        assert clip.sample_format == sample_format
+        assert len(clip) == len(data)
+        np.testing.assert_allclose(clip.read(0, len(clip)), data, atol=atol)
+
+
+def _write_audacity_project(directory, samples):
+    with open(directory / "project.aup", "w") as f:
+        f.write(
+            '<project xmlns="http://audacity.sourceforge.net/xml/"'
+            ' projname="project_data">'
+            '<wavetrack name="gtr" channel="0" rate="8000.0"><waveclip offset="0">'
+            '<sequence><waveblock start="0">'
+            f'<simpleblockfile filename="e0000000.au" len="{len(samples)}"/>'
+            "</waveblock></sequence></waveclip></wavetrack></project>"
+        )
+    blockfile = directory / "project_data" / "e00" / "d00" / "e0000000.au"
+    blockfile.parent.mkdir(parents=True)
+    with open(blockfile, "wb") as f:
+        f.write(b"dns." + np.array([24, 0, 6, 8000, 1], "<u4").tobytes())
+        f.write(np.asarray(samples, "<f4").tobytes())
+    return str(directory / "project.aup")
+
+
+def test_import_audacity_track(tmp_path):
+    aup_file_path = _write_audacity_project(tmp_path, [0.25, 0.5, -0.5])
+    cache = DecodedAudioCache(str(tmp_path / "cache"))
+    engine = DecodeEngine(max_workers=2, cache=cache)
+
+    async def import_track():
+        return await engine.import_audacity_track(
+            parse_aup(aup_file_path), "gtr", lambda _: None
+        )
+
+    async def import_and_wait_for_cache():
+        clip = await import_track()
+        while not os.listdir(cache.directory):
+            await asyncio.sleep(0.01)
+        return clip
+
+    clip = asyncio.run(import_and_wait_for_cache())
+    assert clip.frame_rate == 8000
+    assert not clip.writeable
+    np.testing.assert_array_equal(clip.array[:, 0], [0.25, 0.5, -0.5])
+
+    # The blockfiles aren't read again, unless the project changes
+    shutil.rmtree(tmp_path / "project_data")
+    np.testing.assert_array_equal(asyncio.run(import_track()).array, clip.array)
+    _write_audacity_project(tmp_path, [1, 1])
+    stat = os.stat(aup_file_path)
+    os.utime(aup_file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert len(asyncio.run(import_track())) == 2
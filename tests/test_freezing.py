@@ -0,0 +1,62 @@
+import asyncio
+
+from amio import AudioClip
+import numpy as np
+
+from manokee.freezing import TrackFreezer, render_stem
+from manokee.playspec_cache import PlayspecCache
+from manokee.session import Session
+from manokee.track_segments import Segment
+
+
+class _NoRevising:
+    audio_substitutes: dict = {}
+
+
+def _clip(value, length):
+    clip = AudioClip(np.full((length, 1), value, np.float32), 48000)
+    clip.writeable = False
+    return clip
+
+
+def test_render_stem(tmp_path):
+    sources = [
+        ([Segment(0, _clip(0.5, 100), 0, 100)], 1, (1.0, 0.5)),
+        ([Segment(50, _clip(0.25, 100), 0, 100)], 1, (0.0, 1.0)),
+    ]
+    stem = render_stem(sources, 48000, str(tmp_path / "stem.f32"), block_secs=0.001)
+    assert len(stem) == 150
+    assert not stem.writeable
+    assert stem.array[0].tolist() == [0.5, 0.25]
+    assert stem.array[75].tolist() == [0.5, 0.5]
+    assert stem.array[125].tolist() == [0, 0.25]
+
+
+def test_frozen_tracks_are_played_from_stem(tmp_path):
+    async def main():
+        session = Session(48000, "tests/assets/sessions/simple/session.mnk")
+        for track in session.tracks:
+            track.is_rec = False
+            track.segments = [Segment(0, _clip(0.5, 1000), 0, 1000)]
+        stems_ready = []
+        freezer = TrackFreezer(
+            str(tmp_path), lambda: stems_ready.append(True), delay_secs=0
+        )
+        cache = PlayspecCache(lambda playspec: playspec, freezer)
+        assert cache.update(session, False, _NoRevising()) == [""]
+        assert len(cache.playspecs[""]) == 2
+
+        while not stems_ready:
+            await asyncio.sleep(0.01)
+        assert cache.update(session, False, _NoRevising()) == [""]
+        (entry,) = cache.playspecs[""]
+        assert entry.clip.channels == 2
+
+        # Changing a frozen track unfreezes the tracks until the stem
+        # is rendered again
+        session.track_for_name("drums_l").fader.vol_dB -= 3
+        assert cache.update(session, False, _NoRevising()) == [""]
+        assert len(cache.playspecs[""]) == 2
+        freezer.clear()
+
+    asyncio.run(main())
@@ -1,6 +1,15 @@
-from amio import create_io_interface
-from manokee.input_recorder import InputRecorder
+from amio import InputAudioChunk, create_io_interface
+from datetime import datetime, timedelta, timezone
+import itertools
+from manokee.capture_writer import CaptureWriter
+from manokee.input_recorder import InputFragment, InputRecorder
+from manokee.input_spill import InputSpill
+from manokee.transport_state import TransportState
+import numpy as np
 import pytest
+import soundfile as sf
+import threading
+import time
 
 
 @pytest.mark.parametrize("length_min,length_max", [(4, 6), (2, 3), (3, 7)])
@@ -25,3 +34,188 @@ def test_removing_old_fragments(length_min, length_max):
         <= total_recorded_mins
         <= length_max + tolerance_mins
     )
+
+
+def _chunk_feeder(recorder: InputRecorder):
+    # Feeds 1 kHz input to the recorder, as the application does
+    frame_rate = 1000
+    amio_interface = create_io_interface("null", frame_rate=frame_rate)
+    start_time = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    chunk_starts = itertools.count(0, 100)
+
+    def feed(secs, rolling):
+        for _ in range(secs * 10):
+            # Each sample is proportional to the index of its chunk's
+            # first frame
+            starting_frame = next(chunk_starts)
+            recorder.append_input_chunk(
+                InputAudioChunk(
+                    np.full((100, 2), starting_frame / 65536, np.float32),
+                    frame_rate,
+                    0,
+                    starting_frame,
+                    rolling,
+                    start_time + timedelta(seconds=starting_frame / frame_rate),
+                )
+            )
+            recorder.remove_old_fragments(amio_interface)
+
+    return feed
+
+
+@pytest.mark.parametrize("spill", [False, True])
+def test_recording_longer_than_ring_buffer(spill, tmp_path):
+    if spill:
+        # Only 0.5 s of input audio in memory
+        recorder = InputRecorder(
+            0.05, 0.05, InputSpill(str(tmp_path), block_secs=0.3), 0.5 / 60
+        )
+    else:
+        recorder = InputRecorder(0.05, 0.05)  # 3 s + 3 s
+    feed = _chunk_feeder(recorder)
+
+    feed(10, False)
+    recorder.is_recording = True
+    feed(20, True)
+    feed(10, False)
+
+    fragment = recorder.fragment_being_revised
+    assert fragment.transport_state == TransportState.RECORDING
+    assert recorder.fragment_by_id(fragment.id) is fragment
+    assert fragment.starting_frame == 10000
+    assert len(fragment) == 20000
+    np.testing.assert_array_equal(
+        fragment.as_clip().array[::100, 0], np.arange(10000, 30000, 100) / 65536
+    )
+    np.testing.assert_array_equal(
+        recorder.last_fragment.as_clip().array[-100:],
+        np.full((100, 2), 39900 / 65536),
+    )
+
+
+def test_recording_longer_than_ram_limit(caplog):
+    # 7 s ring buffer, growing up to 10 s
+    recorder = InputRecorder(0.05, 0.05, ram_limit_mins=10 / 60)
+    feed = _chunk_feeder(recorder)
+
+    feed(5, False)
+    recorder.is_recording = True
+    feed(20, True)
+    feed(5, False)
+
+    # Logged once, when the buffer got full
+    assert caplog.text.count("Input buffer is full") == 1
+    # Only the last 10 s were in the ring buffer when the recording was
+    # detached from it, so it lost its beginning
+    fragment = recorder.fragment_being_revised
+    assert fragment.transport_state == TransportState.RECORDING
+    assert not fragment.is_in_ring
+    assert fragment.starting_frame == 18000
+    assert len(fragment) == 7000
+    np.testing.assert_array_equal(
+        fragment.as_clip().array[::100, 0], np.arange(18000, 25000, 100) / 65536
+    )
+    assert sum(len(f) for f in recorder.fragments if f.is_in_ring) <= 10000
+
+
+def test_idling_past_ram_limit_keeps_last_recording(caplog):
+    # 7 s ring buffer, growing up to 10 s
+    recorder = InputRecorder(0.05, 0.05, ram_limit_mins=10 / 60)
+    feed = _chunk_feeder(recorder)
+
+    feed(5, False)
+    recorder.is_recording = True
+    feed(5, True)
+    feed(90, False)
+    recorder.fragment_being_revised = None
+
+    assert "Input buffer is full" not in caplog.text
+    recordings = [
+        fragment
+        for fragment in recorder.fragments
+        if fragment.transport_state == TransportState.RECORDING
+    ]
+    assert len(recordings) == 1
+    assert recordings[0].starting_frame == 5000
+    assert len(recordings[0]) == 5000
+    np.testing.assert_array_equal(
+        recordings[0].as_clip().array[::100, 0], np.arange(5000, 10000, 100) / 65536
+    )
+    # The idle input after it is still cut to 6 s
+    assert sum(len(f) for f in recorder.fragments if f.is_in_ring) <= 6000 + 100
+
+
+def test_channel_clips_are_shared_until_fragment_changes():
+    fragment = InputFragment(0, True)
+
+    def append_chunk(starting_frame):
+        fragment.append_chunk(
+            InputAudioChunk(
+                np.tile(np.array([[0.25, 0.5]], np.float32), (100, 1)),
+                48000,
+                0,
+                starting_frame,
+                True,
+                datetime(2022, 1, 1, tzinfo=timezone.utc),
+            )
+        )
+
+    append_chunk(0)
+    left = fragment.channel_clip(0)
+    assert fragment.channel_clip(0) is left
+    assert not left.writeable
+    assert left.channels == 1
+    np.testing.assert_array_equal(fragment.channel_clip(1).array, 0.5)
+
+    append_chunk(100)
+    assert fragment.channel_clip(0) is not left
+    assert len(fragment.channel_clip(0)) == 200
+
+
+def test_recording_is_captured_to_file(tmp_path, monkeypatch):
+    # The writer thread doesn't start writing until released
+    release_writer = threading.Event()
+    write_takes = CaptureWriter._write_takes
+
+    def delayed_write_takes(self):
+        release_writer.wait()
+        write_takes(self)
+
+    monkeypatch.setattr(CaptureWriter, "_write_takes", delayed_write_takes)
+    capture = CaptureWriter(str(tmp_path))
+    recorder = InputRecorder(4, 2, capture=capture)
+    start_time = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    for starting_frame, rolling in [(0, False), (0, True), (100, True), (200, False)]:
+        if rolling:
+            recorder.is_recording = True
+        recorder.append_input_chunk(
+            InputAudioChunk(
+                np.tile(np.array([[0.25, 0.5]], np.float32), (100, 1)),
+                48000,
+                0,
+                starting_frame,
+                rolling,
+                start_time,
+            )
+        )
+
+    fragment = recorder.fragment_being_revised
+    assert len(fragment) == 200
+    # Read from the ring buffer until the capture file is complete
+    left = fragment.channel_clip(0)
+    assert not isinstance(left.array, np.memmap)
+    np.testing.assert_array_equal(left.array, 0.25)
+
+    release_writer.set()
+    for _ in range(500):
+        if capture.open_take(fragment.id) is not None:
+            break
+        time.sleep(0.01)
+    left = fragment.channel_clip(0)
+    assert isinstance(left.array, np.memmap)
+    np.testing.assert_array_equal(left.array, 0.25)
+    np.testing.assert_array_equal(fragment.channel_clip(1).array, 0.5)
+    assert sf.info(capture.path(fragment.id)).frames == 200
+
+    fragment.discard()
+    assert capture.open_take(fragment.id) is None
@@ -0,0 +1,27 @@
+from manokee.metrics import Metrics, WindowedMax
+
+
+def test_windowed_max():
+    maximum = WindowedMax(window=5)
+    assert maximum.get(now=0) is None
+    maximum.new_value(3, now=0)
+    maximum.new_value(7, now=1)
+    maximum.new_value(5, now=2)
+    assert maximum.get(now=2) == 7
+    # The previous window still counts
+    maximum.new_value(1, now=6)
+    assert maximum.get(now=6) == 7
+    # ...but not the one before it
+    assert maximum.get(now=11) == 1
+    assert maximum.get(now=30) is None
+
+
+def test_metrics_to_js():
+    metrics = Metrics()
+    metrics.observe_max("latency_ms", 2.5)
+    metrics.observe_max("latency_ms", 1.5)
+    assert metrics.get("latency_ms") == 2.5
+    assert metrics.get("overflows") is None
+    assert metrics.to_js() == {"latency_ms": 2.5}
+    metrics.add_source(lambda: {"cache_hits": 5})
+    assert metrics.to_js()["cache_hits"] == 5
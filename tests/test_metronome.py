@@ -0,0 +1,86 @@
+from concurrent.futures import Executor, Future
+
+from manokee.metronome import (
+    Metronome,
+    TempoMapMetronome,
+    metronome_bar_clip,
+    render_metronome_bar,
+)
+from manokee.timing.fixed_bpm_timing import FixedBpmTiming
+
+
+def test_metronome_bars_are_cached():
+    render_metronome_bar.cache_clear()
+    metronome = Metronome(bpm=120, time_signature=4, frame_rate=48000)
+    assert len(metronome.audio_clip) == 96000
+    assert not metronome.audio_clip.writeable
+    assert Metronome(bpm=121, time_signature=4, frame_rate=48000).audio_clip is not (
+        metronome.audio_clip
+    )
+    again = Metronome(bpm=120, time_signature=4, frame_rate=48000)
+    assert again.audio_clip is metronome.audio_clip
+    info = render_metronome_bar.cache_info()
+    assert (info.hits, info.misses) == (1, 2)
+
+
+class _ShiftedTiming(FixedBpmTiming):
+    # Beat 0 is at 0.5 s
+    def beat_to_seconds(self, beat_number: float) -> float:
+        return super().beat_to_seconds(beat_number) + 0.5
+
+    def seconds_to_beat(self, time: float) -> float:
+        return super().seconds_to_beat(time - 0.5)
+
+
+def test_tempo_map_metronome_renders_bars_in_window():
+    metronome = TempoMapMetronome(
+        timing=_ShiftedTiming(120),
+        time_signature=4,
+        frame_rate=1000,
+        cached_bars=2,
+        render_ahead_bars=0,
+    )
+    assert list(metronome.playspec_entries(1, 1)) == []
+    assert metronome.update_window([(0, 1000)])
+    assert not metronome.update_window([(0, 1000)])
+    # The bar before beat 0 is cut at frame 0
+    entries = list(metronome.playspec_entries(1, 1))
+    assert [(e.frame_a, e.frame_b, e.play_at_frame) for e in entries] == [
+        (1500, 2000, 0),
+        (0, 2000, 500),
+    ]
+    assert metronome.update_window([(3000, 6000)])
+    entries = list(metronome.playspec_entries(1, 1))
+    assert [e.play_at_frame for e in entries] == [2500, 4500]
+    assert [e.clip.array[0, 0] for e in entries] == [metronome_bar_clip.array[0, 0]] * 2
+
+
+class _SynchronousExecutor(Executor):
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+def test_tempo_map_metronome_renders_bars_ahead():
+    # Bars are 2000 frames long, bar 0 starts at frame 500
+    metronome = TempoMapMetronome(
+        timing=_ShiftedTiming(120),
+        time_signature=4,
+        frame_rate=1000,
+        render_ahead_bars=4,
+        executor=_SynchronousExecutor(),
+    )
+    assert metronome.update_window([(0, 1000)])
+    assert metronome.window == (-1, 0)
+    # Bars 1 to 4 are being rendered ahead, but the entries still cover
+    # the requested frames
+    assert not metronome.update_window([(0, 2000)])
+
+    # Moving past the entries brings in the bars rendered ahead
+    assert metronome.update_window([(2000, 3000)])
+    assert metronome.window == (0, 1, 2, 3, 4)
+    assert not metronome.update_window([(6000, 9000)])
+    entries = list(metronome.playspec_entries(1, 1))
+    assert [e.play_at_frame for e in entries] == [500, 2500, 4500, 6500, 8500]
+    assert metronome.update_window([(9000, 11000)])
@@ -0,0 +1,52 @@
+from amio import AudioClip, NativeInterface, NullInterface, PlayspecEntry
+import numpy as np
+
+from manokee.compact_audio import convert_to_sample_format
+import manokee.native_clips
+from manokee.native_clips import NativeClipRegistry
+
+
+class _NativeClip:
+    def __init__(self, amio_interface, data, channels, frame_rate):
+        self.data = data
+        self.channels = channels
+
+
+def test_resolve(monkeypatch):
+    monkeypatch.setattr(manokee.native_clips, "ImmutableAudioClip", _NativeClip)
+    amio_interface = NativeInterface()
+    monkeypatch.setattr(amio_interface, "get_frame_rate", lambda: 48000)
+    registry = NativeClipRegistry(amio_interface)
+    clip = AudioClip.zeros(100, 2, 48000)
+    clip.writeable = False
+    playspec = [
+        PlayspecEntry(clip, 0, 100, 0, 0, 1.0, 0.5),
+        PlayspecEntry(clip, 10, 50, 100, 0, 0.5, 1.0),
+    ]
+
+    resolved = registry.resolve(playspec)
+    assert len(resolved) == 2
+    assert isinstance(resolved[0].clip, _NativeClip)
+    # The clip is copied to the I/O thread only once
+    assert resolved[1].clip is resolved[0].clip
+    assert resolved[0].clip.data == bytes(100 * 2 * 2)
+    assert tuple(resolved[1][1:]) == (10, 50, 100, 0, 0.5, 1.0)
+
+
+def test_resolve_compact_clips_for_other_interfaces():
+    registry = NativeClipRegistry(NullInterface(48000))
+    clip = AudioClip(np.full((100, 2), 0.5, np.float32), 48000)
+    compact_clip = convert_to_sample_format(clip, "int16")
+    playspec = [
+        PlayspecEntry(compact_clip, 0, 100, 0, 0, 1.0, 1.0),
+        PlayspecEntry(clip, 0, 100, 100, 0, 1.0, 1.0),
+        PlayspecEntry(compact_clip, 10, 50, 200, 0, 1.0, 1.0),
+    ]
+
+    resolved = registry.resolve(playspec)
+    assert isinstance(resolved[0].clip, AudioClip)
+    np.testing.assert_allclose(resolved[0].clip.array, 0.5, atol=1e-4)
+    assert resolved[1] is playspec[1]
+    # Each compact clip is converted only once
+    assert resolved[2].clip is resolved[0].clip
+    assert tuple(resolved[2][1:]) == (10, 50, 200, 0, 1.0, 1.0)
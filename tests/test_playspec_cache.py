@@ -0,0 +1,105 @@
+from amio import AudioClip
+
+from manokee.playspec_cache import PlayspecCache
+from manokee.session import Session
+from manokee.timing.fixed_bpm_timing import FixedBpmTiming
+from manokee.timing.timing import Timing
+from manokee.track import Track
+from manokee.track_group import TrackGroup
+from manokee.track_segments import Segment
+
+
+class _TempoMap(Timing):
+    def beat_to_seconds(self, beat_number: float) -> float:
+        return beat_number / 2
+
+    def seconds_to_beat(self, time: float) -> float:
+        return time * 2
+
+
+class _NoRevising:
+    audio_substitutes: dict = {}
+
+
+def _session():
+    session = Session(48000, "tests/assets/sessions/simple/session.mnk")
+    other = TrackGroup(
+        name="other",
+        session=session,
+        tracks=[Track.empty(session, "bass", 48000)],
+        timing=FixedBpmTiming(120),
+    )
+    session.track_groups.append(other)
+    for track in session.tracks:
+        clip = AudioClip.zeros(1000, 1, 48000)
+        clip.writeable = False
+        track.segments = [Segment(0, clip, 0, len(clip))]
+    return session
+
+
+def test_playspec_cache_rebuilds_changed_groups():
+    session = _session()
+    cache = PlayspecCache(lambda playspec: playspec)
+    assert cache.update(session, False, _NoRevising()) == ["", "other"]
+    assert [len(cache.playspecs[name]) for name in ["", "other"]] == [2, 1]
+    main_playspec = cache.playspecs[""]
+
+    assert cache.update(session, False, _NoRevising()) == []
+    assert cache.playspecs[""] is main_playspec
+
+    # A structural change
+    track = session.track_for_name("drums_l")
+    track.segments = track.segments + track.segments
+    assert cache.update(session, False, _NoRevising()) == [""]
+    assert len(cache.playspecs[""]) == 3
+
+    # Tracks being recorded become inaudible
+    assert cache.update(session, True, _NoRevising()) == [""]
+    assert cache.playspecs[""] == []
+
+
+def test_playspec_cache_gains():
+    session = _session()
+    cache = PlayspecCache(lambda playspec: playspec)
+    cache.update(session, False, _NoRevising())
+    assert cache.update_gains(session, False) == []
+
+    bass = session.track_for_name("bass")
+    bass.fader.vol_dB -= 3
+    assert cache.update_gains(session, False) == ["other"]
+    assert cache.playspecs["other"][0].gain_l == bass.fader.left_gain_factor
+    assert cache.update(session, False, _NoRevising()) == []
+
+    # A muted track is silenced right away, and removed when rebuilding
+    session.track_for_name("drums_r").is_mute = True
+    assert cache.update_gains(session, False) == [""]
+    entry = cache.playspecs[""][1]
+    assert (entry.gain_l, entry.gain_r) == (0, 0)
+    assert cache.update(session, False, _NoRevising()) == [""]
+    assert len(cache.playspecs[""]) == 1
+
+
+def test_playspec_cache_metronome():
+    session = _session()
+    cache = PlayspecCache(lambda playspec: playspec)
+    cache.update(session, False, _NoRevising())
+    session.toggle_metronome()
+    assert cache.update(session, False, _NoRevising()) == ["", "other"]
+    assert [len(cache.playspecs[name]) for name in ["", "other"]] == [3, 2]
+
+    session.track_groups[1].timing = FixedBpmTiming(100)
+    assert cache.update(session, False, _NoRevising()) == ["other"]
+
+
+def test_playspec_cache_tempo_map_metronome():
+    session = _session()
+    session.track_groups[1].timing = _TempoMap()
+    session.toggle_metronome()
+    cache = PlayspecCache(lambda playspec: playspec)
+    cache.update(session, False, _NoRevising())
+    assert len(cache.playspecs["other"]) == 1
+
+    assert cache.update_metronome_window([(0, 5 * 48000)])
+    assert cache.update(session, False, _NoRevising()) == ["other"]
+    assert len(cache.playspecs["other"]) == 1 + 3
+    assert not cache.update_metronome_window([(0, 5 * 48000)])
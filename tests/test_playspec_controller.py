@@ -0,0 +1,72 @@
+from amio import Interface
+
+from manokee.input_recorder import InputRecorder
+from manokee.playspec_controller import PlayspecController
+from manokee.revising import Reviser
+from manokee.session import Session
+from manokee.session_holder import SessionHolder
+
+
+class _SlowInterface(Interface):
+    # Like amio's native interface, takes a new playspec only after
+    # the previous one has been applied, once per message cycle
+    def __init__(self):
+        super().__init__()
+        self._last_playspec_id = 0
+        self._unapplied_playspec_id = None
+        self.playspec = None
+
+    def get_frame_rate(self) -> float:
+        return 48000
+
+    def get_position(self) -> int:
+        return 0
+
+    def is_closed(self) -> bool:
+        return False
+
+    def _set_current_playspec(self, playspec, insert_at, start_from):
+        if self._unapplied_playspec_id is not None:
+            return None
+        self._last_playspec_id += 1
+        self._unapplied_playspec_id = self._last_playspec_id
+        self.playspec = playspec
+        return self._last_playspec_id
+
+    @property
+    def pending_playspec_count(self) -> int:
+        return len(self._pending_playspecs)
+
+    def run_message_cycle(self):
+        if self._unapplied_playspec_id is not None:
+            playspec_id = self._unapplied_playspec_id
+            self._unapplied_playspec_id = None
+            self._on_playspec_applied(playspec_id)
+        self._retry_setting_playspec_if_needed()
+
+
+def test_fader_sweep_is_coalesced():
+    amio_interface = _SlowInterface()
+    session_holder = SessionHolder()
+    reviser = Reviser(session_holder, InputRecorder(1, 1))
+    # Observers are weakly referenced, so the controller must be kept
+    controller = PlayspecController(amio_interface, session_holder, reviser)
+    session = Session(48000, "tests/assets/sessions/simple/session.mnk")
+    session.metronome_enabled = True
+    session_holder.session = session
+    amio_interface.run_message_cycle()
+
+    for _ in range(50):
+        session.metronome_vol_down()
+        assert amio_interface.pending_playspec_count <= 1
+    for _ in range(3):
+        amio_interface.run_message_cycle()
+    assert amio_interface.pending_playspec_count == 0
+    assert controller.active_track_group_name == ""
+    # The latest gains are played
+    metronome_entry = amio_interface.playspec[-1]
+    fader = session.metronome_fader
+    assert (metronome_entry.gain_l, metronome_entry.gain_r) == (
+        fader.left_gain_factor,
+        fader.right_gain_factor,
+    )
@@ -1,8 +1,17 @@
+import asyncio
+from datetime import datetime, timezone
 from pathlib import Path
+import shutil
 
+from amio import InputAudioChunk
+import numpy as np
 import pytest
+import soundfile as sf
 
+from manokee.decoding import DecodeEngine
+from manokee.input_recorder import InputFragment
 from manokee.session import Session
+from manokee.track import SegmentFile, Track, _write_segments
 
 
 def test_load_session():
@@ -35,3 +44,171 @@ def test_create_session():
     # TODO Make it possible to open a session without specifying frame rate
     session = Session(48000, "tests/assets/nonexistent.mnk")
     assert sum(1 for _ in session.tracks) == 0
+
+
+def _fragment(starting_frame, length, value):
+    fragment = InputFragment(0, True)
+    fragment.append_chunk(
+        InputAudioChunk(
+            np.full((length, 2), value, np.float32),
+            48000,
+            0,
+            starting_frame,
+            True,
+            datetime(2022, 1, 1, tzinfo=timezone.utc),
+        )
+    )
+    return fragment
+
+
+def _session_copy(tmp_path, drums_l_frames=48000, decode_engine=None):
+    session_dir = tmp_path / "session"
+    shutil.copytree("tests/assets/sessions/simple", session_dir)
+    sf.write(session_dir / "drums_l.flac", np.full(drums_l_frames, 0.25), 48000)
+    session = Session(48000, str(session_dir))
+    for track in session.tracks:
+        asyncio.run(track.load(decode_engine))
+    return session, session_dir
+
+
+def test_incremental_save(tmp_path):
+    session, session_dir = _session_copy(tmp_path)
+    track = session.track_for_name("drums_l")
+    track.commit_input_fragment_if_needed(_fragment(1000, 500, 0.5))
+    track.commit_input_fragment_if_needed(_fragment(1200, 500, 0.75))
+    assert track.dirty_ranges == [(1000, 1700)]
+    session.save(incremental=True)
+    assert not track.requires_audio_save
+    assert track.segment_files == [SegmentFile("drums_l.segment-1.flac", 1000)]
+    assert sf.info(str(session_dir / "drums_l.segment-1.flac")).frames == 700
+
+    reopened = Session(48000, str(session_dir))
+    for reopened_track in reopened.tracks:
+        asyncio.run(reopened_track.load())
+    reopened_track = reopened.track_for_name("drums_l")
+    audio = reopened_track.flatten().array[:, 0]
+    assert len(audio) == 48000
+    np.testing.assert_allclose(audio[:1000], 0.25, atol=1e-4)
+    np.testing.assert_allclose(audio[1000:1200], 0.5, atol=1e-4)
+    np.testing.assert_allclose(audio[1200:1700], 0.75, atol=1e-4)
+    np.testing.assert_allclose(audio[1700:], 0.25, atol=1e-4)
+
+    # A segment file removed in the meantime doesn't break consolidation
+    (session_dir / "drums_l.segment-1.flac").unlink()
+    reopened.save(incremental=False)
+    assert reopened_track.segment_files == []
+    assert not (session_dir / "drums_l.segment-1.flac").exists()
+    np.testing.assert_allclose(
+        sf.read(session_dir / "drums_l.flac")[0], audio, atol=1e-4
+    )
+
+
+def test_save_in_background(tmp_path):
+    session, session_dir = _session_copy(tmp_path)
+    track = session.track_for_name("drums_l")
+    track.commit_input_fragment_if_needed(_fragment(1000, 500, 0.5))
+
+    async def save():
+        saving = asyncio.ensure_future(session.save_in_background())
+        await asyncio.sleep(0)
+        assert session.is_saving
+        with pytest.raises(RuntimeError):
+            track.commit_input_fragment_if_needed(_fragment(0, 100, 0.5))
+        await saving
+
+    asyncio.run(save())
+    assert not session.is_saving
+    assert track.percent_saved is None
+    assert not track.requires_audio_save
+    audio = sf.read(session_dir / "drums_l.flac")[0]
+    np.testing.assert_allclose(audio[1000:1500], 0.5, atol=1e-4)
+    np.testing.assert_allclose(audio[1500:], 0.25, atol=1e-4)
+
+
+def test_full_save_of_paged_track(tmp_path, monkeypatch):
+    session, session_dir = _session_copy(
+        tmp_path, 48000 * 25, DecodeEngine(max_workers=1, page_secs=1)
+    )
+    track = session.track_for_name("drums_l")
+    assert track.pager is not None
+    track.commit_input_fragment_if_needed(_fragment(1000, 500, 0.5))
+
+    def whole_track_flatten():
+        raise AssertionError("A paged track must not be flattened as a whole")
+
+    monkeypatch.setattr(track, "flatten", whole_track_flatten)
+    asyncio.run(session.save_in_background())
+    assert track.segments[0].source is track.pager
+    audio = sf.read(session_dir / "drums_l.flac")[0]
+    assert len(audio) == 48000 * 25
+    np.testing.assert_allclose(audio[:1000], 0.25, atol=1e-4)
+    np.testing.assert_allclose(audio[1000:1500], 0.5, atol=1e-4)
+    np.testing.assert_allclose(audio[1500:], 0.25, atol=1e-4)
+
+
+def test_session_to_js_is_cached(monkeypatch):
+    session = Session(48000, "tests/assets/sessions/simple/session.mnk")
+    js = session.to_js()
+    with monkeypatch.context() as m:
+        # Unchanged tracks aren't even asked for their JSON representation
+        m.setattr(Track, "to_js", None)
+        assert session.to_js() is js
+
+    drums_l = session.track_for_name("drums_l")
+    drums_r = session.track_for_name("drums_r")
+    drums_r_js = drums_r.to_js()
+    drums_l.is_mute = True
+    assert session.to_js() is not js
+    assert session.to_js()["trackGroups"][0]["tracks"][0]["is_mute"]
+    assert drums_r.to_js() is drums_r_js
+
+    js = session.to_js()
+    drums_r.fader.vol_dB -= 3
+    assert session.to_js()["trackGroups"][0]["tracks"][1]["vol_dB"] == pytest.approx(-9)
+    js = session.to_js()
+    session.set_mark_at_beat("A", 8)
+    assert session.to_js()["marks"]["A"] != js["marks"].get("A")
+
+
+def test_interrupted_save_keeps_track_file(tmp_path, monkeypatch):
+    session, session_dir = _session_copy(tmp_path)
+    session.track_for_name("drums_l").commit_input_fragment_if_needed(
+        _fragment(1000, 500, 0.5)
+    )
+
+    def interrupted_write(clip, filename, progress_callback):
+        sf.write(filename, clip.array[:100], int(clip.frame_rate))
+        raise OSError("Disk full")
+
+    monkeypatch.setattr("manokee.track._write_soundfile", interrupted_write)
+    with pytest.raises(OSError):
+        asyncio.run(session.save_in_background())
+    np.testing.assert_allclose(
+        sf.read(session_dir / "drums_l.flac")[0], 0.25, atol=1e-4
+    )
+    assert not any(path.name.endswith(".saving.flac") for path in session_dir.iterdir())
+
+
+def test_failed_incremental_save_removes_segment_files(tmp_path, monkeypatch):
+    session, session_dir = _session_copy(tmp_path)
+    for track in session.tracks:
+        track.commit_input_fragment_if_needed(_fragment(1000, 500, 0.5))
+
+    def failing_write_segments(
+        segments, channels, frame_rate, start, end, filename, progress_callback
+    ):
+        if "drums_r" not in filename:
+            _write_segments(
+                segments, channels, frame_rate, start, end, filename, progress_callback
+            )
+            return
+        sf.write(filename, np.zeros(100), int(frame_rate))
+        raise OSError("Disk full")
+
+    monkeypatch.setattr("manokee.track._write_segments", failing_write_segments)
+    with pytest.raises(OSError):
+        asyncio.run(session.save_in_background(incremental=True))
+    assert not any(".segment-" in path.name for path in session_dir.iterdir())
+    for track in session.tracks:
+        assert track.segment_files == []
+        assert track.requires_audio_save
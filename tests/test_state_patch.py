@@ -0,0 +1,34 @@
+import jsonpatch
+
+from manokee.state_patch import make_patch
+
+
+def test_make_patch():
+    unchanged = {"name": "drums", "vol_dB": 0}
+    src = {
+        "a": 1,
+        "b": True,
+        "tracks": [unchanged, {"name": "bass/2", "vol_dB": 0}],
+        "marks": {"A": "1"},
+        "log": [[1, "x"]],
+    }
+    dst = {
+        "a": 2,
+        "b": 1,
+        "tracks": [unchanged, {"name": "bass/2", "vol_dB": -3}],
+        "marks": {"B": "2"},
+        "log": [[1, "x"], [2, "y"]],
+    }
+    patch = make_patch(src, dst)
+    assert patch.apply(src) == dst
+    assert {"op": "replace", "path": "/tracks/1/vol_dB", "value": -3} in patch
+    assert not any(op["path"].startswith("/tracks/0") for op in patch)
+    assert jsonpatch.JsonPatch.from_string(patch.to_string()).apply(src) == dst
+
+
+def test_make_patch_skips_identical_subtrees():
+    # The same object isn't compared, even to find the changes inside
+    shared = {"x": [1, 2]}
+    assert list(make_patch({"s": shared}, {"s": shared})) == []
+    assert list(make_patch({}, {})) == []
+    assert list(make_patch({"a": {"b": 1}}, {"a": {"b": 1}})) == []
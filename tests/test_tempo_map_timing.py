@@ -0,0 +1,66 @@
+from math import isclose
+
+import numpy as np
+import pytest
+
+from manokee.timing.fixed_bpm_timing import FixedBpmTiming
+from manokee.timing.tempo_map_timing import MeterChange, TempoMapTiming
+
+
+def test_tempo_map_timing():
+    timing = TempoMapTiming([1, 2, 2.5, 3.5])
+    assert timing.average_beat_length == 2.5 / 3
+
+    assert timing.beat_to_seconds(0) == 1
+    assert timing.beat_to_seconds(1.5) == 2.25
+    assert timing.beat_to_seconds(3) == 3.5
+    assert isclose(timing.beat_to_seconds(-1.2), 1 - 1.2 * 2.5 / 3)
+    assert isclose(timing.beat_to_seconds(4), 3.5 + 2.5 / 3)
+
+    # Going forward and backward, using the hint or not
+    for time, beat in [(1, 0), (2.25, 1.5), (2.5, 2), (3, 2.5), (1.5, 0.5)]:
+        assert timing.seconds_to_beat(time) == beat
+    assert isclose(timing.seconds_to_beat(1 - 1.2 * 2.5 / 3), -1.2)
+    assert isclose(timing.seconds_to_beat(3.5 + 2.5 / 3), 4)
+
+    beats = np.linspace(-3, 6, 91)
+    assert np.allclose(
+        timing.beat_to_seconds_array(beats),
+        [timing.beat_to_seconds(beat) for beat in beats],
+    )
+    assert np.allclose(
+        timing.seconds_to_beat_array(timing.beat_to_seconds_array(beats)), beats
+    )
+
+
+def test_tempo_map_timing_from_bpm():
+    timing = TempoMapTiming.from_bpm(120)
+    fixed = FixedBpmTiming(120)
+    for beat in [-3, 0, 0.5, 1, 100.25]:
+        assert isclose(timing.beat_to_seconds(beat), fixed.beat_to_seconds(beat))
+        assert isclose(timing.seconds_to_beat(beat), fixed.seconds_to_beat(beat))
+    assert TempoMapTiming.from_timing(fixed, 10).beat_to_seconds(7) == 3.5
+
+
+def test_tempo_map_timing_meter_changes():
+    timing = TempoMapTiming.from_bpm(
+        120, [MeterChange(0, 4), MeterChange(10, 3), MeterChange(16, 4)]
+    )
+    # The bar from beat 8 is cut short by the meter change
+    assert timing.bar_and_beat(9, 4) == (2, 1)
+    assert timing.bar_and_beat(10, 4) == (3, 0)
+    assert timing.bar_and_beat(15.5, 4) == (4, 2)
+    assert timing.bar_and_beat(17, 4) == (5, 1)
+    assert timing.bar_to_beat(3, 4) == 10
+    assert timing.bar_to_beat(5, 4) == 16
+    # Without meter changes, the given time signature is used
+    assert TempoMapTiming.from_bpm(120).bar_and_beat(9, 3) == (3, 0)
+
+
+def test_tempo_map_timing_validation():
+    with pytest.raises(ValueError):
+        TempoMapTiming([1])
+    with pytest.raises(ValueError):
+        TempoMapTiming([1, 2, 2])
+    with pytest.raises(ValueError):
+        TempoMapTiming([1, 2], [MeterChange(4, 3)])
@@ -0,0 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+from manokee.track_pager import TrackPager
+
+
+def test_only_requested_pages_are_resident(tmp_path):
+    frame_rate = 1000
+    data = np.random.default_rng(0).uniform(-0.5, 0.5, (10500, 2))
+    filename = str(tmp_path / "track.flac")
+    sf.write(filename, data, frame_rate)
+    decoded = sf.read(filename, dtype="float32")[0]
+
+    executor = ThreadPoolExecutor(2)
+    pager = TrackPager(filename, 1, executor)
+    assert len(pager) == 10500
+    assert pager.page_frames == 1000
+    assert pager.resident_pages() == []
+
+    pager.request([(1500, 3500), (9900, 12000)])
+    executor.shutdown(wait=True)
+    assert pager.take_changes()
+    assert not pager.take_changes()
+    pages = pager.resident_pages()
+    assert [position for position, _ in pages] == [1000, 2000, 3000, 9000, 10000]
+    for position, clip in pages:
+        np.testing.assert_array_equal(
+            clip.array, decoded[position : position + len(clip)]
+        )
+    assert len(pages[-1][1]) == 500
+
+    pager.request([(2000, 3000)])
+    assert pager.take_changes()
+    assert [position for position, _ in pager.resident_pages()] == [2000]
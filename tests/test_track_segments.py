@@ -0,0 +1,59 @@
+from amio import AudioClip
+import numpy as np
+
+from manokee.track_segments import Segment, flatten, overlay, playback_regions
+
+
+def _clip(value, length):
+    return AudioClip(np.full((length, 1), value, np.float32), 48000)
+
+
+def test_overlay_splits_covered_segment():
+    base = _clip(0.1, 100)
+    take = _clip(0.5, 20)
+    segments = overlay([Segment(0, base, 0, 100)], Segment(30, take, 0, 20))
+    assert segments == [
+        Segment(0, base, 0, 30),
+        Segment(30, take, 0, 20),
+        Segment(50, base, 50, 50),
+    ]
+
+
+def test_overlay_trims_and_removes_segments():
+    base = _clip(0.1, 100)
+    first = _clip(0.2, 20)
+    second = _clip(0.3, 20)
+    segments = [Segment(0, base, 0, 100)]
+    segments = overlay(segments, Segment(10, first, 0, 20))
+    segments = overlay(segments, Segment(40, second, 0, 20))
+    whole = _clip(0.4, 60)
+    segments = overlay(segments, Segment(5, whole, 5, 55))
+    assert segments == [
+        Segment(0, base, 0, 5),
+        Segment(5, whole, 5, 55),
+        Segment(60, base, 60, 40),
+    ]
+
+
+def test_overlay_past_the_end():
+    base = _clip(0.1, 100)
+    take = _clip(0.5, 20)
+    segments = overlay([Segment(0, base, 0, 100)], Segment(120, take, 0, 20))
+    assert segments == [Segment(0, base, 0, 100), Segment(120, take, 0, 20)]
+
+    flattened = flatten(segments, 1, 48000)
+    assert len(flattened) == 140
+    assert np.all(flattened.array[:100] == np.float32(0.1))
+    assert np.all(flattened.array[100:120] == 0)
+    assert np.all(flattened.array[120:] == np.float32(0.5))
+
+
+def test_playback_regions():
+    base = _clip(0.1, 100)
+    take = _clip(0.5, 20)
+    segments = overlay([Segment(0, base, 0, 100)], Segment(30, take, 0, 20))
+    assert [tuple(region)[1:] for region in playback_regions(segments)] == [
+        (0, 30, 0),
+        (0, 20, 30),
+        (50, 100, 50),
+    ]